@@ -1,21 +1,34 @@
 from __future__ import annotations
 
+import gzip
 import logging
 import os
 import time
 
 import modules
-from fastapi import APIRouter, Request
+from fastapi import APIRouter, Depends, HTTPException, Request
 from fastapi.responses import StreamingResponse
 from modules import shared
 from modules.call_queue import wrap_gradio_gpu_call
 from PIL import Image, ImageOps
 from starlette.concurrency import iterate_in_threadpool
 
+from . import (
+    cond_cache,
+    eta,
+    events,
+    health,
+    jobs,
+    progress,
+    tile_store,
+    tiling,
+    warm_pool,
+)
 from .config import LOGGER_NAME, NAME_SCRIPT_LOOPBACK, NAME_SCRIPT_UPSCALE
 from .script_hack import get_script_info, get_scripts_metadata, process_script_args
 from .structs import (
     ConfigResponse,
+    EventControlRequest,
     ImageResponse,
     Img2ImgRequest,
     Txt2ImgRequest,
@@ -23,6 +36,7 @@ from .structs import (
     UpscaleResponse,
 )
 from .utils import (
+    apply_draft,
     b64_to_img,
     bytewise_xor,
     get_encrypt_key,
@@ -40,6 +54,9 @@ from .utils import (
 
 router = APIRouter()
 
+REQUEST_ENCODINGS = {"gzip"}
+"""Content-Encodings of request bodies accepted by `app_decompression_middleware`."""
+
 log = logging.getLogger(LOGGER_NAME)
 
 # NOTE: how to run a script
@@ -79,8 +96,12 @@ async def get_state():
     Returns:
         Dict: information.
     """
-    opt = load_config().plugin
+    cfg = load_config()
+    opt = cfg.plugin
     prepare_backend(opt)
+    warm_pool.configure(cfg.warm_pool)
+    cond_cache.configure(cfg.cond_cache)
+    tile_store.configure(cfg.tile_sync)
 
     sample_path = os.path.abspath(opt.sample_path)
     return {
@@ -95,16 +116,21 @@ async def get_state():
         "scripts_img2img": get_scripts_metadata(True),
         "face_restorers": [model.name() for model in shared.face_restorers],
         "sd_models": modules.sd_models.checkpoint_tiles(),  # yes internal API has spelling error
-        "sd_vaes": ["None", "Automatic" ] + (list(modules.sd_vae.vae_dict))
+        "sd_vaes": ["None", "Automatic" ] + (list(modules.sd_vae.vae_dict)),
+        "warm_pool": warm_pool.status(),
+        "cond_cache": cond_cache.status(),
+        "tile_sync": tile_store.status(),
+        "encodings": list(REQUEST_ENCODINGS),
     }
 
 
 @router.post("/txt2img", response_model=ImageResponse)
-def f_txt2img(req: Txt2ImgRequest):
+def f_txt2img(req: Txt2ImgRequest, job: jobs.Job = Depends(jobs.tracked)):
     """Post request for Txt2Img.
 
     Args:
         req (Txt2ImgRequest): Request.
+        job (jobs.Job): Job of the request, used to cancel it.
 
     Returns:
         Dict: Outputs and info.
@@ -125,8 +151,11 @@ def f_txt2img(req: Txt2ImgRequest):
         req.orig_height,
         req.disable_sddebz_highres,
     )
+    width, height = apply_draft(req, width, height)
+    job.plan(eta.describe("txt2img", req, width, height, hires=req.highres_fix))
 
-    output = wrap_gradio_gpu_call(modules.txt2img.txt2img)(
+    txt2img = job.guard(cond_cache.using(modules.txt2img.txt2img))
+    output = wrap_gradio_gpu_call(txt2img)(
         "",  # id_task (used by wrap_gradio_gpu_call for some sort of job id system)
         parse_prompt(req.prompt),  # prompt
         parse_prompt(req.negative_prompt),  # negative_prompt
@@ -167,7 +196,11 @@ def f_txt2img(req: Txt2ImgRequest):
         if not req.include_grid and len(images) > 1 and script_ind == 0:
             images = images[1:]
 
-    if not script or (width == images[0].width and height == images[0].height):
+    # drafts may be wanted as is, e.g. as thumbnails
+    keep_size = req.draft and req.draft_keep_size
+    if not keep_size and (
+        not script or (width == images[0].width and height == images[0].height)
+    ):
         log.info(
             f"img size: {images[0].width}x{images[0].height}, target: {req.orig_width}x{req.orig_height}"
         )
@@ -192,11 +225,12 @@ def f_txt2img(req: Txt2ImgRequest):
 
 
 @router.post("/img2img", response_model=ImageResponse)
-def f_img2img(req: Img2ImgRequest):
+def f_img2img(req: Img2ImgRequest, job: jobs.Job = Depends(jobs.tracked)):
     """Post request for Img2Img.
 
     Args:
         req (Img2ImgRequest): Request.
+        job (jobs.Job): Job of the request, used to cancel it.
 
     Returns:
         Dict: Outputs and info.
@@ -210,16 +244,25 @@ def f_img2img(req: Img2ImgRequest):
     script_ind, script, meta = get_script_info(req.script, True)
     args = process_script_args(script_ind, script, meta, req.script_args)
 
-    image = b64_to_img(req.src_img)
+    image = tile_store.decode(req.src_img)
     mask = (
-        prepare_mask(b64_to_img(req.mask_img))
+        prepare_mask(tile_store.decode(req.mask_img))
         if req.is_inpaint and req.mask_img is not None
         else None
     )
 
     orig_width, orig_height = image.size
+    # drafts are fast because they are small, so they are never tiled
+    tiled = (
+        script_ind == 0
+        and not req.draft
+        and tiling.needs_tiling(req, orig_width, orig_height)
+    )
 
-    if script and script.title() == NAME_SCRIPT_UPSCALE:
+    if tiled:
+        # tiles are rendered at base_size, the image itself stays at original size
+        width, height = orig_width, orig_height
+    elif script and script.title() == NAME_SCRIPT_UPSCALE:
         # in SD upscale mode, width & height determines tile size
         width = height = req.base_size
     else:
@@ -230,6 +273,10 @@ def f_img2img(req: Img2ImgRequest):
             orig_height,
             req.disable_sddebz_highres,
         )
+    if not tiled:
+        width, height = apply_draft(req, width, height)
+    kind = "inpaint" if req.is_inpaint else "img2img"
+    job.plan(eta.describe(kind, req, width, height, denoise=True))
 
     # NOTE:
     # - image & mask repeated due to Gradio API have separate tabs for each mode...
@@ -239,53 +286,58 @@ def f_img2img(req: Img2ImgRequest):
     # - new color sketch functionality in webUI is irrelevant so None is used for their options.
     # - the internal code for img2img is confusing and duplicative...
 
-    output = wrap_gradio_gpu_call(modules.img2img.img2img)(
-        "",  # id_task (used by wrap_gradio_gpu_call for some sort of job id system)
-        4
-        if req.is_inpaint
-        else 0,  # mode (we use 0 (img2img with init_img) & 4 (inpaint uploaded mask))
-        parse_prompt(req.prompt),  # prompt
-        parse_prompt(req.negative_prompt),  # negative_prompt
-        "None",  # prompt_styles: saved prompt styles (unsupported)
-        image,  # init_img
-        None,  # sketch (unused by us)
-        None,  # init_img_with_mask (unused by us)
-        None,  # inpaint_color_sketch (unused by us)
-        None,  # inpaint_color_sketch_orig (unused by us)
-        image,  # init_img_inpaint
-        mask,  # init_mask_inpaint
-        req.steps,  # steps
-        get_sampler_index(req.sampler_name),  # sampler_index
-        0,  # req.mask_blur,  # mask_blur
-        None,  # mask_alpha (unused by us) # only used by webUI color sketch if init_img_with_mask isn't dict
-        req.inpainting_fill,  # inpainting_fill
-        req.restore_faces,  # restore_faces
-        req.tiling,  # tiling
-        req.batch_count,  # n_iter
-        req.batch_size,  # batch_size
-        req.cfg_scale,  # cfg_scale
-        0, # img_cfg_scale (unsupported)
-        req.denoising_strength,  # denoising_strength
-        req.seed,  # seed
-        req.subseed,  # subseed
-        req.subseed_strength,  # subseed_strength
-        req.seed_resize_from_h,  # seed_resize_from_h
-        req.seed_resize_from_w,  # seed_resize_from_w
-        req.seed_enable_extras,  # seed_enable_extras
-        1,  # selected_scale_tab
-        height,  # height
-        width,  # width
-        1.0,  # scale_by
-        req.resize_mode,  # resize_mode
-        False,  # req.inpaint_full_res,  # inpaint_full_res
-        0,  # req.inpaint_full_res_padding,  # inpaint_full_res_padding
-        req.invert_mask,  # inpainting_mask_invert
-        "",  # img2img_batch_input_dir (unspported)
-        "",  # img2img_batch_output_dir (unsupported)
-        "",  # img2img_batch_inpaint_mask_dir (unsupported)
-        [],  # override_settings_texts (unsupported)
-        *args,
-    )
+    if tiled:
+        tiled_img2img = job.guard(cond_cache.using(tiling.tiled_img2img))
+        output = wrap_gradio_gpu_call(tiled_img2img)(req, image)
+    else:
+        img2img = job.guard(cond_cache.using(modules.img2img.img2img))
+        output = wrap_gradio_gpu_call(img2img)(
+            "",  # id_task (used by wrap_gradio_gpu_call for some sort of job id system)
+            4
+            if req.is_inpaint
+            else 0,  # mode (we use 0 (img2img with init_img) & 4 (inpaint uploaded mask))
+            parse_prompt(req.prompt),  # prompt
+            parse_prompt(req.negative_prompt),  # negative_prompt
+            "None",  # prompt_styles: saved prompt styles (unsupported)
+            image,  # init_img
+            None,  # sketch (unused by us)
+            None,  # init_img_with_mask (unused by us)
+            None,  # inpaint_color_sketch (unused by us)
+            None,  # inpaint_color_sketch_orig (unused by us)
+            image,  # init_img_inpaint
+            mask,  # init_mask_inpaint
+            req.steps,  # steps
+            get_sampler_index(req.sampler_name),  # sampler_index
+            0,  # req.mask_blur,  # mask_blur
+            None,  # mask_alpha (unused by us) # only used by webUI color sketch if init_img_with_mask isn't dict
+            req.inpainting_fill,  # inpainting_fill
+            req.restore_faces,  # restore_faces
+            req.tiling,  # tiling
+            req.batch_count,  # n_iter
+            req.batch_size,  # batch_size
+            req.cfg_scale,  # cfg_scale
+            0, # img_cfg_scale (unsupported)
+            req.denoising_strength,  # denoising_strength
+            req.seed,  # seed
+            req.subseed,  # subseed
+            req.subseed_strength,  # subseed_strength
+            req.seed_resize_from_h,  # seed_resize_from_h
+            req.seed_resize_from_w,  # seed_resize_from_w
+            req.seed_enable_extras,  # seed_enable_extras
+            1,  # selected_scale_tab
+            height,  # height
+            width,  # width
+            1.0,  # scale_by
+            req.resize_mode,  # resize_mode
+            False,  # req.inpaint_full_res,  # inpaint_full_res
+            0,  # req.inpaint_full_res_padding,  # inpaint_full_res_padding
+            req.invert_mask,  # inpainting_mask_invert
+            "",  # img2img_batch_input_dir (unspported)
+            "",  # img2img_batch_output_dir (unsupported)
+            "",  # img2img_batch_inpaint_mask_dir (unsupported)
+            [],  # override_settings_texts (unsupported)
+            *args,
+        )
     images = output[0]
     info = output[1]
 
@@ -293,7 +345,7 @@ def f_img2img(req: Img2ImgRequest):
         log.warning("Interrupted!")
         return {"outputs": [], "info": info}
 
-    if shared.opts.return_grid:
+    if shared.opts.return_grid and not tiled:
         if not req.include_grid and len(images) > 1 and script_ind == 0:
             images = images[1:]
         # This is a workaround.
@@ -303,7 +355,11 @@ def f_img2img(req: Img2ImgRequest):
     # NOTE: this is a dumb assumption:
     # if size of image is different from size given to pipeline (after sbbedz fix)
     # then it must be intentional (i.e. SD Upscale/outpaint) so dont scale back
-    if not script or (width == images[0].width and height == images[0].height):
+    # drafts may be wanted as is, e.g. as thumbnails (the mask is at original size)
+    keep_size = req.draft and req.draft_keep_size and not req.is_inpaint
+    if not keep_size and (
+        not script or (width == images[0].width and height == images[0].height)
+    ):
         log.info(
             f"img Size: {images[0].width}x{images[0].height}, target: {orig_width}x{orig_height}"
         )
@@ -338,11 +394,12 @@ def f_img2img(req: Img2ImgRequest):
 
 
 @router.post("/upscale", response_model=UpscaleResponse)
-def f_upscale(req: UpscaleRequest):
+def f_upscale(req: UpscaleRequest, job: jobs.Job = Depends(jobs.tracked)):
     """Post request for upscaling.
 
     Args:
         req (UpscaleRequest): Request.
+        job (jobs.Job): Job of the request, used to cancel it.
 
     Returns:
         Dict: Output.
@@ -363,10 +420,20 @@ def f_upscale(req: UpscaleRequest):
         log.info(f"No upscaler selected, will do nothing")
         return
 
-    if req.downscale_first:
-        image = modules.images.resize_image(0, image, orig_width // 2, orig_height // 2)
+    def upscale(image):
+        if req.downscale_first:
+            image = modules.images.resize_image(
+                0, image, orig_width // 2, orig_height // 2
+            )
+        image = upscaler.scaler.upscale(image, upscaler.scale, upscaler.data_path)
+        return [image], "", ""
+
+    output = wrap_gradio_gpu_call(job.guard(upscale))(image)
+    if output[0] is None or len(output[0]) < 1:
+        log.warning("Interrupted!")
+        return {"output": None}
+    image = output[0][0]
 
-    image = upscaler.scaler.upscale(image, upscaler.scale, upscaler.data_path)
     if req.save_samples:
         output_path = save_img(
             image, opt.sample_path, filename=f"{int(time.time())}.png"
@@ -379,6 +446,97 @@ def f_upscale(req: UpscaleRequest):
     return {"output": output}
 
 
+@router.get("/health")
+def get_health():
+    """Cheap check of whether the backend is up & whether `/config` changed.
+
+    Returns:
+        Dict: API version, uptime, queue depth, loaded model & config revision.
+    """
+    return health.get_health()
+
+
+@router.get("/progress")
+def get_progress(
+    preview: bool = False, max_size: int = 0, format: str = "jpeg", last_id: str = None
+):
+    """Lightweight alternative to the webUI's `/sdapi/v1/progress`.
+
+    Progress is always returned, while the live preview is only included if requested
+    and it changed since the one the client has.
+
+    Args:
+        preview (bool, optional): Whether to include live preview. Defaults to False.
+        max_size (int, optional): Max width/height of preview, 0 for original size. Defaults to 0.
+        format (str, optional): "jpeg", "webp" or "png". Defaults to "jpeg".
+        last_id (str, optional): Id of preview the client already has. Defaults to None.
+
+    Returns:
+        Dict: Progress & preview (or None).
+    """
+    res = progress.get_progress()
+    res["preview"] = None
+    if preview:
+        res["preview"] = progress.get_preview(last_id, max_size, format)
+    return res
+
+
+@router.get("/events")
+async def get_events(
+    req: Request, preview: bool = False, max_size: int = 0, format: str = "jpeg"
+):
+    """Subscribe to progress (and live preview) pushed as server-sent events.
+
+    Events are `hello` (subscription id), `progress` (sent when it changes) and
+    `preview` (sent when a new live preview is available, if enabled). If the request
+    has the `X-Encrypted-Body` header, each event's data is XOR-encrypted & base64-encoded.
+
+    Args:
+        preview (bool, optional): Whether to push live preview. Defaults to False.
+        max_size (int, optional): Max width/height of preview, 0 for original size. Defaults to 0.
+        format (str, optional): "jpeg", "webp" or "png". Defaults to "jpeg".
+
+    Returns:
+        StreamingResponse: Event stream.
+    """
+    key = None
+    if "X-Encrypted-Body" in req.headers:
+        key = get_encrypt_key()
+        assert key is not None, "Unable to encrypt events without key."
+    sub = events.subscribe(preview, key, max_size, format)
+    return StreamingResponse(
+        events.stream(sub),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache"},
+    )
+
+
+@router.post("/events/{sub_id}")
+async def post_event_control(sub_id: str, req: EventControlRequest):
+    """Control message from an event subscriber, see `EventControlRequest`."""
+    sub = events.subscriptions.get(sub_id, None)
+    if sub is None:
+        raise HTTPException(404, "Subscription not found.")
+    try:
+        events.control(sub, req.action, req.enabled)
+    except ValueError as e:
+        raise HTTPException(400, str(e))
+    return {}
+
+
+@router.post("/cancel/{job_id}")
+def post_cancel(job_id: str):
+    """Cancel a job without interrupting anyone else's, see `jobs.cancel()`.
+
+    Args:
+        job_id (str): Id the client sent in the `X-Job-Id` header.
+
+    Returns:
+        Dict: State the job was in when cancelled.
+    """
+    return {"state": jobs.cancel(job_id)}
+
+
 async def app_encryption_middleware(req: Request, call_next):
     """Used to decrypt/encrypt HTTP request body."""
     is_encrypted = "X-Encrypted-Body" in req.headers
@@ -396,8 +554,36 @@ async def app_encryption_middleware(req: Request, call_next):
         req = Request(req.scope, receive, req._send)
 
     res: StreamingResponse = await call_next(req)
-    if is_encrypted:
+    # event streams never end & encrypt each event themselves
+    is_stream = res.headers.get("content-type", "").startswith("text/event-stream")
+    if is_encrypted and not is_stream:
         res.headers["X-Encrypted-Body"] = req.headers["X-Encrypted-Body"]
-        body = [bytewise_xor(chunk, key) async for chunk in res.body_iterator]
-        res.body_iterator = iterate_in_threadpool(iter(body))
+        # body may be (gzip) compressed in multiple chunks, encrypt it as a whole
+        body = b"".join([chunk async for chunk in res.body_iterator])
+        res.body_iterator = iterate_in_threadpool(iter([bytewise_xor(body, key)]))
     return res
+
+
+async def app_decompression_middleware(req: Request, call_next):
+    """Used to decompress HTTP request body.
+
+    Must be added before `app_encryption_middleware` so it runs after decryption,
+    as the plugin compresses before encrypting.
+    """
+    encoding = req.headers.get("Content-Encoding", None)
+    if encoding is not None and encoding in REQUEST_ENCODINGS:
+        body = gzip.decompress(await req.body())
+        headers = [
+            (k, v)
+            for k, v in req.scope["headers"]
+            if k not in {b"content-encoding", b"content-length"}
+        ]
+        headers.append((b"content-length", str(len(body)).encode("latin-1")))
+        scope = dict(req.scope, headers=headers)
+
+        async def receive():
+            return dict(type="http.request", body=body, more_body=False)
+
+        req = Request(scope, receive, req._send)
+
+    return await call_next(req)
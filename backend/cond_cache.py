@@ -0,0 +1,262 @@
+"""
+Keep recently encoded prompts so re-running with the same prompt & negative prompt
+(e.g. only varying seed, denoise or selection) doesn't re-encode them.
+
+This works by wrapping the function the webUI uses to encode prompts into text
+conditioning (`prompt_parser.get_learned_conditioning`), per prompt. The webUI's
+`get_multicond_learned_conditioning` (used for the prompt, split on AND) calls it
+too, so both the prompt & negative prompt are cached by the one wrapper. Like
+`warm_pool`, the wrapper only serves from the cache while `active()` is in effect,
+i.e. while generating for our API.
+
+Entries are keyed by model, CLIP skip, emphasis settings, steps (the prompt
+editing schedule depends on them), active extra networks & prompt. The cache is
+cleared when the model changes, as the entries of the previous model would only
+take up VRAM.
+
+Extra networks (e.g. `<lora:name:0.8>`) are stripped from the prompt before it is
+encoded, yet LoRA & co. change what the text encoder outputs. So
+`extra_networks.activate()` is wrapped too, to record which networks (& weights)
+are active when prompts are encoded.
+"""
+
+from __future__ import annotations
+
+import logging
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from functools import wraps
+
+import modules
+from modules import shared
+
+from .config import LOGGER_NAME, CondCacheOptions
+
+log = logging.getLogger(LOGGER_NAME)
+
+_local = threading.local()
+
+
+def cond_size(schedules: list):
+    """Size of tensors in a prompt's conditioning schedule in bytes."""
+    size = 0
+    for entry in schedules:
+        cond = getattr(entry, "cond", None)
+        # SD2 & co. may use a dict of tensors
+        tensors = cond.values() if isinstance(cond, dict) else [cond]
+        size += sum(
+            t.numel() * t.element_size() for t in tensors if hasattr(t, "numel")
+        )
+    return size
+
+
+def networks_key(extra_network_data: dict):
+    """Hashable form of the extra networks & their args, as passed to `activate()`."""
+    return tuple(
+        sorted(
+            (name, tuple(tuple(map(str, getattr(p, "items", [p]))) for p in params))
+            for name, params in (extra_network_data or {}).items()
+        )
+    )
+
+
+def model_key(model):
+    """Identifies the weights of the model, which change in place when switching."""
+    info = getattr(model, "sd_checkpoint_info", None)
+    return (
+        getattr(model, "sd_model_hash", None),
+        getattr(info, "filename", None),
+        id(model),
+    )
+
+
+class CondCache:
+    def __init__(self):
+        """LRU of prompt conditioning, bounded by count & memory."""
+        self.lock = threading.Lock()
+        self.entries: OrderedDict = OrderedDict()
+        """Maps key to (conditioning schedule, size in bytes)."""
+        self.total_bytes = 0
+        self.model = None
+        """Key of the model the entries belong to, see `model_key()`."""
+        self.max_items = 0
+        self.max_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.encode_seconds = 0.0
+        """Time spent encoding prompts that missed."""
+
+    def configure(self, max_items: int, max_bytes: int):
+        with self.lock:
+            self.max_items = max_items
+            self.max_bytes = max_bytes
+            self._evict()
+
+    def _evict(self):
+        while len(self.entries) > 0 and (
+            len(self.entries) > self.max_items or self.total_bytes > self.max_bytes
+        ):
+            _, (_, size) = self.entries.popitem(last=False)
+            self.total_bytes -= size
+
+    def get(self, model, prompts: list, schedule: tuple, encode):
+        """Get conditioning of each prompt from cache, encoding those missing.
+
+        Args:
+            model (LatentDiffusion): Model the prompts are encoded with.
+            prompts (List[str]): Prompts.
+            schedule (tuple): Sampling steps & other args the prompt editing schedule depends on.
+            encode (Callable[[List[str]], list]): Encodes prompts, i.e. the original `get_learned_conditioning`.
+
+        Returns:
+            list: Conditioning schedule of each prompt, same as `encode(prompts)`.
+        """
+        key_model = model_key(model)
+        # settings that change how prompts are encoded
+        settings = (
+            shared.opts.CLIP_stop_at_last_layers,
+            getattr(shared.opts, "enable_emphasis", None),
+            getattr(shared.opts, "use_old_emphasis_implementation", None),
+            getattr(shared.opts, "comma_padding_backtrack", None),
+            # see `install()`
+            getattr(_local, "networks", ()),
+        )
+        keys = [(settings, schedule, prompt) for prompt in prompts]
+
+        found = {}
+        with self.lock:
+            if key_model != self.model:
+                if self.model is not None:
+                    log.info("Conditioning cache: model changed, cleared")
+                self.entries.clear()
+                self.total_bytes = 0
+                self.model = key_model
+            for key in keys:
+                if key in self.entries:
+                    self.entries.move_to_end(key)
+                    found[key] = self.entries[key][0]
+            # batches repeat the same prompt, count each prompt once
+            self.hits += len(found)
+            missing = list(OrderedDict.fromkeys(k for k in keys if k not in found))
+            self.misses += len(missing)
+
+        if len(missing) > 0:
+            start = time.time()
+            encoded = encode([prompt for _, _, prompt in missing])
+            elapsed = time.time() - start
+            with self.lock:
+                self.encode_seconds += elapsed
+                for key, schedules in zip(missing, encoded):
+                    found[key] = schedules
+                    self._put(key_model, key, schedules)
+
+        return [found[key] for key in keys]
+
+    def _put(self, key_model: tuple, key: tuple, schedules: list):
+        if self.max_items < 1 or key_model != self.model:
+            return
+        size = cond_size(schedules)
+        if size > self.max_bytes:
+            return
+        if key in self.entries:
+            self.total_bytes -= self.entries.pop(key)[1]
+        self.entries[key] = (schedules, size)
+        self.total_bytes += size
+        self._evict()
+
+    def status(self):
+        with self.lock:
+            total = self.hits + self.misses
+            # rough estimate, assuming hits would have taken as long as misses
+            per_prompt = self.encode_seconds / self.misses if self.misses else 0.0
+            return {
+                "entries": len(self.entries),
+                "size_mb": self.total_bytes / 2**20,
+                "max_items": self.max_items,
+                "max_mb": self.max_bytes / 2**20,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / total if total else None,
+                "seconds_saved": per_prompt * self.hits,
+            }
+
+
+cache = CondCache()
+
+
+@contextmanager
+def active(enabled: bool = True):
+    """Serve conditioning from the cache within this context (current thread only)."""
+    prev = getattr(_local, "active", False)
+    _local.active = enabled
+    # extra networks are activated per generation, don't carry over earlier ones
+    _local.networks = ()
+    try:
+        yield
+    finally:
+        _local.active = prev
+
+
+def using(func):
+    """Wrap function passed to `wrap_gradio_gpu_call()` to run it within `active()`."""
+
+    @wraps(func)
+    def f(*args, **kwargs):
+        with active():
+            return func(*args, **kwargs)
+
+    return f
+
+
+def install_networks():
+    """Record active extra networks in `_local.networks`, see `networks_key()`."""
+    try:
+        from modules import extra_networks
+    except ImportError:
+        # webUI predates extra networks
+        return
+    activate = extra_networks.activate
+    if hasattr(activate, "_cond_cache_orig"):
+        return
+
+    def wrapped_activate(p, extra_network_data, *args, **kwargs):
+        _local.networks = networks_key(extra_network_data)
+        return activate(p, extra_network_data, *args, **kwargs)
+
+    wrapped_activate._cond_cache_orig = activate
+    extra_networks.activate = wrapped_activate
+
+
+def install():
+    """Wrap the webUI's prompt encoding function. Safe to call multiple times."""
+    install_networks()
+    get_learned_conditioning = modules.prompt_parser.get_learned_conditioning
+    if hasattr(get_learned_conditioning, "_cond_cache_orig"):
+        return
+
+    def wrapped_get_learned_conditioning(model, prompts, steps, *args, **kwargs):
+        encode = lambda p: get_learned_conditioning(model, p, steps, *args, **kwargs)
+        if not getattr(_local, "active", False) or cache.max_items < 1:
+            return encode(prompts)
+        # newer webUI versions take extra args (e.g. hires steps) for the schedule
+        schedule = (steps, args, tuple(sorted(kwargs.items())))
+        return cache.get(model, prompts, schedule, encode)
+
+    wrapped_get_learned_conditioning._cond_cache_orig = get_learned_conditioning
+    modules.prompt_parser.get_learned_conditioning = wrapped_get_learned_conditioning
+
+
+def configure(opts: CondCacheOptions):
+    cache.configure(opts.max_prompts, opts.max_memory_mb * 2**20)
+
+
+def start(opts: CondCacheOptions):
+    """Install & configure cache."""
+    install()
+    configure(opts)
+
+
+def status():
+    return cache.status()
@@ -1,6 +1,6 @@
 from __future__ import annotations
 
-from typing import Any
+from typing import Any, List
 
 from pydantic import BaseModel, Field
 
@@ -10,6 +10,8 @@ ROUTE_PREFIX = "/sdapi/interpause"
 CONFIG_PATH = "auto-sd-paint-ext-backend.yaml"
 LOGGER_NAME = "auto-sd-paint-ext"
 ENCRYPT_FILE = "xor_pass.txt"
+API_VERSION = 1
+"""Bumped when the API changes in a way the plugin needs to know about."""
 
 # names of scripts to apply workarounds for
 NAME_SCRIPT_LOOPBACK = "Loopback"
@@ -69,6 +71,15 @@ class GenerationOptions(BaseModel):
     batch_size: int = 1
     """Number of images per batch to render."""
 
+    draft: bool = False
+    """Render a fast draft instead, at a fraction of the steps & resolution. The plugin queues the full render with the same seed right after."""
+    draft_steps_ratio: float = 0.3
+    """Fraction of steps a draft is rendered with."""
+    draft_size_ratio: float = 0.5
+    """Fraction of the resolution a draft is rendered at. Lower resolutions change the composition more compared to the full render."""
+    draft_keep_size: bool = False
+    """Return drafts at the resolution they were rendered at (e.g. as thumbnails to pick from), instead of scaling them to the requested size."""
+
     base_size: int = 512
     """Native/base resolution of model used."""
     max_size: int = 768
@@ -140,6 +151,12 @@ class Img2ImgOptions(
 
     color_correct: bool = True
     """Apply color correction after img2img/inpaint to match original & blend better."""
+    tiled: bool = False
+    """Render images larger than max_size as overlapping tiles at base_size, instead of at a lower resolution that is upscaled back. Not used for inpainting or with scripts."""
+    tile_overlap: int = 64
+    """Pixels adjacent tiles overlap by; seams are blended across the overlap."""
+    tile_batch_size: int = 1
+    """Number of tiles rendered at once in tiled mode. Higher is faster but uses more VRAM."""
     do_exact_steps: bool = True
     """Do exactly the number of steps specified by the slider instead of less during img2img/inpaint."""
 
@@ -155,8 +172,36 @@ class PluginOptions(BaseOptions):
     sample_path: str = "outputs/krita-in"
 
 
+class WarmPoolOptions(BaseModel):
+    max_models: int = 0
+    """Max number of checkpoints kept in RAM for fast switching. 0 disables it."""
+    max_vaes: int = 0
+    """Max number of VAEs kept in RAM for fast switching. 0 disables it."""
+    max_memory_mb: int = 16384
+    """RAM budget (MB) of checkpoints (and separately VAEs) kept in RAM."""
+    prewarm_models: List[str] = Field(default_factory=list)
+    """Checkpoints to read into RAM at startup."""
+    prewarm_vaes: List[str] = Field(default_factory=list)
+    """VAEs to read into RAM at startup."""
+
+
+class CondCacheOptions(BaseModel):
+    max_prompts: int = 256
+    """Max number of encoded prompts kept for reuse across requests. 0 disables it."""
+    max_memory_mb: int = 512
+    """VRAM budget (MB) of encoded prompts kept."""
+
+
+class TileSyncOptions(BaseModel):
+    max_memory_mb: int = 512
+    """RAM budget (MB) of tiles kept so clients only upload tiles that changed. 0 disables it."""
+
+
 class MainConfig(BaseModel):
     txt2img: Txt2ImgOptions = Txt2ImgOptions()
     img2img: Img2ImgOptions = Img2ImgOptions()
     upscale: UpscaleOptions = UpscaleOptions()
     plugin: PluginOptions = PluginOptions()
+    warm_pool: WarmPoolOptions = WarmPoolOptions()
+    cond_cache: CondCacheOptions = CondCacheOptions()
+    tile_sync: TileSyncOptions = TileSyncOptions()
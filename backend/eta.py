@@ -0,0 +1,96 @@
+"""
+Predicts how long jobs take from how long similar jobs took, so the plugin can show
+when queued jobs start & finish. The webUI's own ETA only covers the running job
+and is off whenever `job_count` changes mid-job (e.g. hires fix, tiles).
+
+Jobs are grouped by configuration (kind, model, sampler, resolution, batch size,
+hires fix). Per configuration, the seconds per sampling step are tracked as an
+exponential moving average. Configurations not seen yet fall back to a global rate
+scaled by the number of pixels rendered.
+"""
+
+from __future__ import annotations
+
+import threading
+from collections import OrderedDict
+from math import ceil
+from typing import Optional, Tuple
+
+EMA_WEIGHT = 0.3
+"""Weight of the newest sample in the moving averages."""
+MAX_CONFIGS = 256
+"""Configurations tracked; least recently used ones are forgotten."""
+PRIOR_RATE = 0.4
+"""Seconds per step per megapixel assumed before any job finished."""
+
+_lock = threading.Lock()
+_rates: OrderedDict[tuple, float] = OrderedDict()
+"""Maps configuration to seconds per step."""
+_global_rate = PRIOR_RATE
+"""Seconds per step per megapixel, over all configurations."""
+
+
+def ema(old: Optional[float], new: float):
+    return new if old is None else old + EMA_WEIGHT * (new - old)
+
+
+def describe(
+    kind: str,
+    req,
+    width: int,
+    height: int,
+    hires: bool = False,
+    denoise: bool = False,
+) -> Tuple[tuple, int, float]:
+    """Describe a job for `predict()` & `record()`.
+
+    Args:
+        kind (str): "txt2img", "img2img" or "inpaint".
+        req (GenerationOptions): Request, merged with the default config.
+        width (int): Width rendered at.
+        height (int): Height rendered at.
+        hires (bool, optional): Whether hires fix is used. Defaults to False.
+        denoise (bool, optional): Whether only `denoising_strength` of the steps are sampled (img2img). Defaults to False.
+
+    Returns:
+        Tuple[tuple, int, float]: Configuration, sampling steps & megapixels per step.
+    """
+    steps = req.steps
+    if denoise and not req.do_exact_steps:
+        steps = ceil(req.steps * min(req.denoising_strength, 0.999))
+    steps *= req.batch_count
+    config = (
+        kind,
+        req.sd_model,
+        req.sampler_name,
+        # similar resolutions take similar time
+        round(width / 64) * 64,
+        round(height / 64) * 64,
+        req.batch_size,
+        hires,
+    )
+    megapixels = width * height * req.batch_size / 1e6 * (2 if hires else 1)
+    return config, steps, megapixels
+
+
+def predict(config: tuple, steps: int, megapixels: float):
+    """Predicted seconds a job takes, see `describe()`."""
+    with _lock:
+        rate = _rates.get(config, None)
+        if rate is not None:
+            _rates.move_to_end(config)
+            return rate * steps
+        return _global_rate * steps * megapixels
+
+
+def record(config: tuple, steps: int, megapixels: float, seconds: float):
+    """Record how long a job that wasn't interrupted took, see `describe()`."""
+    global _global_rate
+    if steps < 1 or megapixels <= 0:
+        return
+    with _lock:
+        _rates[config] = ema(_rates.get(config, None), seconds / steps)
+        _rates.move_to_end(config)
+        while len(_rates) > MAX_CONFIGS:
+            _rates.popitem(last=False)
+        _global_rate = ema(_global_rate, seconds / steps / megapixels)
@@ -0,0 +1,125 @@
+"""
+Server-sent events (SSE) channel that pushes progress (and optionally live preview)
+to the plugin over one persistent connection, instead of the plugin polling
+`/sdapi/v1/progress` every 250 ms.
+
+As the stream never ends, `app_encryption_middleware` cannot encrypt it as a whole.
+Instead, if the client asked for encryption, each event's data is XOR-encrypted
+then base64-encoded so it stays on one line.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import json
+import logging
+import secrets
+import time
+from base64 import b64encode
+from typing import Dict
+
+from starlette.concurrency import run_in_threadpool
+
+from .config import LOGGER_NAME
+from .progress import get_preview, get_progress
+from .utils import bytewise_xor
+
+log = logging.getLogger(LOGGER_NAME)
+
+EVENT_INTERVAL = 0.25
+"""Seconds between checking for changes to push."""
+TIME_KEYS = {"eta_relative", "jobs", "queue_eta"}
+"""Progress keys that change over time; clients count down from the last event."""
+PING_INTERVAL = 5
+"""Seconds of silence after which a ping is sent, so clients can detect dead connections."""
+
+
+class Subscription:
+    def __init__(
+        self,
+        preview: bool = False,
+        key: bytes = None,
+        max_size: int = 0,
+        fmt: str = "jpeg",
+    ):
+        """A connected client.
+
+        Args:
+            preview (bool, optional): Whether to push live preview frames. Defaults to False.
+            key (bytes, optional): Key to encrypt events with. Defaults to None.
+            max_size (int, optional): Max width/height of preview frames. Defaults to 0.
+            fmt (str, optional): Image format of preview frames. Defaults to "jpeg".
+        """
+        self.id = secrets.token_hex(8)
+        self.preview = preview
+        self.key = key
+        self.max_size = max_size
+        self.fmt = fmt
+        self.last_preview_id = None
+
+
+subscriptions: Dict[str, Subscription] = {}
+
+
+def format_event(sub: Subscription, event: str, data: dict):
+    payload = json.dumps(data)
+    if sub.key is not None:
+        payload = b64encode(bytewise_xor(payload.encode("utf-8"), sub.key))
+        payload = payload.decode("utf-8")
+    return f"event: {event}\ndata: {payload}\n\n"
+
+
+def subscribe(preview: bool = False, key: bytes = None, max_size=0, fmt="jpeg"):
+    sub = Subscription(preview, key, max_size, fmt)
+    subscriptions[sub.id] = sub
+    return sub
+
+
+async def stream(sub: Subscription):
+    """Generator of events for a subscriber; pushes only when something changed."""
+    try:
+        yield format_event(sub, "hello", {"id": sub.id})
+        last = None
+        last_sent = time.time()
+        while True:
+            progress = get_progress()
+            # ETAs change constantly, so they shouldn't trigger an update by themselves
+            changed = {k: v for k, v in progress.items() if k not in TIME_KEYS}
+            changed["jobs"] = [(j["ref"], j["state"]) for j in progress["jobs"]]
+            if changed != last:
+                last = changed
+                last_sent = time.time()
+                yield format_event(sub, "progress", progress)
+
+            if sub.preview:
+                preview = await run_in_threadpool(
+                    get_preview, sub.last_preview_id, sub.max_size, sub.fmt
+                )
+                if preview is not None:
+                    sub.last_preview_id = preview["id"]
+                    last_sent = time.time()
+                    yield format_event(sub, "preview", preview)
+
+            if time.time() - last_sent > PING_INTERVAL:
+                last_sent = time.time()
+                yield ": ping\n\n"
+            await asyncio.sleep(EVENT_INTERVAL)
+    finally:
+        subscriptions.pop(sub.id, None)
+
+
+def control(sub: Subscription, action: str, enabled: bool = True):
+    """Handle control message from subscriber.
+
+    Args:
+        sub (Subscription): Subscriber.
+        action (str): "preview". Jobs are cancelled via `/cancel/{job_id}` instead,
+            which only affects the job it is given.
+        enabled (bool, optional): Whether to enable preview for "preview". Defaults to True.
+    """
+    if action == "preview":
+        sub.preview = enabled
+        # resend current preview when re-enabled
+        sub.last_preview_id = None
+    else:
+        raise ValueError(f"unknown action: {action}")
@@ -0,0 +1,57 @@
+"""
+Cheap health check for the plugin to poll instead of `/config`, which parses the
+YAML config & inspects every script on each call.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import os
+import time
+
+import modules
+from modules import shared
+
+from . import jobs
+from .config import API_VERSION, CONFIG_PATH
+
+STARTED_AT = time.time()
+
+
+def get_revision():
+    """Short hash that changes whenever `/config` would likely return something new.
+
+    Only counts are used, which catches models/scripts being added or removed
+    without having to list (or inspect) them.
+
+    Returns:
+        str: Revision.
+    """
+    try:
+        cfg_mtime = os.path.getmtime(CONFIG_PATH)
+    except OSError:
+        cfg_mtime = None
+    parts = (
+        STARTED_AT,
+        cfg_mtime,
+        len(modules.sd_models.checkpoints_list),
+        len(modules.sd_vae.vae_dict),
+        len(shared.sd_upscalers),
+        len(modules.sd_samplers.samplers),
+        len(modules.scripts.scripts_txt2img.scripts),
+        len(modules.scripts.scripts_img2img.scripts),
+        len(shared.face_restorers),
+    )
+    return hashlib.md5(repr(parts).encode("utf-8")).hexdigest()[:12]
+
+
+def get_health():
+    return {
+        "version": API_VERSION,
+        "uptime": time.time() - STARTED_AT,
+        "queue": jobs.queue_depth(),
+        "busy": shared.state.job_count > 0,
+        "sd_model": shared.opts.sd_model_checkpoint,
+        "sd_vae": shared.opts.sd_vae,
+        "revision": get_revision(),
+    }
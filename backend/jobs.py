@@ -0,0 +1,158 @@
+"""Bookkeeping of image generation requests handled by our API."""
+
+from __future__ import annotations
+
+import hashlib
+import secrets
+import threading
+import time
+from functools import wraps
+from typing import Dict, Optional
+
+from fastapi import Header, HTTPException
+from modules import shared
+
+from . import eta
+
+_lock = threading.Lock()
+_jobs: Dict[str, Job] = {}
+
+
+class Job:
+    def __init__(self, id: str):
+        """Request to our API that is queued or running.
+
+        Args:
+            id (str): Job id, chosen by the client so it can cancel the job.
+        """
+        self.id = id
+        self.cancelled = False
+        self.state = "queued"
+        """Either "queued", "running" while it holds the GPU (i.e. `shared.state` is about this job), or "finishing"."""
+        self.started = None
+        self.work = None
+        """Configuration, steps & megapixels for `eta`, if the job is predictable."""
+        self.duration = None
+        """Predicted seconds the job holds the GPU."""
+
+    @property
+    def ref(self):
+        """Public reference to the job; unlike the id, it can't be used to cancel it."""
+        return job_ref(self.id)
+
+    def plan(self, work: tuple):
+        """Set work done by the job, see `eta.describe()`."""
+        self.work = work
+        self.duration = eta.predict(*work)
+
+    def guard(self, func):
+        """Wrap function passed to `wrap_gradio_gpu_call()`.
+
+        The wrapped function runs once the job acquired the queue lock. It is
+        skipped if the job was cancelled in the meantime, returning no images like
+        an interrupted generation would.
+        """
+
+        @wraps(func)
+        def f(*args, **kwargs):
+            with _lock:
+                if self.cancelled:
+                    return [], "", ""
+                self.state = "running"
+                self.started = time.time()
+            try:
+                res = func(*args, **kwargs)
+                if self.work is not None and not shared.state.interrupted:
+                    eta.record(*self.work, time.time() - self.started)
+                return res
+            finally:
+                with _lock:
+                    self.state = "finishing"
+
+        return f
+
+
+def job_ref(job_id: str):
+    return hashlib.sha256(job_id.encode("utf-8")).hexdigest()[:16]
+
+
+def queue_depth():
+    """Number of requests to our API that are queued or running."""
+    return len(_jobs)
+
+
+def tracked(x_job_id: Optional[str] = Header(None)):
+    """Dependency for routes that should count towards `queue_depth()` & be cancellable.
+
+    The client picks the job id via the `X-Job-Id` header; one is generated if
+    it didn't.
+
+    Usage: `def route(..., job: jobs.Job = Depends(jobs.tracked))`
+    """
+    job = Job(x_job_id if x_job_id else secrets.token_hex(8))
+    with _lock:
+        if job.id in _jobs:
+            raise HTTPException(status_code=409, detail="Job id already in use")
+        _jobs[job.id] = job
+    try:
+        yield job
+    finally:
+        with _lock:
+            _jobs.pop(job.id, None)
+
+
+def schedule():
+    """Predicted start & end of each job, assuming queued jobs run in arrival order.
+
+    Jobs without a prediction (e.g. upscale) are assumed to take no time.
+
+    Returns:
+        Tuple[List[dict], float]: Ref, state & seconds from now until each job starts & ends (None if unknown), and seconds until the queue is empty.
+    """
+    now = time.time()
+    with _lock:
+        active = [j for j in _jobs.values() if not j.cancelled]
+    # running job first, then queued ones; dicts keep insertion (arrival) order
+    order = {"running": 0, "finishing": 0, "queued": 1}
+    active.sort(key=lambda j: order[j.state])
+    out = []
+    # seconds until the GPU is free for the next job
+    free_in = 0.0
+    for job in active:
+        if job.state == "queued":
+            start = free_in
+        else:
+            start = (job.started or now) - now
+        end = None
+        if job.state == "finishing":
+            end = 0.0
+        elif job.duration is not None:
+            # the running job may take longer than predicted
+            end = max(start + job.duration, free_in)
+            free_in = end
+        out.append(
+            {"ref": job.ref, "state": job.state, "start_in": start, "end_in": end}
+        )
+    return out, free_in
+
+
+def cancel(job_id: str):
+    """Cancel job without affecting others.
+
+    A queued job is skipped once it would have started, while a running job is
+    interrupted. Interrupting is safe as only the running job is sampling.
+
+    Args:
+        job_id (str): Job id.
+
+    Returns:
+        str: State of the job when cancelled (see `Job.state`), or "unknown" if it already finished or never existed.
+    """
+    with _lock:
+        job = _jobs.get(job_id, None)
+        if job is None:
+            return "unknown"
+        job.cancelled = True
+        if job.state == "running":
+            shared.state.interrupt()
+        return job.state
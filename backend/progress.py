@@ -0,0 +1,96 @@
+"""Progress & live preview of the current job, shared by `/progress` and `/events`."""
+
+from __future__ import annotations
+
+import time
+from base64 import b64encode
+from io import BytesIO
+
+from modules import shared
+from PIL import Image
+
+from . import jobs
+
+PREVIEW_FORMATS = {"jpeg", "webp", "png"}
+
+
+def get_progress():
+    """Progress of the current job, using the same ETA estimate as the webUI.
+
+    Also includes the predicted schedule of all jobs, see `jobs.schedule()`.
+    """
+    state = shared.state
+    progress = 0.01
+    if state.job_count > 0:
+        progress += state.job_no / state.job_count
+        if state.sampling_steps > 0:
+            progress += state.sampling_step / state.sampling_steps / state.job_count
+    elapsed = time.time() - state.time_start if state.time_start else 0
+    eta = elapsed / progress - elapsed if state.job_count > 0 else 0
+    schedule, queue_eta = jobs.schedule()
+
+    return {
+        "sampling_step": state.sampling_step,
+        "sampling_steps": state.sampling_steps,
+        "job_no": state.job_no,
+        "job_count": state.job_count,
+        "queue": jobs.queue_depth(),
+        "interrupted": state.interrupted,
+        "eta_relative": eta,
+        "jobs": schedule,
+        "queue_eta": queue_eta,
+    }
+
+
+def encode_preview(image: Image.Image, max_size: int = 0, fmt: str = "jpeg"):
+    """Downscale & encode preview image to base64.
+
+    Args:
+        image (Image): Preview image.
+        max_size (int, optional): Max width/height, 0 to keep original size. Defaults to 0.
+        fmt (str, optional): "jpeg", "webp" or "png". Defaults to "jpeg".
+
+    Returns:
+        str: Base64-encoded image.
+    """
+    if max_size > 0 and max(image.size) > max_size:
+        image = image.copy()
+        image.thumbnail((max_size, max_size), Image.BILINEAR)
+    buf = BytesIO()
+    if fmt == "png":
+        # preview doesn't need max compression
+        image.save(buf, format="png", compress_level=1)
+    else:
+        image.convert("RGB").save(buf, format=fmt, quality=80)
+    return b64encode(buf.getvalue()).decode("utf-8")
+
+
+def get_preview(last_id=None, max_size: int = 0, fmt: str = "jpeg"):
+    """Get live preview of the current job if it changed since `last_id`.
+
+    Args:
+        last_id (str, optional): Id of preview the client already has. Defaults to None.
+        max_size (int, optional): Max width/height of preview. Defaults to 0.
+        fmt (str, optional): Image format, see `encode_preview()`. Defaults to "jpeg".
+
+    Returns:
+        Union[dict, None]: Preview id, format & image, or None if there is no new preview.
+    """
+    state = shared.state
+    if state.job_count < 1:
+        return None
+    state.set_current_image()
+    image = state.current_image
+    if image is None:
+        return None
+    # older webUI versions don't number previews
+    preview_id = str(getattr(state, "id_live_preview", id(image)))
+    if preview_id == last_id:
+        return None
+    if fmt not in PREVIEW_FORMATS:
+        fmt = "jpeg"
+    return {
+        "id": preview_id,
+        "format": fmt,
+        "image": encode_preview(image, max_size, fmt),
+    }
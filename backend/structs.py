@@ -1,6 +1,6 @@
 from __future__ import annotations
 
-from typing import Dict, List, Optional
+from typing import Any, Dict, List, Optional, Tuple, Union
 
 from pydantic import BaseModel
 
@@ -29,14 +29,31 @@ class DefaultImg2ImgOptions(Img2ImgOptions):
     pass
 
 
+class TiledImage(BaseModel):
+    """Image sent as tiles, of which those the backend should already have are
+    sent as just their hash. See `tile_store.py`.
+    """
+
+    session: str
+    """Tile session chosen by the client; tiles are only shared within a session."""
+    width: int
+    """Image width."""
+    height: int
+    """Image height."""
+    tile_size: int
+    """Width & height of tiles, except those at the right & bottom edges."""
+    tiles: List[Tuple[str, Optional[str]]]
+    """Hash & base64-encoded image (None if already uploaded) of each tile, row by row."""
+
+
 class Img2ImgRequest(DefaultImg2ImgOptions):
     """Img2Img API request. If optional attributes aren't set, the defaults from
     `krita_config.yaml` will be used.
     """
 
-    src_img: str
+    src_img: Union[TiledImage, str]
     """Image being used."""
-    mask_img: Optional[str] = None
+    mask_img: Optional[Union[TiledImage, str]] = None
     """Image mask being used."""
 
 
@@ -73,6 +90,14 @@ class ConfigResponse(PluginOptions):
     """List of available models."""
     sd_vaes: List[str]
     """List of available VAEs."""
+    warm_pool: Dict[str, Any]
+    """Checkpoints & VAEs kept in RAM and their hit rates."""
+    cond_cache: Dict[str, Any]
+    """Encoded prompts kept for reuse and their hit rate."""
+    tile_sync: Dict[str, Any]
+    """Whether images can be sent as tiles (see `TiledImage`), and how often tiles were reused."""
+    encodings: List[str]
+    """Content-Encodings accepted for request bodies."""
 
 
 class ImageResponse(BaseModel):
@@ -83,5 +108,12 @@ class ImageResponse(BaseModel):
 
 
 class UpscaleResponse(BaseModel):
-    output: str
-    """Upscaled image in base64."""
+    output: Optional[str] = None
+    """Upscaled image in base64, None if the job was cancelled."""
+
+
+class EventControlRequest(BaseModel):
+    action: str
+    """Only "preview" (toggle live preview), cancel jobs via `/cancel/{job_id}`."""
+    enabled: bool = True
+    """Whether live preview should be pushed, used by "preview"."""
@@ -0,0 +1,151 @@
+"""
+Keep tiles of images uploaded for img2img/inpaint so the plugin only needs to
+upload the tiles that changed since its last request.
+
+The plugin splits the image into tiles & hashes each one. Tiles this backend
+should already have are sent as just their hash, others with their data too.
+Tiles are stored per session (chosen by the plugin), so one user can't reference
+another's tiles. If a referenced tile was evicted (or the backend restarted), the
+request fails with 409 & the `X-Missing-Tiles` header, after which the plugin
+resends every tile.
+"""
+
+from __future__ import annotations
+
+import logging
+import threading
+from collections import OrderedDict
+from typing import Union
+
+from fastapi import HTTPException
+from PIL import Image
+
+from .config import LOGGER_NAME, TileSyncOptions
+from .structs import TiledImage
+from .utils import b64_to_img
+
+log = logging.getLogger(LOGGER_NAME)
+
+
+def tile_bytes(tile: Image.Image):
+    return tile.width * tile.height * len(tile.getbands())
+
+
+class TileStore:
+    def __init__(self):
+        """LRU of decoded tiles keyed by session & hash, bounded by memory."""
+        self.lock = threading.Lock()
+        self.entries: OrderedDict = OrderedDict()
+        """Maps (session, hash) to (tile, size in bytes)."""
+        self.total_bytes = 0
+        self.max_bytes = 0
+        self.reused = 0
+        self.uploaded = 0
+
+    def configure(self, max_bytes: int):
+        with self.lock:
+            self.max_bytes = max_bytes
+            self._evict()
+
+    def _evict(self):
+        while len(self.entries) > 0 and self.total_bytes > self.max_bytes:
+            _, (_, size) = self.entries.popitem(last=False)
+            self.total_bytes -= size
+
+    def assemble(self, img: TiledImage):
+        """Reassemble image from uploaded tiles & tiles stored by earlier requests.
+
+        Raises:
+            HTTPException: 409 if tiles are missing, 422 if tiles don't cover the image.
+
+        Returns:
+            Image: Image.
+        """
+        size = img.tile_size
+        if size < 1 or img.width < 1 or img.height < 1:
+            raise HTTPException(status_code=422, detail="Invalid tiled image size")
+        cols = -(-img.width // size)
+        rows = -(-img.height // size)
+        if len(img.tiles) != cols * rows:
+            raise HTTPException(status_code=422, detail="Tiles don't cover image")
+
+        # tiles uploaded by this request are used as is, even if the store is full
+        tiles = {}
+        for digest, data in img.tiles:
+            if data is not None and digest not in tiles:
+                tile = b64_to_img(data)
+                tile.load()
+                tiles[digest] = tile
+
+        with self.lock:
+            for digest, tile in tiles.items():
+                self._put((img.session, digest), tile)
+            missing = 0
+            for digest, _ in img.tiles:
+                if digest in tiles:
+                    continue
+                key = (img.session, digest)
+                if key in self.entries:
+                    self.entries.move_to_end(key)
+                    tiles[digest] = self.entries[key][0]
+                else:
+                    missing += 1
+            if missing == 0:
+                uploaded = sum(1 for _, data in img.tiles if data is not None)
+                self.uploaded += uploaded
+                self.reused += len(img.tiles) - uploaded
+        if missing > 0:
+            log.info(f"Tile sync: {missing} tiles missing, asking for full upload")
+            raise HTTPException(
+                status_code=409,
+                detail="Tiles missing, upload all tiles",
+                headers={"X-Missing-Tiles": str(missing)},
+            )
+
+        mode = tiles[img.tiles[0][0]].mode
+        image = Image.new(mode, (img.width, img.height))
+        for i, (digest, _) in enumerate(img.tiles):
+            image.paste(tiles[digest], ((i % cols) * size, (i // cols) * size))
+        return image
+
+    def _put(self, key: tuple, tile: Image.Image):
+        size = tile_bytes(tile)
+        if size > self.max_bytes:
+            return
+        if key in self.entries:
+            self.total_bytes -= self.entries.pop(key)[1]
+        self.entries[key] = (tile, size)
+        self.total_bytes += size
+        self._evict()
+
+    def status(self):
+        with self.lock:
+            total = self.reused + self.uploaded
+            return {
+                "enabled": self.max_bytes > 0,
+                "tiles": len(self.entries),
+                "sessions": len({session for session, _ in self.entries}),
+                "size_mb": self.total_bytes / 2**20,
+                "max_mb": self.max_bytes / 2**20,
+                "reused": self.reused,
+                "uploaded": self.uploaded,
+                "reuse_rate": self.reused / total if total else None,
+            }
+
+
+store = TileStore()
+
+
+def decode(img: Union[str, TiledImage]):
+    """Decode image sent either as base64 or as tiles, see `TiledImage`."""
+    if isinstance(img, str):
+        return b64_to_img(img)
+    return store.assemble(img)
+
+
+def configure(opts: TileSyncOptions):
+    store.configure(opts.max_memory_mb * 2**20)
+
+
+def status():
+    return store.status()
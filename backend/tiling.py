@@ -0,0 +1,156 @@
+"""
+Tiled img2img for selections larger than `max_size`.
+
+Instead of rendering a downscaled image & upscaling the result back (losing
+detail), the image is split into overlapping tiles at the model's native
+resolution. Tiles are rendered `tile_batch_size` at a time and seams are
+blended across the overlap when they are recombined. This is how the webUI's
+"SD upscale" script renders, minus the upscaling.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import json
+import logging
+
+import modules
+from modules import images, processing, shared
+from modules.processing import StableDiffusionProcessingImg2Img
+from PIL import Image
+
+from .config import LOGGER_NAME
+from .structs import Img2ImgRequest
+from .utils import get_sampler_index, parse_prompt
+
+log = logging.getLogger(LOGGER_NAME)
+
+# per-image generation info, see `merge_responses()` in the plugin
+PER_IMAGE_INFO = (
+    "all_prompts",
+    "all_negative_prompts",
+    "all_seeds",
+    "all_subseeds",
+    "infotexts",
+)
+
+
+def needs_tiling(req: Img2ImgRequest, width: int, height: int):
+    """Whether tiled mode applies; inpainting renders the usual way."""
+    return req.tiled and not req.is_inpaint and max(width, height) > req.max_size
+
+
+def tile_seed(seed: int, index: int):
+    """Seed of a tile, derived from the seed of its image & the tile's index.
+
+    The first tile uses the image's seed. Seeds of the others are hashed, so they
+    don't collide with the seeds of other images, which are `seed + n`.
+    """
+    if index == 0:
+        return seed
+    digest = hashlib.blake2b(f"{seed}:{index}".encode("utf-8"), digest_size=4)
+    return int.from_bytes(digest.digest(), "little")
+
+
+def tiled_img2img(req: Img2ImgRequest, image: Image.Image):
+    """Img2img the image tile by tile.
+
+    Renders `batch_count * batch_size` images, seeded like untiled img2img would
+    seed them. Each image's tiles are seeded by `tile_seed()`. Progress is reported
+    per batch of tiles through `shared.state.job_no` & `shared.state.job_count`.
+    Must be wrapped in `wrap_gradio_gpu_call`.
+
+    Args:
+        req (Img2ImgRequest): Request.
+        image (Image): Image to render, at original size.
+
+    Returns:
+        Tuple[List[Image], str, str]: Images, generation info & an (unused) html string, like `modules.img2img.img2img`.
+    """
+    tile_size = req.base_size
+    image = image.convert("RGB")
+    grid = images.split_grid(image, tile_size, tile_size, req.tile_overlap)
+    # grid.tiles is [y, h, [[x, w, tile], ...]] per row
+    cells = [cell for _, _, row in grid.tiles for cell in row]
+    originals = [cell[2] for cell in cells]
+    batch_size = max(1, req.tile_batch_size)
+    batches = [
+        originals[i : i + batch_size] for i in range(0, len(originals), batch_size)
+    ]
+    log.info(
+        f"tiled img2img: {len(cells)} tiles of {tile_size}px in {len(batches)} batches"
+    )
+
+    sampler_index = get_sampler_index(req.sampler_name)
+    p = StableDiffusionProcessingImg2Img(
+        sd_model=shared.sd_model,
+        outpath_samples=shared.opts.outdir_samples or shared.opts.outdir_img2img_samples,
+        outpath_grids=shared.opts.outdir_grids or shared.opts.outdir_img2img_grids,
+        prompt=parse_prompt(req.prompt),
+        negative_prompt=parse_prompt(req.negative_prompt),
+        seed=req.seed,
+        subseed=req.subseed,
+        subseed_strength=req.subseed_strength,
+        seed_resize_from_h=req.seed_resize_from_h,
+        seed_resize_from_w=req.seed_resize_from_w,
+        seed_enable_extras=req.seed_enable_extras,
+        sampler_name=modules.sd_samplers.samplers[sampler_index].name,
+        batch_size=batch_size,
+        n_iter=1,
+        steps=req.steps,
+        cfg_scale=req.cfg_scale,
+        width=tile_size,
+        height=tile_size,
+        restore_faces=req.restore_faces,
+        tiling=req.tiling,
+        init_images=[],
+        denoising_strength=req.denoising_strength,
+        resize_mode=req.resize_mode,
+        do_not_save_samples=True,
+        do_not_save_grid=True,
+    )
+    processing.fix_seed(p)
+    start_seed, start_subseed = p.seed, p.subseed
+    count = req.batch_count * req.batch_size
+
+    # each process_images() call advances job_no, so this gives progress per batch
+    shared.state.job_count = count * len(batches)
+
+    outputs = []
+    infos = []
+    for n in range(count):
+        # same as the webUI seeds images, see `processing.process_images()`
+        seed = start_seed + (n if p.subseed_strength == 0 else 0)
+        subseed = start_subseed + n
+        results = []
+        for b, batch in enumerate(batches):
+            if shared.state.interrupted:
+                break
+            tiles = range(b * batch_size, b * batch_size + len(batch))
+            p.seed = [tile_seed(seed, i) for i in tiles]
+            p.subseed = [tile_seed(subseed, i) for i in tiles]
+            p.init_images = batch
+            p.batch_size = len(batch)
+            processed = processing.process_images(p)
+            results += processed.images[: len(batch)]
+            if len(infos) == n:
+                infos.append(json.loads(processed.js()))
+        if len(results) == 0:
+            break
+
+        # tiles not rendered due to interruption are left as is
+        results += originals[len(results) :]
+        for cell, result in zip(cells, results):
+            cell[2] = result
+        outputs.append(images.combine_grid(grid))
+
+    if len(outputs) == 0:
+        return None, "", ""
+
+    # generation info of the first tile of each image stands for the whole image
+    infos = infos[: len(outputs)]
+    info = dict(infos[0])
+    for k in PER_IMAGE_INFO:
+        if k in info:
+            info[k] = [i[k][0] for i in infos if len(i.get(k, [])) > 0]
+    return outputs, json.dumps(info), ""
@@ -15,6 +15,7 @@ from modules import shared
 from PIL import Image
 from pydantic import BaseModel
 
+from . import warm_pool
 from .config import CONFIG_PATH, ENCRYPT_FILE, LOGGER_NAME, MainConfig
 
 log = logging.getLogger(LOGGER_NAME)
@@ -81,13 +82,16 @@ def prepare_backend(opt: BaseModel):
         shared.opts.face_restoration_model = opt.face_restorer
         shared.opts.code_former_weight = opt.codeformer_weight
 
+    # swap weights from RAM if they are in the warm pool
     if hasattr(opt, "sd_model"):
         shared.opts.sd_model_checkpoint = opt.sd_model
-        modules.sd_models.reload_model_weights(shared.sd_model)
+        with warm_pool.active():
+            modules.sd_models.reload_model_weights(shared.sd_model)
 
     if hasattr(opt, "sd_vae"):
         shared.opts.sd_vae = opt.sd_vae
-        modules.sd_vae.reload_vae_weights()
+        with warm_pool.active():
+            modules.sd_vae.reload_vae_weights()
 
     if hasattr(opt, "clip_skip"):
         shared.opts.CLIP_stop_at_last_layers = opt.clip_skip
@@ -110,6 +114,28 @@ def prepare_backend(opt: BaseModel):
         os.makedirs(opt.sample_path, exist_ok=True)
 
 
+def apply_draft(req: BaseModel, width: int, height: int, stride: int = 8):
+    """Reduce steps & resolution if the request is a draft, see `GenerationOptions.draft`.
+
+    Args:
+        req (BaseModel): Request, merged with the default config.
+        width (int): Width to render at.
+        height (int): Height to render at.
+        stride (int, optional): Resolution must be a multiple of this. Defaults to 8.
+
+    Returns:
+        Tuple[int, int]: Width & height to render at.
+    """
+    if not req.draft:
+        return width, height
+    req.steps = max(1, round(req.steps * req.draft_steps_ratio))
+    req.highres_fix = False
+    ratio = min(max(req.draft_size_ratio, 0.1), 1.0)
+    width = max(64, round(width * ratio / stride) * stride)
+    height = max(64, round(height * ratio / stride) * stride)
+    return width, height
+
+
 def optional(*fields):
     """Decorator function used to modify a pydantic model's fields to all be optional.
     Alternatively, you can  also pass the field names that should be made optional as arguments
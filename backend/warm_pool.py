@@ -0,0 +1,204 @@
+"""
+Keep recently used checkpoints & VAEs in RAM so switching models doesn't reread
+them from disk.
+
+This works by wrapping the functions the webUI uses to read weights from disk
+(`sd_models.read_state_dict` & `sd_vae.load_vae_dict`). The wrappers only serve
+from the pool while `active()` is in effect, i.e. while `prepare_backend()`
+switches models for our API. Other callers (e.g. the checkpoint merger, which
+modifies the state dict in place) are passed through untouched.
+"""
+
+from __future__ import annotations
+
+import logging
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+
+import modules
+
+from .config import LOGGER_NAME, WarmPoolOptions
+
+log = logging.getLogger(LOGGER_NAME)
+
+_local = threading.local()
+
+
+def state_dict_size(state_dict: dict):
+    """Size of tensors in state dict in bytes."""
+    return sum(
+        v.numel() * v.element_size() for v in state_dict.values() if hasattr(v, "numel")
+    )
+
+
+class WarmPool:
+    def __init__(self, name: str):
+        """LRU of state dicts keyed by file path, bounded by count & memory.
+
+        Args:
+            name (str): Name used in logs and status.
+        """
+        self.name = name
+        self.lock = threading.Lock()
+        self.entries: OrderedDict = OrderedDict()
+        """Maps file path to (state dict, size in bytes)."""
+        self.max_items = 0
+        self.max_bytes = 0
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def total_bytes(self):
+        return sum(size for _, size in self.entries.values())
+
+    def configure(self, max_items: int, max_bytes: int):
+        with self.lock:
+            self.max_items = max_items
+            self.max_bytes = max_bytes
+            self._evict()
+
+    def _evict(self):
+        while len(self.entries) > 0 and (
+            len(self.entries) > self.max_items or self.total_bytes > self.max_bytes
+        ):
+            path, _ = self.entries.popitem(last=False)
+            log.info(f"{self.name} pool: evicted {path}")
+
+    def get(self, path: str, load):
+        """Get state dict from pool, else load & add it to the pool.
+
+        Args:
+            path (str): Path of weights file.
+            load (Callable[[], dict]): Reads weights from disk.
+
+        Returns:
+            dict: State dict.
+        """
+        with self.lock:
+            if path in self.entries:
+                self.entries.move_to_end(path)
+                self.hits += 1
+                log.info(f"{self.name} pool: loading {path} from RAM")
+                return self.entries[path][0]
+            self.misses += 1
+
+        state_dict = load()
+        self.put(path, state_dict)
+        return state_dict
+
+    def put(self, path: str, state_dict: dict):
+        size = state_dict_size(state_dict)
+        with self.lock:
+            if self.max_items < 1 or size > self.max_bytes:
+                return
+            self.entries[path] = (state_dict, size)
+            self.entries.move_to_end(path)
+            self._evict()
+
+    def status(self):
+        with self.lock:
+            total = self.hits + self.misses
+            return {
+                "entries": [
+                    {"path": path, "size_mb": size / 2**20}
+                    for path, (_, size) in self.entries.items()
+                ],
+                "size_mb": self.total_bytes / 2**20,
+                "max_items": self.max_items,
+                "max_mb": self.max_bytes / 2**20,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / total if total else None,
+            }
+
+
+checkpoint_pool = WarmPool("checkpoint")
+vae_pool = WarmPool("VAE")
+
+
+@contextmanager
+def active(enabled: bool = True):
+    """Serve weights from the pool within this context (current thread only)."""
+    prev = getattr(_local, "active", False)
+    _local.active = enabled
+    try:
+        yield
+    finally:
+        _local.active = prev
+
+
+def install():
+    """Wrap the webUI's weight loading functions. Safe to call multiple times."""
+    read_state_dict = modules.sd_models.read_state_dict
+    if not hasattr(read_state_dict, "_warm_pool_orig"):
+
+        def wrapped_read_state_dict(checkpoint_file, *args, **kwargs):
+            load = lambda: read_state_dict(checkpoint_file, *args, **kwargs)
+            if not getattr(_local, "active", False):
+                return load()
+            return checkpoint_pool.get(checkpoint_file, load)
+
+        wrapped_read_state_dict._warm_pool_orig = read_state_dict
+        modules.sd_models.read_state_dict = wrapped_read_state_dict
+
+    load_vae_dict = modules.sd_vae.load_vae_dict
+    if not hasattr(load_vae_dict, "_warm_pool_orig"):
+
+        def wrapped_load_vae_dict(filename, *args, **kwargs):
+            def load():
+                # VAE is read using read_state_dict, don't pool it as a checkpoint
+                with active(False):
+                    return load_vae_dict(filename, *args, **kwargs)
+
+            if not getattr(_local, "active", False):
+                return load()
+            return vae_pool.get(filename, load)
+
+        wrapped_load_vae_dict._warm_pool_orig = load_vae_dict
+        modules.sd_vae.load_vae_dict = wrapped_load_vae_dict
+
+
+def configure(opts: WarmPoolOptions):
+    max_bytes = opts.max_memory_mb * 2**20
+    # the memory budget applies to each pool separately
+    checkpoint_pool.configure(opts.max_models, max_bytes)
+    vae_pool.configure(opts.max_vaes, max_bytes)
+
+
+def prewarm(opts: WarmPoolOptions):
+    """Read checkpoints & VAEs listed in config into the pool."""
+    # use the unwrapped functions so prewarming doesn't count as pool misses
+    read_state_dict = modules.sd_models.read_state_dict._warm_pool_orig
+    load_vae_dict = modules.sd_vae.load_vae_dict._warm_pool_orig
+    location = modules.shared.weight_load_location
+
+    for name in opts.prewarm_models[: opts.max_models]:
+        info = modules.sd_models.get_closet_checkpoint_match(name)
+        if info is None:
+            log.warning(f"Cannot prewarm checkpoint, not found: {name}")
+            continue
+        checkpoint_pool.put(
+            info.filename, read_state_dict(info.filename, map_location=location)
+        )
+    for name in opts.prewarm_vaes[: opts.max_vaes]:
+        path = modules.sd_vae.vae_dict.get(name, None)
+        if path is None:
+            log.warning(f"Cannot prewarm VAE, not found: {name}")
+            continue
+        vae_pool.put(path, load_vae_dict(path, map_location=location))
+    log.info(
+        f"Prewarmed {len(checkpoint_pool.entries)} checkpoints, {len(vae_pool.entries)} VAEs"
+    )
+
+
+def start(opts: WarmPoolOptions):
+    """Install pool & prewarm it in the background."""
+    install()
+    configure(opts)
+    if opts.max_models > 0 or opts.max_vaes > 0:
+        threading.Thread(target=prewarm, args=(opts,), daemon=True).start()
+
+
+def status():
+    return {"checkpoints": checkpoint_pool.status(), "vaes": vae_pool.status()}
@@ -0,0 +1,119 @@
+import json
+import re
+from typing import Dict, List, Optional
+
+from .config import Config
+from .tile_sync import TileSession
+
+
+class Backend:
+    def __init__(self, url: str):
+        """State of a single backend as seen by this plugin instance.
+
+        Args:
+            url (str): Base URL of the backend.
+        """
+        self.url = url
+        self.healthy = False
+        """Whether the last probe/request succeeded."""
+        self.busy = 0
+        """Jobs the backend itself reported as running."""
+        self.pending = 0
+        """Requests this plugin instance has in flight to the backend."""
+        self.probing = False
+        """Whether a probe is already in flight (prevents piling up probes)."""
+        self.encodings = []
+        """Content-Encodings the backend accepts for request bodies."""
+        self.tiles: Optional[TileSession] = None
+        """Tiles sent to the backend, if it supports uploading only changed tiles."""
+
+    @property
+    def load(self):
+        return self.pending + self.busy
+
+
+class BackendPool:
+    def __init__(self, cfg: Config):
+        """Pool of backends to dispatch image generation requests to.
+
+        The first backend is always `base_url`, which is also the one used for
+        config/progress. Additional backends come from `extra_base_urls`.
+
+        Args:
+            cfg (Config): Config to read backend URLs from.
+        """
+        self.cfg = cfg
+        self.backends: Dict[str, Backend] = {}
+
+    def urls(self):
+        extra = re.split(r"[\s,;]+", self.cfg("extra_base_urls", str).strip())
+        urls = [self.cfg("base_url", str)] + [u for u in extra if u != ""]
+        # dedupe while preserving order
+        return list(dict.fromkeys(urls))
+
+    def sync(self):
+        """Update backends to match config, keeping state of existing ones."""
+        self.backends = {u: self.backends.get(u, Backend(u)) for u in self.urls()}
+
+    @property
+    def primary(self):
+        return self.backends.get(self.cfg("base_url", str), None)
+
+    def healthy(self, exclude=()) -> List[Backend]:
+        """Healthy backends sorted from least to most loaded. Ties keep config order."""
+        backends = [
+            b for b in self.backends.values() if b.healthy and b.url not in exclude
+        ]
+        return sorted(backends, key=lambda b: b.load)
+
+    def pick(self, exclude=()):
+        """Least-loaded healthy backend, or None if there is none."""
+        backends = self.healthy(exclude)
+        return backends[0] if len(backends) > 0 else None
+
+
+def split_batch(count: int, n: int):
+    """Split batch count into at most n nearly equal parts.
+
+    Args:
+        count (int): Batch count to split.
+        n (int): Max number of parts.
+
+    Returns:
+        List[int]: Batch count of each part.
+    """
+    n = max(1, min(count, n))
+    return [count // n + (1 if i < count % n else 0) for i in range(n)]
+
+
+def merge_responses(resps: List[dict]):
+    """Merge responses of requests that were split across backends.
+
+    Output images are concatenated in order, and the per-image fields of the
+    generation info are concatenated such that layer names stay correct.
+
+    Args:
+        resps (List[dict]): Responses in the order the batch was split.
+
+    Returns:
+        dict: Merged response.
+    """
+    if len(resps) == 1:
+        return resps[0]
+    outputs = [o for r in resps for o in r["outputs"]]
+    try:
+        infos = [json.loads(r["info"]) for r in resps]
+        info = dict(infos[0])
+        for k in (
+            "all_prompts",
+            "all_negative_prompts",
+            "all_seeds",
+            "all_subseeds",
+            "infotexts",
+        ):
+            if k in info:
+                info[k] = [v for i in infos for v in i.get(k, [])]
+        info = json.dumps(info)
+    except:
+        info = resps[0]["info"]
+    return {"outputs": outputs, "info": info}
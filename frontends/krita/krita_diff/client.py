@@ -1,26 +1,55 @@
+import gzip
+import hashlib
 import json
+import select
 import socket
-from typing import Any, Dict, List
-from urllib.error import URLError
-from urllib.parse import urljoin, urlparse
-from urllib.request import Request, urlopen
+import threading
+import time
+import uuid
+from base64 import b64decode
+from functools import partial
+from http.client import HTTPConnection, HTTPException, HTTPSConnection
+from io import BytesIO
+from typing import Any, Callable, Dict, List, Tuple
+from urllib.error import HTTPError, URLError
+from urllib.parse import urlencode, urljoin, urlparse
 
-from krita import QObject, QThread, pyqtSignal
+from krita import QObject, QRunnable, QThread, QThreadPool, pyqtSignal
 
-from .config import Config
+from .backends import BackendPool, merge_responses, split_batch
+from .config import Config, ConfigSnapshot
 from .defaults import (
     ERR_BAD_URL,
     ERR_NO_CONNECTION,
+    COMPRESS_LEVEL,
+    COMPRESS_MIN_SIZE,
+    EVENTS_TIMEOUT,
     LONG_TIMEOUT,
+    LONG_WORKERS,
     OFFICIAL_ROUTE_PREFIX,
+    POOL_IDLE_TIMEOUT,
+    POOL_MAX_IDLE,
+    PREVIEW_FORMAT,
+    PREVIEW_MAX_SIZE,
     ROUTE_PREFIX,
     SHORT_TIMEOUT,
+    SHORT_WORKERS,
+    STATE_BACKEND_ERROR,
     STATE_DONE,
     STATE_READY,
     STATE_URLERROR,
+    SYNC_TILE_SIZE,
     THREADED,
 )
-from .utils import bytewise_xor, fix_prompt, get_ext_args, get_ext_key, img_to_b64
+from .tile_sync import ImageUpload, TileSession
+from .utils import (
+    Deferred,
+    bytewise_xor,
+    fix_prompt,
+    get_ext_args,
+    get_ext_key,
+    img_to_b64,
+)
 
 # NOTE: backend queues up responses, so no explicit need to block multiple requests
 # except to prevent user from spamming themselves
@@ -28,8 +57,9 @@ from .utils import bytewise_xor, fix_prompt, get_ext_args, get_ext_key, img_to_b
 # TODO: tab showing all queued up requests (local plugin instance only)
 
 
-def get_url(cfg: Config, route: str = ..., prefix: str = ROUTE_PREFIX):
-    base = cfg("base_url", str)
+def get_url(cfg: Config, route: str = ..., prefix: str = ROUTE_PREFIX, base: str = ...):
+    if base is ...:
+        base = cfg("base_url", str)
     if not urlparse(base).scheme in {"http", "https"}:
         return None
     url = urljoin(base, prefix)
@@ -39,9 +69,201 @@ def get_url(cfg: Config, route: str = ..., prefix: str = ROUTE_PREFIX):
     return url
 
 
+# requests safe to resend if the connection dropped after they were sent
+IDEMPOTENT_METHODS = {"GET", "HEAD"}
+
+
+def is_dropped(conn):
+    """Whether the server closed an idle connection (it would be readable)."""
+    if conn.sock is None:
+        return False
+    try:
+        return len(select.select([conn.sock], [], [], 0)[0]) > 0
+    except (OSError, ValueError):
+        return True
+
+
+class ConnectionPool:
+    def __init__(
+        self, max_idle: int = POOL_MAX_IDLE, idle_timeout: float = POOL_IDLE_TIMEOUT
+    ):
+        """Keep-alive HTTP connections reused across requests, per host.
+
+        Thread-safe; a connection is used by one request at a time and returned to
+        the pool afterwards if the server didn't close it.
+
+        Args:
+            max_idle (int, optional): Max idle connections kept per host. Defaults to POOL_MAX_IDLE.
+            idle_timeout (float, optional): Seconds after which idle connections are closed. Defaults to POOL_IDLE_TIMEOUT.
+        """
+        self.max_idle = max_idle
+        self.idle_timeout = idle_timeout
+        self.lock = threading.Lock()
+        self.idle: Dict[tuple, list] = {}
+        """Maps (scheme, host, port) to list of (connection, last used time)."""
+        self.active = set()
+        """Connections currently in use by a request."""
+
+    def _evict(self, now):
+        for conns in self.idle.values():
+            for item in [c for c in conns if now - c[1] >= self.idle_timeout]:
+                conns.remove(item)
+                item[0].close()
+
+    def acquire(self, key: tuple, timeout):
+        """Get idle connection to host if any, else a new one. Also returns if it was reused."""
+        with self.lock:
+            self._evict(time.monotonic())
+            conns = self.idle.get(key, [])
+            while len(conns) > 0:
+                conn = conns.pop()[0]
+                if is_dropped(conn):
+                    conn.close()
+                    continue
+                conn.timeout = timeout
+                if conn.sock is not None:
+                    conn.sock.settimeout(timeout)
+                self.active.add(conn)
+                return conn, True
+            scheme, host, port = key
+            cls = HTTPSConnection if scheme == "https" else HTTPConnection
+            conn = cls(host, port, timeout=timeout)
+            self.active.add(conn)
+            return conn, False
+
+    def discard(self, conn):
+        with self.lock:
+            self.active.discard(conn)
+        conn.close()
+
+    def release(self, key: tuple, conn):
+        with self.lock:
+            self.active.discard(conn)
+            conns = self.idle.setdefault(key, [])
+            if len(conns) >= self.max_idle:
+                conn.close()
+            else:
+                conns.append((conn, time.monotonic()))
+
+    def clear(self):
+        """Close all connections, aborting requests in progress (e.g. when quitting)."""
+        with self.lock:
+            for conns in self.idle.values():
+                for conn, _ in conns:
+                    conn.close()
+            self.idle.clear()
+            for conn in self.active:
+                # unlike close(), wakes up threads blocked reading from the socket
+                if conn.sock is not None:
+                    try:
+                        conn.sock.shutdown(socket.SHUT_RDWR)
+                    except OSError:
+                        pass
+
+    def request(
+        self,
+        method: str,
+        url: str,
+        body=None,
+        headers={},
+        timeout=None,
+        handle: "AbortHandle" = None,
+    ):
+        """Blocking HTTP request, raising the same errors `urlopen()` would.
+
+        Args:
+            handle (AbortHandle, optional): Lets another thread abort the request. Defaults to None.
+
+        Returns:
+            Tuple[HTTPResponse, bytes]: Response (already read) & its body.
+        """
+        parsed = urlparse(url)
+        key = (parsed.scheme, parsed.hostname, parsed.port)
+        path = parsed.path or "/"
+        if parsed.query:
+            path += "?" + parsed.query
+
+        while True:
+            conn, reused = self.acquire(key, timeout)
+            sent = False
+            try:
+                if handle is not None:
+                    # connect first, so abort() has a socket to shut down
+                    if conn.sock is None:
+                        conn.connect()
+                    handle.attach(conn)
+                conn.request(method, path, body, headers)
+                sent = True
+                res = conn.getresponse()
+                data = res.read()
+            except (socket.timeout, TimeoutError):
+                self.discard(conn)
+                raise
+            except (OSError, HTTPException) as e:
+                self.discard(conn)
+                # server may have closed the idle connection in the meantime, but
+                # once sent, a non-idempotent request (e.g. a generation) may have
+                # been accepted & must not run twice
+                retry = not sent or method in IDEMPOTENT_METHODS
+                if reused and retry and not (handle is not None and handle.aborted):
+                    continue
+                raise URLError(e)
+            finally:
+                if handle is not None:
+                    handle.detach()
+            break
+
+        if res.will_close:
+            self.discard(conn)
+        else:
+            self.release(key, conn)
+        if res.status >= 400:
+            raise HTTPError(url, res.status, res.reason, res.headers, BytesIO(data))
+        return res, data
+
+
+class AbortHandle:
+    def __init__(self):
+        """Lets another thread abort a blocking `ConnectionPool.request()`.
+
+        Aborting shuts down the socket of the connection in use, which wakes up the
+        thread waiting on it, e.g. for a generation that is still queued.
+        """
+        self.lock = threading.Lock()
+        self.aborted = False
+        self.conn = None
+
+    def attach(self, conn):
+        """Track connection in use; raises if already aborted."""
+        with self.lock:
+            if self.aborted:
+                raise ConnectionAbortedError("Request aborted")
+            self.conn = conn
+
+    def detach(self):
+        with self.lock:
+            self.conn = None
+
+    def abort(self):
+        with self.lock:
+            self.aborted = True
+            conn = self.conn
+        if conn is not None and conn.sock is not None:
+            try:
+                conn.sock.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+
+
+http_pool = ConnectionPool()
+
+
 # krita doesn't reexport QtNetwork
 class AsyncRequest(QObject):
     timeout = None
+    live = 0
+    """Requests started but not yet finished, for diagnostics."""
+    live_lock = threading.Lock()
     finished = pyqtSignal()
     result = pyqtSignal(object)
     error = pyqtSignal(Exception)
@@ -54,6 +276,8 @@ class AsyncRequest(QObject):
         method: str = ...,
         headers: dict = ...,
         key: str = None,
+        compress: bool = False,
+        postprocess: Callable[[Any], Any] = None,
     ):
         """Create an AsyncRequest object.
 
@@ -61,18 +285,27 @@ class AsyncRequest(QObject):
         or "GET" based on the presence of `data` and uses JSON to transmit. It
         also assumes the response is JSON.
 
+        Top-level values of `data` can be `Deferred`, which are computed in the
+        worker thread when the payload is encoded.
+
         Args:
             url (str): URL to request from.
             data (Any, optional): Payload to send. Defaults to None.
             timeout (int, optional): Timeout for request. Defaults to `...`.
             method (str, optional): Which HTTP method to use. Defaults to `...`.
             key (Union[str, None], Optional): Key to use for encryption/decryption. Defaults to None.
+            compress (bool, optional): Whether to gzip the payload. Defaults to False.
+            postprocess (Callable[[Any], Any], optional): Applied to the response in the worker thread, e.g. to decode images. Defaults to None.
         """
         super(AsyncRequest, self).__init__()
         self.url = url
-        self.data = None if data is None else json.dumps(data).encode("utf-8")
+        self.data = data
+        self.compress = compress
+        self.postprocess = postprocess
         self.headers = {} if headers is ... else headers
+        self.headers["Accept-Encoding"] = "gzip"
 
+        self.handle = AbortHandle()
         self.key = None
         if isinstance(key, str) and key.strip() != "":
             self.key = key.strip().encode("utf-8")
@@ -85,54 +318,227 @@ class AsyncRequest(QObject):
             self.method = "GET" if data is None else "POST"
         else:
             self.method = method
-        if self.data is not None:
-            if self.key is not None:
-                # print(f"Encrypting with ${self.key}:\n{self.data}")
-                self.data = bytewise_xor(self.data, self.key)
-                # print(f"Encrypt Result:\n{self.data}")
-            self.headers["Content-Type"] = "application/json"
-            self.headers["Content-Length"] = str(len(self.data))
+
+    def encode(self):
+        """Encode payload; slow for images so it is done in the worker thread."""
+        if self.data is None:
+            return None
+        data = self.data
+        if isinstance(data, dict):
+            data = {k: v() if isinstance(v, Deferred) else v for k, v in data.items()}
+        data = json.dumps(data).encode("utf-8")
+        # compress before encrypting, as encrypted data doesn't compress well
+        if self.compress and len(data) >= COMPRESS_MIN_SIZE:
+            data = gzip.compress(data, COMPRESS_LEVEL)
+            self.headers["Content-Encoding"] = "gzip"
+        if self.key is not None:
+            # print(f"Encrypting with ${self.key}:\n{data}")
+            data = bytewise_xor(data, self.key)
+            # print(f"Encrypt Result:\n{data}")
+        self.headers["Content-Type"] = "application/json"
+        self.headers["Content-Length"] = str(len(data))
+        return data
+
+    @property
+    def aborted(self):
+        return self.handle.aborted
+
+    def abort(self):
+        """Abort request, even if in flight. It then only emits `finished`."""
+        self.handle.abort()
 
     def run(self):
-        req = Request(self.url, headers=self.headers, method=self.method)
         try:
-            with urlopen(req, self.data, self.timeout) as res:
-                data = res.read()
-                enc_type = res.getheader("X-Encrypted-Body", None)
-                assert enc_type in {"XOR", None}, "Unknown server encryption!"
-                if enc_type == "XOR":
-                    assert self.key, f"Key needed to decrypt server response!"
-                    # print(f"Decrypting with ${self.key}:\n{data}")
-                    data = bytewise_xor(data, self.key)
-                    # print(f"Decrypt Result:\n{data}")
-                self.result.emit(json.loads(data))
+            if self.aborted:
+                return
+            body = self.encode()
+            res, data = http_pool.request(
+                self.method, self.url, body, self.headers, self.timeout, self.handle
+            )
+            enc_type = res.getheader("X-Encrypted-Body", None)
+            assert enc_type in {"XOR", None}, "Unknown server encryption!"
+            if enc_type == "XOR":
+                assert self.key, f"Key needed to decrypt server response!"
+                # print(f"Decrypting with ${self.key}:\n{data}")
+                data = bytewise_xor(data, self.key)
+                # print(f"Decrypt Result:\n{data}")
+            if res.getheader("Content-Encoding", None) == "gzip":
+                data = gzip.decompress(data)
+            obj = json.loads(data)
+            if self.postprocess is not None:
+                obj = self.postprocess(obj)
+            if not self.aborted:
+                self.result.emit(obj)
         except Exception as e:
-            self.error.emit(e)
+            if not self.aborted:
+                self.error.emit(e)
         finally:
+            # release references to the payload (e.g. pixel data)
+            self.data = None
             self.finished.emit()
 
     @classmethod
-    def request(cls, *args, **kwargs):
+    def request(cls, *args, is_long=False, **kwargs):
+        """Create request & function to start it in the short or long lane's workers."""
         req = cls(*args, **kwargs)
         if THREADED:
-            thread = QThread()
-            # NOTE: need to keep reference to thread or it gets destroyed
-            req.thread = thread
-            req.moveToThread(thread)
-            thread.started.connect(req.run)
-            req.finished.connect(thread.quit)
-            # NOTE: is this a memory leak?
-            # For some reason, deleteLater occurs while thread is still running, resulting in crash
-            # req.finished.connect(req.deleteLater)
-            # thread.finished.connect(thread.deleteLater)
-            return req, lambda: thread.start()
+            lane = long_lane if is_long else short_lane
+
+            def start():
+                with AsyncRequest.live_lock:
+                    AsyncRequest.live += 1
+                lane.start(RequestRunner(req))
+
+            return req, start
         else:
             return req, lambda: req.run()
 
 
+class RequestRunner(QRunnable):
+    def __init__(self, req: AsyncRequest):
+        """Runs request in a worker thread; deleted by the thread pool afterwards."""
+        super(RequestRunner, self).__init__()
+        self.req = req
+
+    def run(self):
+        try:
+            self.req.run()
+        finally:
+            with AsyncRequest.live_lock:
+                AsyncRequest.live -= 1
+            self.req = None
+
+
+# separate lanes so polling isn't stuck behind long-running generation requests
+short_lane = QThreadPool()
+short_lane.setMaxThreadCount(SHORT_WORKERS)
+long_lane = QThreadPool()
+long_lane.setMaxThreadCount(LONG_WORKERS)
+
+
+def request_stats():
+    """Diagnostics of requests in flight & worker threads."""
+    return {
+        "live_requests": AsyncRequest.live,
+        "short_threads": short_lane.activeThreadCount(),
+        "long_threads": long_lane.activeThreadCount(),
+        "idle_connections": sum(len(c) for c in http_pool.idle.values()),
+        "active_connections": len(http_pool.active),
+    }
+
+
+class EventStream(QObject):
+    event = pyqtSignal(str, object)
+    closed = pyqtSignal()
+
+    def __init__(self, url: str, key: str = None):
+        """Persistent connection receiving server-sent events from the backend.
+
+        Runs in its own thread until `stop()` is called or the connection drops.
+
+        Args:
+            url (str): URL of the event stream.
+            key (Union[str, None], optional): Key to decrypt events with. Defaults to None.
+        """
+        super(EventStream, self).__init__()
+        self.url = url
+        self.handle = AbortHandle()
+        self.key = None
+        if isinstance(key, str) and key.strip() != "":
+            self.key = key.strip().encode("utf-8")
+        self.id = None
+        """Subscription id, used to send control messages."""
+        self.error = None
+        self.running = True
+        self.conn = None
+        self.sock = None
+
+    def stop(self, abort=False):
+        """Stop after the next event or ping, or immediately if `abort`."""
+        self.running = False
+        if abort and self.sock is not None:
+            try:
+                self.sock.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+
+    def _dispatch(self, event: str, data: str):
+        if self.key is not None:
+            data = bytewise_xor(b64decode(data), self.key)
+        obj = json.loads(data)
+        if event == "hello":
+            self.id = obj["id"]
+        self.event.emit(event, obj)
+
+    def run(self):
+        headers = {"Accept": "text/event-stream"}
+        if self.key is not None:
+            headers["X-Encrypted-Body"] = "XOR"
+        parsed = urlparse(self.url)
+        cls = HTTPSConnection if parsed.scheme == "https" else HTTPConnection
+        # not pooled, as it is held open indefinitely
+        self.conn = cls(parsed.hostname, parsed.port, timeout=EVENTS_TIMEOUT)
+        try:
+            self.conn.request("GET", f"{parsed.path}?{parsed.query}", headers=headers)
+            # conn.sock is unset once the response is known to end with the connection
+            self.sock = self.conn.sock
+            res = self.conn.getresponse()
+            if res.status != 200:
+                raise HTTPError(self.url, res.status, res.reason, res.headers, None)
+            event, data = "message", []
+            for line in res:
+                if not self.running:
+                    break
+                line = line.decode("utf-8").rstrip("\r\n")
+                if line == "":
+                    if data:
+                        self._dispatch(event, "\n".join(data))
+                    event, data = "message", []
+                elif line.startswith("event:"):
+                    event = line[6:].strip()
+                elif line.startswith("data:"):
+                    data.append(line[5:].lstrip())
+                # lines starting with ":" are pings
+        except Exception as e:
+            self.error = e
+        finally:
+            self.conn.close()
+            self.closed.emit()
+
+    @classmethod
+    def open(cls, *args, **kwargs):
+        stream = cls(*args, **kwargs)
+        thread = QThread()
+        # NOTE: need to keep reference to thread or it gets destroyed
+        stream.thread = thread
+        stream.moveToThread(thread)
+        thread.started.connect(stream.run)
+        stream.closed.connect(thread.quit)
+        return stream, lambda: thread.start()
+
+
+def job_ref(job_id: str):
+    """Public reference to a job, as listed in the backend's progress."""
+    return hashlib.sha256(job_id.encode("utf-8")).hexdigest()[:16]
+
+
+class Job:
+    def __init__(self):
+        """Handle to an image generation request, see `Client.post_generation()`.
+
+        The request may be split across backends & retried on others, so each
+        request to a backend has its own id, sent in the `X-Job-Id` header. That
+        lets the backend cancel it without interrupting other users' jobs.
+        """
+        self.requests: Dict[AsyncRequest, Tuple[str, str]] = {}
+        """In-flight requests mapped to the backend URL & job id they were sent with."""
+        self.cancelled = False
+
+
 class Client(QObject):
     status = pyqtSignal(str)
     config_updated = pyqtSignal()
+    event_received = pyqtSignal(str, object)
 
     def __init__(self, cfg: Config, ext_cfg: Config):
         """It is highly dependent on config's structure to the point it writes directly to it. :/"""
@@ -141,12 +547,28 @@ class Client(QObject):
         self.ext_cfg = ext_cfg
         self.short_reqs = set()
         self.long_reqs = set()
+        self.jobs = set()
+        """Image generation jobs that haven't finished, see `cancel_jobs()`."""
         # NOTE: this is a hacky workaround for detecting if backend is reachable
         self.is_connected = False
+        self.pool = BackendPool(cfg)
+        self.events = None
+        """Event stream to the primary backend, if open."""
+        self.events_unsupported = set()
+        """Event URLs that the backend doesn't have (older version/gateway)."""
+        self.session_id = uuid.uuid4().hex
+        """Sent with every request as `X-Session-Id`, so a gateway can tell plugin
+        instances behind the same address apart."""
 
     def handle_api_error(self, exc: Exception):
         """Handle exceptions that can occur while interacting with the backend."""
+        # the backend answered, so it is reachable; the request itself failed
+        if isinstance(exc, HTTPError):
+            self.status.emit(f"{STATE_BACKEND_ERROR}: {exc.code} {exc.reason}")
+            return
         self.is_connected = False
+        if self.pool.primary:
+            self.pool.primary.healthy = False
         try:
             # wtf python? socket raises an error that isnt an Exception??
             if isinstance(exc, socket.timeout):
@@ -169,7 +591,14 @@ class Client(QObject):
             assert False, e
 
     def post(
-        self, route, body, cb, base_url=..., is_long=True, ignore_no_connection=False
+        self,
+        route,
+        body,
+        cb,
+        base_url=...,
+        is_long=True,
+        ignore_no_connection=False,
+        err_cb=None,
     ):
         if not ignore_no_connection and not self.is_connected:
             self.status.emit(ERR_NO_CONNECTION)
@@ -178,11 +607,31 @@ class Client(QObject):
         if not url:
             self.status.emit(ERR_BAD_URL)
             return
+        return self.request(url, body, cb, is_long, err_cb)
+
+    def request(
+        self,
+        url,
+        body,
+        cb,
+        is_long=True,
+        err_cb=None,
+        compress=False,
+        postprocess=None,
+        headers=...,
+    ):
+        """Send request to URL & track it. Errors go to `handle_api_error()` unless `err_cb` is given."""
+        headers = {} if headers is ... else dict(headers)
+        headers["X-Session-Id"] = self.session_id
         req, start = AsyncRequest.request(
             url,
             body,
             LONG_TIMEOUT if is_long else SHORT_TIMEOUT,
+            headers=headers,
             key=self.cfg("encryption_key"),
+            compress=compress,
+            postprocess=postprocess,
+            is_long=is_long,
         )
 
         if is_long:
@@ -193,13 +642,190 @@ class Client(QObject):
         def handler():
             self.long_reqs.discard(req)
             self.short_reqs.discard(req)
-            if is_long and len(self.long_reqs) == 0:
+            # cancelled requests are reported by whoever cancelled them
+            if is_long and len(self.long_reqs) == 0 and not req.aborted:
                 self.status.emit(STATE_DONE)
 
         req.result.connect(cb)
-        req.error.connect(lambda e: self.handle_api_error(e))
+        if err_cb is None:
+            req.error.connect(lambda e: self.handle_api_error(e))
+        else:
+            req.error.connect(err_cb)
         req.finished.connect(handler)
         start()
+        return req
+
+    def post_generation(self, route, params, cb, postprocess=None):
+        """Post image generation request to the least-loaded healthy backend(s).
+
+        If there are multiple healthy backends, `batch_count` is split across them
+        and the responses are merged, so `cb` is called once as if a single backend
+        was used. Requests that fail are retried on the next healthy backend.
+
+        Args:
+            route (str): Route to post to.
+            params (dict): Request body.
+            cb (Callable): Called with the (merged) response, unless the job is cancelled.
+            postprocess (Callable, optional): Applied to each response in the worker thread. Defaults to None.
+
+        Returns:
+            Job: Handle to cancel the job with, or None if no backend is available.
+        """
+        self.pool.sync()
+        backends = self.pool.healthy()
+        if len(backends) == 0:
+            self.status.emit(ERR_NO_CONNECTION)
+            return None
+
+        count = params.get("batch_count", 1)
+        parts = split_batch(count, len(backends))
+        results = [None] * len(parts)
+        remaining = len(parts)
+        job = Job()
+        self.jobs.add(job)
+
+        def part_done(i, resp):
+            nonlocal remaining
+            results[i] = resp
+            remaining -= 1
+            if remaining == 0:
+                self.jobs.discard(job)
+                resps = [r for r in results if r is not None]
+                if len(resps) > 0:
+                    cb(merge_responses(resps))
+
+        # seeds are incremented by 1 for each image rendered, so offset them to
+        # get the same images as if the batch wasn't split
+        offset = 0
+        for i, n in enumerate(parts):
+            part = dict(params)
+            if len(parts) > 1:
+                part["batch_count"] = n
+                for k in ("seed", "subseed"):
+                    if part.get(k, -1) != -1:
+                        part[k] += offset
+            offset += n * params.get("batch_size", 1)
+            self.post_with_failover(
+                route, part, partial(part_done, i), postprocess=postprocess, job=job
+            )
+        return job
+
+    def post_with_failover(
+        self,
+        route,
+        body,
+        cb,
+        tried=(),
+        postprocess=None,
+        job: Job = None,
+        full_upload=False,
+    ):
+        """Post to least-loaded healthy backend, retrying on others if it fails.
+
+        `cb` is called with the response, or None if all backends failed. Requests
+        are tracked by `job` if given, so they can be cancelled. Images in `body`
+        (see `ImageUpload`) are sent as tiles to backends with a tile session; if
+        the backend lacks tiles it should have, the request is retried uploading all
+        tiles (`full_upload`).
+        """
+        if job is not None and job.cancelled:
+            return
+        backend = self.pool.pick(exclude=tried)
+        if backend is None:
+            cb(None)
+            return
+        url = get_url(self.cfg, route, base=backend.url)
+        retry = partial(
+            self.post_with_failover, route, body, cb, postprocess=postprocess, job=job
+        )
+        if not url:
+            backend.healthy = False
+            retry((*tried, backend.url))
+            return
+
+        def on_error(e):
+            missing_tiles = (
+                isinstance(e, HTTPError)
+                and e.code == 409
+                and e.headers.get("X-Missing-Tiles", None) is not None
+            )
+            if missing_tiles and not full_upload:
+                # backend evicted tiles or restarted, so resend all of them
+                if backend.tiles is not None:
+                    backend.tiles.reset()
+                self.post_with_failover(
+                    route, body, cb, tried, postprocess, job, full_upload=True
+                )
+                return
+            if isinstance(e, HTTPError):
+                # the request is at fault (e.g. validation error, OOM), so other
+                # backends would fail the same way
+                self.handle_api_error(e)
+                cb(None)
+                return
+            backend.healthy = False
+            if self.pool.pick(exclude=(*tried, backend.url)) is None:
+                self.handle_api_error(e)
+            retry((*tried, backend.url))
+
+        def on_finished():
+            backend.pending -= 1
+            if job is not None:
+                job.requests.pop(req, None)
+
+        backend.pending += 1
+        compress = self.cfg("compress_requests", bool) and "gzip" in backend.encodings
+        tiles = backend.tiles if self.cfg("sync_tiles", bool) else None
+        sent = {
+            k: v.to(tiles) if isinstance(v, ImageUpload) else v
+            for k, v in body.items()
+        }
+        job_id = uuid.uuid4().hex
+        req = self.request(
+            url,
+            sent,
+            cb,
+            err_cb=on_error,
+            compress=compress,
+            postprocess=postprocess,
+            headers={"X-Job-Id": job_id},
+        )
+        if job is not None:
+            job.requests[req] = (backend.url, job_id)
+        req.finished.connect(on_finished)
+
+    def probe_backends(self, include_primary=True):
+        """Check which backends are reachable and how busy they are.
+
+        Args:
+            include_primary (bool, optional): Whether to probe the primary backend too, which `get_health()` already does. Defaults to True.
+        """
+        self.pool.sync()
+        for backend in self.pool.backends.values():
+            if not include_primary and backend is self.pool.primary:
+                continue
+            url = get_url(
+                self.cfg,
+                "progress?skip_current_image=true",
+                prefix=OFFICIAL_ROUTE_PREFIX,
+                base=backend.url,
+            )
+            if backend.probing or not url:
+                continue
+            backend.probing = True
+
+            def cb(obj, backend=backend):
+                backend.healthy = True
+                backend.busy = 1 if obj["state"]["job_count"] > 0 else 0
+
+            def on_error(e, backend=backend):
+                backend.healthy = False
+
+            def on_finished(backend=backend):
+                backend.probing = False
+
+            req = self.request(url, None, cb, is_long=False, err_cb=on_error)
+            req.finished.connect(on_finished)
 
     def get(self, route, cb, base_url=..., is_long=False, ignore_no_connection=False):
         self.post(
@@ -211,31 +837,31 @@ class Client(QObject):
             ignore_no_connection=ignore_no_connection,
         )
 
-    def common_params(self, has_selection):
+    def common_params(self, has_selection, cfg: ConfigSnapshot):
         """Parameters nearly all the post routes share."""
-        tiling = self.cfg("sd_tiling", bool) and not (
-            self.cfg("only_full_img_tiling", bool) and has_selection
+        tiling = cfg("sd_tiling", bool) and not (
+            cfg("only_full_img_tiling", bool) and has_selection
         )
 
         # its fine to stuff extra stuff here; pydantic will shave off irrelevant params
         params = dict(
-            sd_model=self.cfg("sd_model", str),
-            sd_vae=self.cfg("sd_vae", str),
-            clip_skip=self.cfg("clip_skip", int),
-            batch_count=self.cfg("sd_batch_count", int),
-            batch_size=self.cfg("sd_batch_size", int),
-            base_size=self.cfg("sd_base_size", int),
-            max_size=self.cfg("sd_max_size", int),
-            disable_sddebz_highres=self.cfg("disable_sddebz_highres", bool),
+            sd_model=cfg("sd_model", str),
+            sd_vae=cfg("sd_vae", str),
+            clip_skip=cfg("clip_skip", int),
+            batch_count=cfg("sd_batch_count", int),
+            batch_size=cfg("sd_batch_size", int),
+            base_size=cfg("sd_base_size", int),
+            max_size=cfg("sd_max_size", int),
+            disable_sddebz_highres=cfg("disable_sddebz_highres", bool),
             tiling=tiling,
-            upscaler_name=self.cfg("upscaler_name", str),
-            restore_faces=self.cfg("face_restorer_model", str) != "None",
-            face_restorer=self.cfg("face_restorer_model", str),
-            codeformer_weight=self.cfg("codeformer_weight", float),
-            filter_nsfw=self.cfg("filter_nsfw", bool),
-            do_exact_steps=self.cfg("do_exact_steps", bool),
-            include_grid=self.cfg("include_grid", bool),
-            save_samples=self.cfg("save_temp_images", bool),
+            upscaler_name=cfg("upscaler_name", str),
+            restore_faces=cfg("face_restorer_model", str) != "None",
+            face_restorer=cfg("face_restorer_model", str),
+            codeformer_weight=cfg("codeformer_weight", float),
+            filter_nsfw=cfg("filter_nsfw", bool),
+            do_exact_steps=cfg("do_exact_steps", bool),
+            include_grid=cfg("include_grid", bool),
+            save_samples=cfg("save_temp_images", bool),
         )
         return params
 
@@ -289,120 +915,351 @@ class Client(QObject):
                             self.ext_cfg.set(key, opt["val"])
 
             self.is_connected = True
+            self.pool.sync()
+            self.pool.primary.healthy = True
+            # older backends don't accept compressed requests
+            self.pool.primary.encodings = obj.get("encodings", [])
+            # nor tiles; keep the session so tiles already sent aren't resent
+            if not obj.get("tile_sync", {}).get("enabled", False):
+                self.pool.primary.tiles = None
+            elif self.pool.primary.tiles is None:
+                self.pool.primary.tiles = TileSession()
             self.status.emit(STATE_READY)
             self.config_updated.emit()
 
         self.get("config", cb, ignore_no_connection=True)
 
-    def post_txt2img(self, cb, width, height, has_selection):
+    def get_health(self, cb, err_cb):
+        """Cheap check of the primary backend, see `/health` on the backend.
+
+        Unlike `get_config()`, this doesn't update config or `is_connected` on success;
+        the caller decides whether a full config fetch is needed.
+
+        Args:
+            cb (Callable[[dict], None]): Called with health info.
+            err_cb (Callable[[Exception], None]): Called if the backend is unreachable or too old to have `/health`.
+
+        Returns:
+            AsyncRequest: Request, or None if the backend URL is invalid.
+        """
+
+        def on_result(obj):
+            self.pool.sync()
+            if self.pool.primary:
+                self.pool.primary.healthy = True
+                self.pool.primary.busy = 1 if obj["busy"] else 0
+            cb(obj)
+
+        return self.post(
+            "health",
+            None,
+            on_result,
+            is_long=False,
+            ignore_no_connection=True,
+            err_cb=err_cb,
+        )
+
+    def stage_params(self, stage, seed, cfg: ConfigSnapshot):
+        """Params of a stage of draft-then-refine generation or explore mode.
+
+        Stages:
+        - "draft": Same as "refine" but at reduced steps & resolution.
+        - "refine": Full render.
+        - "explore": Batch of small candidates, returned at the size rendered at.
+        - "pick": Full render of a single candidate.
+
+        Args:
+            stage (str): Stage.
+            seed (int): Seed, which is what the stages of a generation share.
+            cfg (ConfigSnapshot): Config.
+        """
+        params = dict(
+            seed=seed,
+            draft=stage in {"draft", "explore"},
+            draft_steps_ratio=cfg("draft_steps_ratio", float),
+            draft_size_ratio=cfg("draft_size_ratio", float),
+        )
+        if stage == "explore":
+            params.update(
+                draft_keep_size=True,
+                draft_size_ratio=cfg("explore_size_ratio", float),
+                batch_count=1,
+                batch_size=cfg("explore_count", int),
+                include_grid=False,
+            )
+        elif stage == "pick":
+            params.update(batch_count=1, batch_size=1)
+        return params
+
+    def post_txt2img(
+        self,
+        cb,
+        width,
+        height,
+        has_selection,
+        postprocess=None,
+        stage=None,
+        stage_seed=None,
+    ):
+        cfg = self.cfg.snapshot()
         params = dict(orig_width=width, orig_height=height)
-        if not self.cfg("just_use_yaml", bool):
+        if not cfg("just_use_yaml", bool):
             seed = (
-                int(self.cfg("txt2img_seed", str))  # Qt casts int as 32-bit int
-                if not self.cfg("txt2img_seed", str).strip() == ""
+                int(cfg("txt2img_seed", str))  # Qt casts int as 32-bit int
+                if not cfg("txt2img_seed", str).strip() == ""
                 else -1
             )
-            ext_name = self.cfg("txt2img_script", str)
-            ext_args = get_ext_args(self.ext_cfg, "scripts_txt2img", ext_name)
-            params.update(self.common_params(has_selection))
+            ext_name = cfg("txt2img_script", str)
+            ext_args = get_ext_args(
+                self.ext_cfg.snapshot(), "scripts_txt2img", ext_name
+            )
+            params.update(self.common_params(has_selection, cfg))
             params.update(
-                prompt=fix_prompt(self.cfg("txt2img_prompt", str)),
-                negative_prompt=fix_prompt(self.cfg("txt2img_negative_prompt", str)),
-                sampler_name=self.cfg("txt2img_sampler", str),
-                steps=self.cfg("txt2img_steps", int),
-                cfg_scale=self.cfg("txt2img_cfg_scale", float),
+                prompt=fix_prompt(cfg("txt2img_prompt", str)),
+                negative_prompt=fix_prompt(cfg("txt2img_negative_prompt", str)),
+                sampler_name=cfg("txt2img_sampler", str),
+                steps=cfg("txt2img_steps", int),
+                cfg_scale=cfg("txt2img_cfg_scale", float),
                 seed=seed,
-                highres_fix=self.cfg("txt2img_highres", bool),
-                denoising_strength=self.cfg("txt2img_denoising_strength", float),
+                highres_fix=cfg("txt2img_highres", bool),
+                denoising_strength=cfg("txt2img_denoising_strength", float),
                 script=ext_name,
                 script_args=ext_args,
             )
+        if stage is not None:
+            params.update(self.stage_params(stage, stage_seed, cfg))
 
-        self.post("txt2img", params, cb)
+        return self.post_generation("txt2img", params, cb, postprocess)
 
-    def post_img2img(self, cb, src_img, mask_img, has_selection):
-        params = dict(is_inpaint=False, src_img=img_to_b64(src_img))
-        if not self.cfg("just_use_yaml", bool):
+    def deferred_b64(self, img: Deferred, cfg: ConfigSnapshot):
+        """Encode image to base64 in the request's worker thread."""
+        compression = cfg("png_compression", int)
+        return Deferred(lambda: img_to_b64(img(), compression))
+
+    def deferred_upload(self, img: Deferred, cfg: ConfigSnapshot):
+        """Like `deferred_b64()`, but sent as tiles to backends with a tile session."""
+        return ImageUpload(img, cfg("png_compression", int), SYNC_TILE_SIZE)
+
+    def post_img2img(
+        self,
+        cb,
+        src_img,
+        mask_img,
+        has_selection,
+        postprocess=None,
+        stage=None,
+        stage_seed=None,
+    ):
+        cfg = self.cfg.snapshot()
+        params = dict(is_inpaint=False, src_img=self.deferred_upload(src_img, cfg))
+        if not cfg("just_use_yaml", bool):
             seed = (
-                int(self.cfg("img2img_seed", str))  # Qt casts int as 32-bit int
-                if not self.cfg("img2img_seed", str).strip() == ""
+                int(cfg("img2img_seed", str))  # Qt casts int as 32-bit int
+                if not cfg("img2img_seed", str).strip() == ""
                 else -1
             )
-            ext_name = self.cfg("img2img_script", str)
-            ext_args = get_ext_args(self.ext_cfg, "scripts_img2img", ext_name)
-            params.update(self.common_params(has_selection))
+            ext_name = cfg("img2img_script", str)
+            ext_args = get_ext_args(
+                self.ext_cfg.snapshot(), "scripts_img2img", ext_name
+            )
+            params.update(self.common_params(has_selection, cfg))
             params.update(
-                prompt=fix_prompt(self.cfg("img2img_prompt", str)),
-                negative_prompt=fix_prompt(self.cfg("img2img_negative_prompt", str)),
-                sampler_name=self.cfg("img2img_sampler", str),
-                steps=self.cfg("img2img_steps", int),
-                cfg_scale=self.cfg("img2img_cfg_scale", float),
-                denoising_strength=self.cfg("img2img_denoising_strength", float),
-                color_correct=self.cfg("img2img_color_correct", bool),
+                prompt=fix_prompt(cfg("img2img_prompt", str)),
+                negative_prompt=fix_prompt(cfg("img2img_negative_prompt", str)),
+                sampler_name=cfg("img2img_sampler", str),
+                steps=cfg("img2img_steps", int),
+                cfg_scale=cfg("img2img_cfg_scale", float),
+                denoising_strength=cfg("img2img_denoising_strength", float),
+                color_correct=cfg("img2img_color_correct", bool),
+                tiled=cfg("img2img_tiled", bool),
                 script=ext_name,
                 script_args=ext_args,
                 seed=seed,
             )
+        if stage is not None:
+            params.update(self.stage_params(stage, stage_seed, cfg))
 
-        self.post("img2img", params, cb)
+        return self.post_generation("img2img", params, cb, postprocess)
 
-    def post_inpaint(self, cb, src_img, mask_img, has_selection):
+    def post_inpaint(self, cb, src_img, mask_img, has_selection, postprocess=None):
+        cfg = self.cfg.snapshot()
         assert mask_img, "Inpaint layer is needed for inpainting!"
         params = dict(
-            is_inpaint=True, src_img=img_to_b64(src_img), mask_img=img_to_b64(mask_img)
+            is_inpaint=True,
+            src_img=self.deferred_upload(src_img, cfg),
+            mask_img=self.deferred_upload(mask_img, cfg),
         )
-        if not self.cfg("just_use_yaml", bool):
+        if not cfg("just_use_yaml", bool):
             seed = (
-                int(self.cfg("inpaint_seed", str))  # Qt casts int as 32-bit int
-                if not self.cfg("inpaint_seed", str).strip() == ""
+                int(cfg("inpaint_seed", str))  # Qt casts int as 32-bit int
+                if not cfg("inpaint_seed", str).strip() == ""
                 else -1
             )
-            fill = self.cfg("inpaint_fill_list", "QStringList").index(
-                self.cfg("inpaint_fill", str)
+            fill = cfg("inpaint_fill_list", "QStringList").index(
+                cfg("inpaint_fill", str)
+            )
+            ext_name = cfg("inpaint_script", str)
+            ext_args = get_ext_args(
+                self.ext_cfg.snapshot(), "scripts_inpaint", ext_name
             )
-            ext_name = self.cfg("inpaint_script", str)
-            ext_args = get_ext_args(self.ext_cfg, "scripts_inpaint", ext_name)
-            params.update(self.common_params(has_selection))
+            params.update(self.common_params(has_selection, cfg))
             params.update(
-                prompt=fix_prompt(self.cfg("inpaint_prompt", str)),
-                negative_prompt=fix_prompt(self.cfg("inpaint_negative_prompt", str)),
-                sampler_name=self.cfg("inpaint_sampler", str),
-                steps=self.cfg("inpaint_steps", int),
-                cfg_scale=self.cfg("inpaint_cfg_scale", float),
-                denoising_strength=self.cfg("inpaint_denoising_strength", float),
-                color_correct=self.cfg("inpaint_color_correct", bool),
+                prompt=fix_prompt(cfg("inpaint_prompt", str)),
+                negative_prompt=fix_prompt(cfg("inpaint_negative_prompt", str)),
+                sampler_name=cfg("inpaint_sampler", str),
+                steps=cfg("inpaint_steps", int),
+                cfg_scale=cfg("inpaint_cfg_scale", float),
+                denoising_strength=cfg("inpaint_denoising_strength", float),
+                color_correct=cfg("inpaint_color_correct", bool),
                 script=ext_name,
                 script_args=ext_args,
                 seed=seed,
-                invert_mask=self.cfg("inpaint_invert_mask", bool),
-                # mask_blur=self.cfg("inpaint_mask_blur", int),
+                invert_mask=cfg("inpaint_invert_mask", bool),
+                # mask_blur=cfg("inpaint_mask_blur", int),
                 inpainting_fill=fill,
-                # inpaint_full_res=self.cfg("inpaint_full_res", bool),
-                # inpaint_full_res_padding=self.cfg("inpaint_full_res_padding", int),
-                inpaint_mask_weight=self.cfg("inpaint_mask_weight", float),
+                # inpaint_full_res=cfg("inpaint_full_res", bool),
+                # inpaint_full_res_padding=cfg("inpaint_full_res_padding", int),
+                inpaint_mask_weight=cfg("inpaint_mask_weight", float),
                 include_grid=False,  # it is never useful for inpaint mode
             )
 
-        self.post("img2img", params, cb)
+        return self.post_generation("img2img", params, cb, postprocess)
 
-    def post_upscale(self, cb, src_img):
+    def post_upscale(self, cb, src_img, postprocess=None):
+        cfg = self.cfg.snapshot()
         params = (
             {
-                "src_img": img_to_b64(src_img),
-                "upscaler_name": self.cfg("upscale_upscaler_name", str),
-                "downscale_first": self.cfg("upscale_downscale_first", bool),
+                "src_img": self.deferred_b64(src_img, cfg),
+                "upscaler_name": cfg("upscale_upscaler_name", str),
+                "downscale_first": cfg("upscale_downscale_first", bool),
             }
-            if not self.cfg("just_use_yaml", bool)
-            else {"src_img": img_to_b64(src_img)}
+            if not cfg("just_use_yaml", bool)
+            else {"src_img": self.deferred_b64(src_img, cfg)}
         )
-        self.post("upscale", params, cb)
+        return self.post_generation("upscale", params, cb, postprocess)
 
-    def post_interrupt(self, cb):
+    def post_interrupt(self, cb, base_url=...):
+        """Interrupt whatever the backend is generating, even other users' jobs."""
         # get official API url
-        url = get_url(self.cfg, prefix=OFFICIAL_ROUTE_PREFIX)
+        url = get_url(self.cfg, prefix=OFFICIAL_ROUTE_PREFIX, base=base_url)
         self.post("interrupt", {}, cb, base_url=url)
 
-    def get_progress(self, cb):
-        # get official API url
-        url = get_url(self.cfg, prefix=OFFICIAL_ROUTE_PREFIX)
-        self.get("progress", cb, base_url=url)
+    def cancel_job(self, job: Job):
+        """Cancel job on its backends & abort its requests in flight.
+
+        Queued requests are removed from the backend's queue & running ones are
+        interrupted, without affecting other users' jobs. Backends too old to cancel
+        jobs are interrupted instead.
+        """
+        job.cancelled = True
+        self.jobs.discard(job)
+        for req, (base_url, job_id) in list(job.requests.items()):
+            url = get_url(self.cfg, f"cancel/{job_id}", base=base_url)
+
+            def on_error(e, base_url=base_url):
+                if isinstance(e, HTTPError) and e.code == 404:
+                    self.post_interrupt(lambda _: None, base_url)
+
+            if url:
+                self.request(url, {}, lambda _: None, is_long=False, err_cb=on_error)
+            # closing the connection alone doesn't stop the job on the backend
+            req.abort()
+
+    def job_refs(self):
+        """Public references of this plugin instance's requests in flight."""
+        return {
+            job_ref(job_id)
+            for job in self.jobs
+            for _, job_id in job.requests.values()
+        }
+
+    def cancel_jobs(self):
+        """Cancel all unfinished jobs of this plugin instance.
+
+        Returns:
+            int: Number of jobs cancelled.
+        """
+        jobs = list(self.jobs)
+        for job in jobs:
+            self.cancel_job(job)
+        return len(jobs)
+
+    @property
+    def events_connected(self):
+        """Whether progress is being pushed by the backend, so polling isn't needed."""
+        return self.events is not None and self.events.id is not None
+
+    def open_events(self, preview=False):
+        """Open event stream to the primary backend, if not already open.
+
+        Args:
+            preview (bool, optional): Whether live preview should be pushed. Defaults to False.
+        """
+        url = get_url(self.cfg, "events")
+        if not THREADED or not url or url in self.events_unsupported:
+            return
+        if self.events is not None:
+            if self.events.url.split("?")[0] == url:
+                return
+            # base_url changed
+            self.close_events()
+
+        query = urlencode(
+            dict(
+                preview=str(preview).lower(),
+                max_size=PREVIEW_MAX_SIZE,
+                format=PREVIEW_FORMAT,
+            )
+        )
+        stream, start = EventStream.open(f"{url}?{query}", self.cfg("encryption_key"))
+
+        def on_closed():
+            if isinstance(stream.error, HTTPError) and stream.error.code == 404:
+                self.events_unsupported.add(url)
+            if self.events is stream:
+                self.events = None
+
+        stream.event.connect(self.event_received.emit)
+        stream.closed.connect(on_closed)
+        self.events = stream
+        start()
+
+    def close_events(self):
+        if self.events is not None:
+            self.events.stop()
+            self.events = None
+
+    def shutdown(self):
+        """Abort all requests so worker threads can exit, e.g. when Krita quits."""
+        if self.events is not None:
+            self.events.stop(abort=True)
+            self.events.thread.wait(1000)
+            self.events = None
+        http_pool.clear()
+        short_lane.waitForDone(1000)
+        long_lane.waitForDone(1000)
+
+    def post_event_control(self, action, cb=None, **kwargs):
+        """Send control message over the event stream's subscription.
+
+        Returns:
+            bool: Whether the message was sent.
+        """
+        if not self.events_connected:
+            return False
+        self.post(
+            f"events/{self.events.id}",
+            dict(action=action, **kwargs),
+            cb if cb else lambda _: None,
+            is_long=False,
+        )
+        return True
+
+    def get_progress(self, cb, preview=False, last_id=None):
+        """Get progress & (if requested) live preview, if it changed since `last_id`."""
+        params = dict(preview=str(preview).lower())
+        if preview:
+            params.update(max_size=PREVIEW_MAX_SIZE, format=PREVIEW_FORMAT)
+            if last_id is not None:
+                params.update(last_id=last_id)
+        self.get(f"progress?{urlencode(params)}", cb)
@@ -1,12 +1,95 @@
+import threading
 from dataclasses import asdict
-from typing import Any
+from typing import Any, Callable, Dict, Iterable
 
-from krita import QObject, QReadWriteLock, QSettings
+from krita import QObject, QSettings, QTimer, QWidget, pyqtSignal
 
-from .defaults import CFG_FOLDER, CFG_NAME, DEFAULTS, ERR_MISSING_CONFIG
+from .defaults import (
+    CFG_FOLDER,
+    CFG_NAME,
+    CFG_PERSIST_DELAY,
+    DEFAULTS,
+    ERR_MISSING_CONFIG,
+)
+
+
+def cast(val: Any, type: type = str):
+    """Cast config value like `QSettings.value(key, type=type)` would.
+
+    Values loaded from the INI file are strings (or lists of strings), while values
+    set at runtime keep their Python type, so both have to be handled.
+
+    Args:
+        val (Any): Config value.
+        type (type, optional): Type to cast to, or "QStringList". Defaults to str.
+
+    Returns:
+        Any: Casted value.
+    """
+    if type == "QStringList":
+        if val is None or val == "":
+            return []
+        return [str(v) for v in val] if isinstance(val, (list, tuple)) else [str(val)]
+    if val is None:
+        return type()
+    if type is bool and isinstance(val, str):
+        return val.lower() == "true"
+    if type is int and isinstance(val, str):
+        return int(float(val))
+    return type(val)
+
+
+def same_value(stored: Any, val: Any):
+    """Whether a stored config value is equal to `val` once cast to the type of `val`.
+
+    Stored values loaded from the INI file are strings (e.g. "true" or "30"), so
+    comparing them as is would count setting the same value as a change.
+    """
+    if stored is None or val is None:
+        return stored == val
+    type = "QStringList" if isinstance(val, (list, tuple)) else val.__class__
+    try:
+        return cast(stored, type) == cast(val, type)
+    except (TypeError, ValueError):
+        return False
+
+
+class ConfigSnapshot:
+    def __init__(self, values: Dict[str, Any], model=None):
+        """Read-only copy of config values, with the same interface as `Config`.
+
+        Args:
+            values (Dict[str, Any]): Config values.
+            model (Any, optional): Data model used to check keys exist. Defaults to None.
+        """
+        self.values = values
+        self.model = model
+
+    def __call__(self, key: str, type: type = str):
+        """Shorthand for ConfigSnapshot.get()"""
+        return self.get(key, type)
+
+    def get(self, key: str, type: type = str):
+        if self.model is not None:
+            assert key in self.values and hasattr(self.model, key), ERR_MISSING_CONFIG
+        return cast(self.values.get(key, None), type)
+
+
+class Subscription:
+    def __init__(self, keys: Iterable[str], cb: Callable[[], None], owner: QWidget):
+        """Callback to run when any of the keys change. See `Config.subscribe()`."""
+        self.keys = frozenset(keys)
+        self.cb = cb
+        self.owner = owner
+        self.dirty = False
+        """Whether keys changed while the owner was hidden."""
+        self.active = True
 
 
 class Config(QObject):
+    changed = pyqtSignal(object)
+    """Emitted with the set of keys that changed, at most once per event loop tick."""
+
     def __init__(self, folder=CFG_FOLDER, name=CFG_NAME, model=DEFAULTS):
         """Sorta like a controller for QSettings.
 
@@ -14,6 +97,9 @@ class Config(QObject):
         correctly such that it should be theoretically possible to have multiple
         instances (maybe multiple dockers controlling multiple remotes?)
 
+        Values are kept in memory; reads don't touch QSettings and writes are
+        persisted to it in batches after `CFG_PERSIST_DELAY` ms of no writes.
+
         If model is None, Config will not check if keys exist.
 
         Args:
@@ -21,12 +107,28 @@ class Config(QObject):
             name (str, optional): Name of settings file. Defaults to CFG_NAME.
             model (Any, optional): Data model representing config & defaults. Defaults to DEFAULTS.
         """
-        # See: https://doc.qt.io/qt-6/qsettings.html#accessing-settings-from-multiple-threads-or-processes-simultaneously
-        # but im too lazy to figure out creating separate QSettings per worker, so we will just lock
         super(Config, self).__init__()
         self.model = model  # is immutable
-        self.lock = QReadWriteLock()
         self.config = QSettings(QSettings.IniFormat, QSettings.UserScope, folder, name)
+        self.values: Dict[str, Any] = {
+            k: self.config.value(k) for k in self.config.allKeys()
+        }
+        """In-memory config values. Reads are lock-free; it is only ever updated per key."""
+        # See: https://doc.qt.io/qt-6/qsettings.html#accessing-settings-from-multiple-threads-or-processes-simultaneously
+        # only the persist timer (main thread) touches QSettings after init, guarded by this lock
+        self.lock = threading.Lock()
+        self.dirty = set()
+        self.persist_timer = QTimer(self)
+        self.persist_timer.setSingleShot(True)
+        self.persist_timer.setInterval(CFG_PERSIST_DELAY)
+        self.persist_timer.timeout.connect(lambda: self.flush())
+        # changes are coalesced & dispatched on the next event loop tick
+        self.changed_keys = set()
+        self.subscriptions = []
+        self.notify_timer = QTimer(self)
+        self.notify_timer.setSingleShot(True)
+        self.notify_timer.setInterval(0)
+        self.notify_timer.timeout.connect(lambda: self._notify())
 
         # add in new config settings
         self.restore_defaults(overwrite=False)
@@ -45,17 +147,18 @@ class Config(QObject):
         Returns:
             Any: Config value.
         """
-        self.lock.lockForRead()
-        try:
-            # notably QSettings assume strings too unless specified
-            if self.model is not None:
-                assert self.config.contains(key) and hasattr(
-                    self.model, key
-                ), ERR_MISSING_CONFIG
-            val = self.config.value(key, type=type)
-            return val
-        finally:
-            self.lock.unlock()
+        if self.model is not None:
+            assert key in self.values and hasattr(self.model, key), ERR_MISSING_CONFIG
+        return cast(self.values.get(key, None), type)
+
+    def snapshot(self):
+        """Consistent read-only copy of the config, e.g. for building a request.
+
+        Returns:
+            ConfigSnapshot: Snapshot.
+        """
+        # copying a dict is atomic under the GIL
+        return ConfigSnapshot(dict(self.values), self.model)
 
     def set(self, key: str, val: Any, overwrite: bool = True):
         """Set config value by key.
@@ -65,14 +168,89 @@ class Config(QObject):
             val (Any): Config value.
             overwrite (bool, optional): Whether to overwrite an existing value. Defaults to False.
         """
-        self.lock.lockForWrite()
-        try:
-            if self.model is not None:
-                assert hasattr(self.model, key), ERR_MISSING_CONFIG
-            if overwrite or not self.config.contains(key):
-                self.config.setValue(key, val)
-        finally:
-            self.lock.unlock()
+        if self.model is not None:
+            assert hasattr(self.model, key), ERR_MISSING_CONFIG
+        if not overwrite and key in self.values:
+            return
+        if key in self.values and same_value(self.values[key], val):
+            return
+        self.values[key] = val
+        with self.lock:
+            self.dirty.add(key)
+        # restarts the timer if already active, so rapid writes (typing) are batched
+        self.persist_timer.start()
+        self.changed_keys.add(key)
+        self.notify_timer.start()
+
+    def flush(self):
+        """Persist changed values to QSettings now."""
+        self.persist_timer.stop()
+        with self.lock:
+            keys, self.dirty = self.dirty, set()
+            for k in keys:
+                if k in self.values:
+                    self.config.setValue(k, self.values[k])
+                else:
+                    self.config.remove(k)
+            self.config.sync()
+
+    def clear(self):
+        """Remove all config values."""
+        self.changed_keys.update(self.values.keys())
+        self.notify_timer.start()
+        self.values.clear()
+        with self.lock:
+            self.dirty.clear()
+            self.config.remove("")
+
+    def subscribe(
+        self, keys: Iterable[str], cb: Callable[[], None], owner: QWidget = None
+    ):
+        """Call `cb` when any of the keys change.
+
+        While the owner is hidden (e.g. its docker is closed or tabbed away), `cb`
+        is deferred until it is visible again. The subscription is removed when the
+        owner is destroyed.
+
+        Args:
+            keys (Iterable[str]): Config keys to watch.
+            cb (Callable[[], None]): Callback, usually a widget's `cfg_init`.
+            owner (QWidget, optional): Widget displaying the keys. Defaults to None.
+
+        Returns:
+            Subscription: Subscription.
+        """
+        sub = Subscription(keys, cb, owner)
+        self.subscriptions.append(sub)
+        if owner is not None:
+            owner.destroyed.connect(lambda: self.unsubscribe(sub))
+        return sub
+
+    def unsubscribe(self, sub: Subscription):
+        if sub.active:
+            sub.active = False
+            self.subscriptions.remove(sub)
+
+    def refresh(self):
+        """Run deferred callbacks whose owners became visible, on the next tick."""
+        self.notify_timer.start()
+
+    def _notify(self):
+        keys, self.changed_keys = self.changed_keys, set()
+        for sub in self.subscriptions:
+            if not sub.keys.isdisjoint(keys):
+                sub.dirty = True
+        # twice, as callbacks may reveal widgets that were skipped (e.g. minimize_ui)
+        for _ in range(2):
+            for sub in list(self.subscriptions):
+                # callbacks may destroy widgets (& hence subscriptions) of others
+                if not sub.active or not sub.dirty:
+                    continue
+                if sub.owner is None or sub.owner.isVisible():
+                    sub.dirty = False
+                    sub.cb()
+        if len(keys) > 0:
+            self.changed.emit(keys)
 
     def restore_defaults(self, overwrite: bool = True):
         """Reset settings to default.
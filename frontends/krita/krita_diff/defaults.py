@@ -8,6 +8,7 @@ ERROR_MSG = "Retrieval Failed"
 STATE_READY = "Ready"
 STATE_INIT = "Errors will be shown here"
 STATE_URLERROR = "Network error"
+STATE_BACKEND_ERROR = "Backend error"
 STATE_RESET_DEFAULT = "All settings reset"
 STATE_WAIT = "Please wait..."
 STATE_DONE = "Done!"
@@ -16,11 +17,26 @@ STATE_INTERRUPT = "Interrupted!"
 # Other currently hardcoded stuff
 SHORT_TIMEOUT = 10
 LONG_TIMEOUT = None  # requests that might take "forever", i.e., image generation with high batch count
-REFRESH_INTERVAL = 3000  # 3 seconds between auto-config refresh
+REFRESH_INTERVAL = 3000  # 3 seconds between health checks while generating
+HEALTH_IDLE_INTERVAL = 10000  # milliseconds between health checks while idle
+HEALTH_MAX_BACKOFF = 60000  # max milliseconds between health checks while backend is unreachable
 ETA_REFRESH_INTERVAL = 250  # milliseconds between eta refresh
+EXT_WIDGET_CACHE_SIZE = 4  # max script forms kept per tab, least recently selected are deleted
+SYNC_TILE_SIZE = 256  # pixels; size of tiles images are uploaded in, see tile_sync.py
+EXPLORE_ICON_SIZE = 96  # pixels; size of candidate thumbnails in the preview docker
+SHORT_WORKERS = 4  # max threads for short requests (config, progress, etc)
+LONG_WORKERS = 8  # max threads for long requests (image generation), more are queued locally
+COMPRESS_MIN_SIZE = 1024  # bytes; smaller request bodies aren't worth compressing
+COMPRESS_LEVEL = 6  # gzip level for request bodies
+POOL_MAX_IDLE = 4  # max idle keep-alive connections kept per backend
+POOL_IDLE_TIMEOUT = 30  # seconds before idle keep-alive connection is closed
+EVENTS_TIMEOUT = 15  # seconds without any event (backend pings every 5s) before event stream is considered dead
+PREVIEW_MAX_SIZE = 512  # max width/height of live preview requested from backend
+PREVIEW_FORMAT = "jpeg"  # codec of live preview requested from backend
 CFG_FOLDER = "krita"  # which folder in ~/.config to store config
 CFG_NAME = "krita_diff_plugin"  # name of config file
 EXT_CFG_NAME = "krita_diff_plugin_scripts"  # name of config file
+CFG_PERSIST_DELAY = 1000  # ms without config writes before they are saved to disk
 ADD_MASK_TIMEOUT = 50
 THREADED = True
 ROUTE_PREFIX = "/sdapi/interpause/"
@@ -45,6 +61,10 @@ TAB_PREVIEW = "krita_diff_preview"
 @dataclass(frozen=True)
 class Defaults:
     base_url: str = "http://127.0.0.1:7860"
+    extra_base_urls: str = ""  # comma-separated, image generation is spread across these too
+    compress_requests: bool = True  # gzip uploads if the backend supports it
+    sync_tiles: bool = True  # upload only changed tiles if the backend supports it
+    png_compression: int = 6  # zlib level (0-9) of uploaded images
     encryption_key: str = ""
     just_use_yaml: bool = False
     create_mask_layer: bool = True
@@ -60,6 +80,10 @@ class Defaults:
     hide_layers: bool = True
     no_groups: bool = False
     disable_sddebz_highres: bool = True
+    draft_steps_ratio: float = 0.3  # fraction of steps drafts are rendered with
+    draft_size_ratio: float = 0.5  # fraction of resolution drafts are rendered at
+    explore_count: int = 16  # candidates rendered by explore mode
+    explore_size_ratio: float = 0.25  # fraction of resolution candidates are rendered at
 
     sd_model_list: List[str] = field(default_factory=lambda: [ERROR_MSG])
     sd_model: str = "model.ckpt"
@@ -87,6 +111,7 @@ class Defaults:
     txt2img_denoising_strength: float = 0.7
     txt2img_seed: str = ""
     txt2img_highres: bool = False
+    txt2img_draft: bool = False
     txt2img_script: str = "None"
     txt2img_script_list: List[str] = field(default_factory=lambda: [ERROR_MSG])
     # TODO: Seed variation
@@ -100,6 +125,8 @@ class Defaults:
     img2img_denoising_strength: float = 0.8
     img2img_seed: str = ""
     img2img_color_correct: bool = False
+    img2img_tiled: bool = False
+    img2img_draft: bool = False
     img2img_script: str = "None"
     img2img_script_list: List[str] = field(default_factory=lambda: [ERROR_MSG])
 
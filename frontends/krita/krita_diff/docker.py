@@ -25,8 +25,19 @@ def create_docker(page):
             self.page_widget.cfg_init()
 
         def connect_interface(self):
+            # widgets subscribe to the config keys they display, see `Config.subscribe()`
             self.page_widget.cfg_connect()
-            script.config_updated.connect(lambda: self.update_interface())
+            # pages hide tips/titles based on minimize_ui outside of their widgets
+            script.cfg.subscribe(
+                ["minimize_ui"], self.update_interface, self.page_widget
+            )
+            self.visibilityChanged.connect(lambda v: self.refresh_interface(v))
+
+        def refresh_interface(self, visible):
+            """Apply config changes that were deferred while the docker was hidden."""
+            if visible:
+                script.cfg.refresh()
+                script.ext_cfg.refresh()
 
         def canvasChanged(self, canvas):
             pass
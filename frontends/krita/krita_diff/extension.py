@@ -1,6 +1,8 @@
+from urllib.error import HTTPError
+
 from krita import Extension, QMainWindow, QTimer
 
-from .defaults import REFRESH_INTERVAL
+from .defaults import HEALTH_IDLE_INTERVAL, HEALTH_MAX_BACKOFF, REFRESH_INTERVAL
 from .script import script
 
 
@@ -13,12 +15,58 @@ class SDPluginExtension(Extension):
         self.dock_opts = None
 
     def setup(self):
-        self.update_timer = QTimer()
-        self.update_timer.timeout.connect(lambda: script.action_update_config())
-        self.update_timer.start(REFRESH_INTERVAL)
+        # health monitor; polls the backend's cheap `/health` route and only fetches
+        # the full config when the backend (re)appears or says its config changed
+        self.health_timer = QTimer()
+        self.health_timer.setSingleShot(True)
+        self.health_timer.timeout.connect(lambda: self.check_health())
+        self.health_revision = None
+        self.health_backoff = 0
+        # a successful manual refresh ends the backoff early
+        script.client.config_updated.connect(lambda: self.reset_backoff())
         script.config_updated.connect(lambda: self.update_global())
         self.instance.notifier().windowCreated.connect(lambda: self.update_global())
-        script.action_update_config()
+        self.check_health()
+
+    def check_health(self):
+        def cb(obj):
+            self.health_backoff = 0
+            revision = (script.cfg("base_url", str), obj["revision"])
+            if not script.client.is_connected or revision != self.health_revision:
+                self.health_revision = revision
+                script.client.get_config()
+            script.client.probe_backends(include_primary=False)
+            idle = obj["queue"] == 0 and len(script.client.long_reqs) == 0
+            self.health_timer.start(HEALTH_IDLE_INTERVAL if idle else REFRESH_INTERVAL)
+
+        def err_cb(e):
+            if isinstance(e, HTTPError) and e.code == 404:
+                # backend predates `/health`; fall back to fetching the whole config
+                self.health_backoff = 0
+                script.action_update_config()
+                self.health_timer.start(REFRESH_INTERVAL)
+                return
+            self.health_revision = None
+            if script.client.pool.primary:
+                script.client.pool.primary.healthy = False
+            # report only the first failed probe, not every retry
+            if script.client.is_connected or self.health_backoff == 0:
+                script.client.handle_api_error(e)
+            self.health_backoff = min(
+                max(self.health_backoff * 2, REFRESH_INTERVAL), HEALTH_MAX_BACKOFF
+            )
+            script.client.probe_backends(include_primary=False)
+            self.health_timer.start(self.health_backoff)
+
+        if script.client.get_health(cb, err_cb) is None:
+            # invalid URL; the config page will trigger a refresh when it is fixed
+            self.health_backoff = HEALTH_MAX_BACKOFF
+            self.health_timer.start(self.health_backoff)
+
+    def reset_backoff(self):
+        if self.health_backoff > 0:
+            self.health_backoff = 0
+            self.health_timer.start(REFRESH_INTERVAL)
 
     def update_global(self):
         window = self.instance.activeWindow()
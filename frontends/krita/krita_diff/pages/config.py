@@ -5,7 +5,7 @@ from krita import QHBoxLayout, QLineEdit, QPushButton, QVBoxLayout, QWidget
 from ..defaults import DEFAULTS
 from ..script import script
 from ..utils import reset_docker_layout
-from ..widgets import QCheckBox, QLabel, QLineEditLayout, StatusBar
+from ..widgets import QCheckBox, QLabel, QLineEditLayout, QSpinBoxLayout, StatusBar
 
 
 class ConfigPage(QWidget):
@@ -25,6 +25,12 @@ class ConfigPage(QWidget):
         self.enc_key = QLineEditLayout(
             script.cfg, "encryption_key", "Optional Encryption Key"
         )
+        self.extra_base_urls = QLineEditLayout(
+            script.cfg,
+            "extra_base_urls",
+            "Extra backends:",
+            placeholder="http://host:7860, ...",
+        )
 
         # Plugin settings
         self.just_use_yaml = QCheckBox(
@@ -51,6 +57,37 @@ class ConfigPage(QWidget):
         )
         self.hide_layers = QCheckBox(script.cfg, "hide_layers", "Auto hide layers")
         self.no_groups = QCheckBox(script.cfg, "no_groups", "Don't create group layers")
+        self.compress_requests = QCheckBox(
+            script.cfg, "compress_requests", "Compress uploads"
+        )
+        self.sync_tiles = QCheckBox(
+            script.cfg, "sync_tiles", "Upload only changed tiles"
+        )
+        self.png_compression = QSpinBoxLayout(
+            script.cfg, "png_compression", "PNG compression:", min=0, max=9, step=1
+        )
+        self.draft_steps_ratio = QSpinBoxLayout(
+            script.cfg,
+            "draft_steps_ratio",
+            "Draft steps:",
+            min=0.05,
+            max=1.0,
+            step=0.05,
+        )
+        self.draft_size_ratio = QSpinBoxLayout(
+            script.cfg, "draft_size_ratio", "Draft size:", min=0.1, max=1.0, step=0.05
+        )
+        self.explore_count = QSpinBoxLayout(
+            script.cfg, "explore_count", "Explore candidates:", min=1, max=64, step=1
+        )
+        self.explore_size_ratio = QSpinBoxLayout(
+            script.cfg,
+            "explore_size_ratio",
+            "Explore size:",
+            min=0.1,
+            max=1.0,
+            step=0.05,
+        )
 
         # webUI/backend settings
         self.filter_nsfw = QCheckBox(script.cfg, "filter_nsfw", "Filter NSFW")
@@ -90,6 +127,13 @@ class ConfigPage(QWidget):
         layout_inner.addWidget(self.only_full_img_tiling)
         layout_inner.addWidget(self.include_grid)
         layout_inner.addWidget(self.save_temp_images)
+        layout_inner.addWidget(self.compress_requests)
+        layout_inner.addWidget(self.sync_tiles)
+        layout_inner.addLayout(self.png_compression)
+        layout_inner.addLayout(self.draft_steps_ratio)
+        layout_inner.addLayout(self.draft_size_ratio)
+        layout_inner.addLayout(self.explore_count)
+        layout_inner.addLayout(self.explore_size_ratio)
         # layout_inner.addWidget(self.just_use_yaml)
 
         layout_inner.addWidget(QLabel("<em>Backend/webUI settings:</em>"))
@@ -107,6 +151,7 @@ class ConfigPage(QWidget):
         layout.addWidget(QLabel("<em>Backend url:</em>"))
         layout.addLayout(inline1)
         layout.addLayout(self.enc_key)
+        layout.addLayout(self.extra_base_urls)
         layout.addLayout(layout_inner)
         layout.addWidget(self.refresh_btn)
         layout.addWidget(self.restore_defaults)
@@ -115,13 +160,16 @@ class ConfigPage(QWidget):
 
         self.setLayout(layout)
 
-    def cfg_init(self):
+    def _init_base_url(self):
         # NOTE: update timer -> cfg_init, setText seems to reset cursor position so we prevent it
         base_url = script.cfg("base_url", str)
         if self.base_url.text() != base_url:
             self.base_url.setText(base_url)
 
+    def cfg_init(self):
+        self._init_base_url()
         self.enc_key.cfg_init()
+        self.extra_base_urls.cfg_init()
         self.just_use_yaml.cfg_init()
         self.create_mask_layer.cfg_init()
         self.save_temp_images.cfg_init()
@@ -136,6 +184,13 @@ class ConfigPage(QWidget):
         self.alt_docker.cfg_init()
         self.hide_layers.cfg_init()
         self.no_groups.cfg_init()
+        self.compress_requests.cfg_init()
+        self.sync_tiles.cfg_init()
+        self.png_compression.cfg_init()
+        self.draft_steps_ratio.cfg_init()
+        self.draft_size_ratio.cfg_init()
+        self.explore_count.cfg_init()
+        self.explore_size_ratio.cfg_init()
 
         info_text = """
             <em>Tip:</em> Only a selected few backend/webUI settings are exposed above.<br/>
@@ -150,6 +205,7 @@ class ConfigPage(QWidget):
         self.info_label.setText(info_text)
 
     def cfg_connect(self):
+        script.cfg.subscribe(["base_url"], self._init_base_url, self.base_url)
         self.base_url.textChanged.connect(partial(script.cfg.set, "base_url"))
         # NOTE: this triggers on every keystroke; theres no focus lost signal...
         self.base_url.textChanged.connect(lambda: script.action_update_config())
@@ -157,6 +213,7 @@ class ConfigPage(QWidget):
             lambda: self.base_url.setText(DEFAULTS.base_url)
         )
         self.enc_key.cfg_connect()
+        self.extra_base_urls.cfg_connect()
         self.just_use_yaml.cfg_connect()
         self.create_mask_layer.cfg_connect()
         self.save_temp_images.cfg_connect()
@@ -171,6 +228,13 @@ class ConfigPage(QWidget):
         self.alt_docker.cfg_connect()
         self.hide_layers.cfg_connect()
         self.no_groups.cfg_connect()
+        self.compress_requests.cfg_connect()
+        self.sync_tiles.cfg_connect()
+        self.png_compression.cfg_connect()
+        self.draft_steps_ratio.cfg_connect()
+        self.draft_size_ratio.cfg_connect()
+        self.explore_count.cfg_connect()
+        self.explore_size_ratio.cfg_connect()
 
         def restore_defaults():
             script.restore_defaults()
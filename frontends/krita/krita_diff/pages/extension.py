@@ -1,10 +1,12 @@
 import json
+from collections import OrderedDict
 from functools import partial
 from typing import List
 
 from krita import QVBoxLayout, QWidget
 
 from ..config import Config
+from ..defaults import EXT_WIDGET_CACHE_SIZE
 from ..script import script
 from ..utils import get_ext_key
 from ..widgets import (
@@ -28,9 +30,12 @@ class ExtWidget(QWidget):
         super(ExtWidget, self).__init__(*args, **kwargs)
 
         get_key = partial(get_ext_key, ext_type, ext_name)
+        self.meta_key = get_key()
+        self.meta_raw = ext_cfg(self.meta_key)
+        """Metadata the form was built from; it has to be rebuilt if this changes."""
 
         try:
-            meta: List[dict] = json.loads(ext_cfg(get_key()))
+            meta: List[dict] = json.loads(self.meta_raw)
         except json.JSONDecodeError:
             meta = []
             print(f"Script metadata is invalid: {ext_cfg(get_key())}")
@@ -92,42 +97,67 @@ class ExtSectionLayout(QVBoxLayout):
 
         self.ext_type = f"scripts_{cfg_prefix}"
         self.ext_names = partial(script.cfg, f"{cfg_prefix}_script_list", "QStringList")
-        self.ext_widgets = {}
-
-    def _clear_ext_widgets(self):
-        """Properly delete all existing extension widgets."""
-        while len(self.ext_widgets) > 0:
-            _, widget = self.ext_widgets.popitem()
-            self.removeWidget(widget)
-            widget.setParent(None)
-            widget.deleteLater()
-
-    def _init_ext_widgets(self):
-        """Inits the UI, can be called multiple times if the ext scripts available changed."""
-        self._clear_ext_widgets()
-        for ext_name in self.ext_names():
+        self.ext_widgets: OrderedDict = OrderedDict()
+        """Forms of recently selected scripts, built on first selection (LRU)."""
+        self.selected = None
+
+    def _remove_ext_widget(self, ext_name: str):
+        """Properly delete extension widget."""
+        widget = self.ext_widgets.pop(ext_name)
+        self.removeWidget(widget)
+        widget.setParent(None)
+        widget.deleteLater()
+
+    def _get_ext_widget(self, ext_name: str):
+        """Get form for script, building it if it isn't cached or is outdated."""
+        widget = self.ext_widgets.get(ext_name, None)
+        if widget is not None and widget.meta_raw != script.ext_cfg(widget.meta_key):
+            self._remove_ext_widget(ext_name)
+            widget = None
+        if widget is None:
             widget = ExtWidget(script.ext_cfg, self.ext_type, ext_name)
             widget.setVisible(False)
             self.addWidget(widget)
             self.ext_widgets[ext_name] = widget
             widget.cfg_connect()
+            # rebuild the form if the script's options change while it is shown
+            script.ext_cfg.subscribe(
+                [widget.meta_key], lambda: self._update(self.selected), widget
+            )
+        self.ext_widgets.move_to_end(ext_name)
+        # evict least recently selected; the newest one is the one being shown
+        while len(self.ext_widgets) > EXT_WIDGET_CACHE_SIZE:
+            self._remove_ext_widget(next(iter(self.ext_widgets)))
+        return widget
+
+    def _sync_ext_widgets(self):
+        """Drop forms of scripts that are no longer available."""
+        ext_names = set(self.ext_names())
+        for ext_name in list(self.ext_widgets.keys()):
+            if ext_name not in ext_names:
+                self._remove_ext_widget(ext_name)
+        self._update(self.dropdown.qcombo.currentText())
 
     def cfg_init(self):
         self.dropdown.cfg_init()
-        if set(self.ext_names()) != set(self.ext_widgets.keys()):
-            self._init_ext_widgets()
-        for widget in self.ext_widgets.values():
-            widget.cfg_init()
+        self._sync_ext_widgets()
 
     def cfg_connect(self):
         self.dropdown.cfg_connect()
         self.dropdown.qcombo.currentTextChanged.connect(lambda s: self._update(s))
+        script.cfg.subscribe(
+            [self.dropdown.options_cfg], self._sync_ext_widgets, self.dropdown.qcombo
+        )
         self._update(self.dropdown.qcombo.currentText())
 
     def _update(self, selected):
         """Updates which extension widget is visible."""
         for w in self.ext_widgets.values():
             w.setVisible(False)
-        widget = self.ext_widgets.get(selected, None)
-        if widget and selected != "None":
-            widget.setVisible(True)
+        self.selected = selected
+        if selected == "None" or selected not in self.ext_names():
+            return
+        widget = self._get_ext_widget(selected)
+        # its widgets skip config changes while hidden
+        widget.cfg_init()
+        widget.setVisible(True)
@@ -1,7 +1,7 @@
-from krita import QPushButton
+from krita import QHBoxLayout, QPushButton
 
 from ..script import script
-from ..widgets import TipsLayout
+from ..widgets import QCheckBox, TipsLayout
 from .img_base import SDImgPageBase
 
 
@@ -11,21 +11,43 @@ class Img2ImgPage(SDImgPageBase):
     def __init__(self, *args, **kwargs):
         super(Img2ImgPage, self).__init__(cfg_prefix="img2img", *args, **kwargs)
 
+        self.tiled = QCheckBox(script.cfg, "img2img_tiled", "Tiled")
+        self.draft = QCheckBox(script.cfg, "img2img_draft", "Draft first")
         self.btn = QPushButton("Start img2img")
+        self.explore_btn = QPushButton("Explore")
         self.tips = TipsLayout(
-            ["Select what you want the model to perform img2img on."]
+            [
+                "Select what you want the model to perform img2img on.",
+                "Tiled renders selections larger than max_size in tiles of base_size, keeping detail.",
+                "Draft first shows a fast draft, then replaces it with the full render.",
+                "Explore renders small candidates to pick from in the Live Preview docker.",
+            ]
         )
 
-        self.layout.addLayout(self.denoising_strength_layout)
-        self.layout.addWidget(self.btn)
+        inline_layout = QHBoxLayout()
+        inline_layout.addWidget(self.tiled)
+        inline_layout.addWidget(self.draft)
+        inline_layout.addLayout(self.denoising_strength_layout)
+
+        btn_layout = QHBoxLayout()
+        btn_layout.addWidget(self.btn, 1)
+        btn_layout.addWidget(self.explore_btn)
+
+        self.layout.addLayout(inline_layout)
+        self.layout.addLayout(btn_layout)
         self.layout.addLayout(self.tips)
         self.layout.addStretch()
 
     def cfg_init(self):
         super(Img2ImgPage, self).cfg_init()
+        self.tiled.cfg_init()
+        self.draft.cfg_init()
 
         self.tips.setVisible(not script.cfg("minimize_ui", bool))
 
     def cfg_connect(self):
         super(Img2ImgPage, self).cfg_connect()
+        self.tiled.cfg_connect()
+        self.draft.cfg_connect()
         self.btn.released.connect(lambda: script.action_img2img())
+        self.explore_btn.released.connect(lambda: script.action_img2img(explore=True))
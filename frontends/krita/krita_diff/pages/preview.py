@@ -1,7 +1,19 @@
-from krita import QPixmap, QPushButton, QVBoxLayout, QWidget
+from krita import (
+    QAbstractItemView,
+    QIcon,
+    QListView,
+    QListWidget,
+    QListWidgetItem,
+    QPixmap,
+    QPushButton,
+    QSize,
+    Qt,
+    QVBoxLayout,
+    QWidget,
+)
 
+from ..defaults import EXPLORE_ICON_SIZE
 from ..script import script
-from ..utils import b64_to_img
 from ..widgets import QLabel, StatusBar
 
 
@@ -15,26 +27,58 @@ class PreviewPage(QWidget):
         self.preview = QLabel()
         self.interrupt_btn = QPushButton("Interrupt")
 
+        # candidates of explore mode
+        self.candidates = QListWidget()
+        self.candidates.setViewMode(QListView.IconMode)
+        self.candidates.setResizeMode(QListView.Adjust)
+        self.candidates.setMovement(QListView.Static)
+        self.candidates.setIconSize(QSize(EXPLORE_ICON_SIZE, EXPLORE_ICON_SIZE))
+        self.candidates.setSelectionMode(QAbstractItemView.MultiSelection)
+        self.refine_btn = QPushButton("Refine selected")
+        self.candidates.setVisible(False)
+        self.refine_btn.setVisible(False)
+
         layout = QVBoxLayout()
         layout.setContentsMargins(0, 0, 0, 0)
         layout.addWidget(self.status_bar)
         layout.addWidget(self.interrupt_btn)
         layout.addWidget(self.preview)
+        layout.addWidget(self.candidates)
+        layout.addWidget(self.refine_btn)
         layout.addStretch()
         self.setLayout(layout)
 
     def cfg_init(self):
         pass
 
-    def _update_image(self, progress):
-        try:
-            enc = progress["current_image"]
-            image = b64_to_img(enc)
-            self.preview.setPixmap(QPixmap.fromImage(image))
-        except:
-            pass
+    def showEvent(self, event):
+        super(PreviewPage, self).showEvent(event)
+        script.set_preview_enabled(True)
+
+    def hideEvent(self, event):
+        super(PreviewPage, self).hideEvent(event)
+        script.set_preview_enabled(False)
+
+    def _update_image(self, image):
+        self.preview.setPixmap(QPixmap.fromImage(image))
+
+    def _update_candidates(self, exploration):
+        self.candidates.clear()
+        for seed, image in exploration.candidates:
+            item = QListWidgetItem(QIcon(QPixmap.fromImage(image)), str(seed))
+            item.setData(Qt.UserRole, seed)
+            self.candidates.addItem(item)
+        self.candidates.setVisible(True)
+        self.refine_btn.setVisible(True)
+
+    def _refine_selected(self):
+        seeds = [item.data(Qt.UserRole) for item in self.candidates.selectedItems()]
+        self.candidates.clearSelection()
+        script.action_refine(seeds)
 
     def cfg_connect(self):
         script.status_changed.connect(lambda s: self.status_bar.set_status(s))
-        script.progress_update.connect(lambda p: self._update_image(p))
+        script.preview_update.connect(lambda img: self._update_image(img))
+        script.explore_update.connect(lambda e: self._update_candidates(e))
         self.interrupt_btn.released.connect(lambda: script.action_interrupt())
+        self.refine_btn.released.connect(lambda: self._refine_selected())
@@ -12,25 +12,37 @@ class Txt2ImgPage(SDImgPageBase):
         super(Txt2ImgPage, self).__init__(cfg_prefix="txt2img", *args, **kwargs)
 
         self.highres = QCheckBox(script.cfg, "txt2img_highres", "Highres fix")
+        self.draft = QCheckBox(script.cfg, "txt2img_draft", "Draft first")
 
         inline_layout = QHBoxLayout()
         inline_layout.addWidget(self.highres)
+        inline_layout.addWidget(self.draft)
         inline_layout.addLayout(self.denoising_strength_layout)
 
         self.tips = TipsLayout(
-            ["Set base_size & max_size higher for AUTO's txt2img highres fix to work."]
+            [
+                "Set base_size & max_size higher for AUTO's txt2img highres fix to work.",
+                "Draft first shows a fast draft, then replaces it with the full render.",
+                "Explore renders small candidates to pick from in the Live Preview docker.",
+            ]
         )
 
         self.btn = QPushButton("Start txt2img")
+        self.explore_btn = QPushButton("Explore")
+
+        btn_layout = QHBoxLayout()
+        btn_layout.addWidget(self.btn, 1)
+        btn_layout.addWidget(self.explore_btn)
 
         self.layout.addLayout(inline_layout)
-        self.layout.addWidget(self.btn)
+        self.layout.addLayout(btn_layout)
         self.layout.addLayout(self.tips)
         self.layout.addStretch()
 
     def cfg_init(self):
         super(Txt2ImgPage, self).cfg_init()
         self.highres.cfg_init()
+        self.draft.cfg_init()
 
         self.tips.setVisible(not script.cfg("minimize_ui", bool))
 
@@ -43,7 +55,9 @@ class Txt2ImgPage(SDImgPageBase):
             self.denoising_strength_layout.qspin.setVisible(enabled)
 
         self.highres.cfg_connect()
+        self.draft.cfg_connect()
         self.highres.toggled.connect(toggle_highres)
         toggle_highres(self.highres.isChecked())
 
         self.btn.released.connect(lambda: script.action_txt2img())
+        self.explore_btn.released.connect(lambda: script.action_txt2img(explore=True))
@@ -1,14 +1,19 @@
 import itertools
+import json
 import os
+import random
 import time
-from typing import Union
+from typing import Any, Callable
 
 from krita import (
     Document,
     Krita,
     Node,
+    QApplication,
+    QByteArray,
     QImage,
     QObject,
+    QPainter,
     Qt,
     QTimer,
     Selection,
@@ -27,14 +32,131 @@ from .defaults import (
     STATE_WAIT,
 )
 from .utils import (
+    Deferred,
     b64_to_img,
+    ba_to_img,
     find_optimal_selection_region,
+    format_duration,
     get_desc_from_resp,
     img_to_ba,
     save_img,
 )
 
 
+def decode_img(
+    enc: str, width: int, height: int, has_selection: bool, alpha: QByteArray = None
+):
+    """Decode image & rescale it to selection, ready for `Node.setPixelData()`.
+
+    Args:
+        enc (str): Base64-encoded image.
+        width (int): Width of selection.
+        height (int): Height of selection.
+        has_selection (bool): Whether there is a selection to rescale to.
+        alpha (QByteArray, optional): Selection mask (1 byte per pixel) to multiply into the image's alpha. Defaults to None.
+
+    Returns:
+        Tuple[QByteArray, int, int]: Pixel data, width & height.
+    """
+    # QImage.Format_RGB32 (4) is default format after decoding image
+    # it has the same byte order (BGRA) as Krita's pixel data, see img_to_ba()
+    image = b64_to_img(enc)
+
+    # NOTE: Scaling is usually done by backend (although I am reconsidering this)
+    # The scaling here is for SD Upscale or Upscale on a selection region rather than whole image
+    # Image won't be scaled down ONLY if there is no selection; i.e. selecting whole image will scale down,
+    # not selecting anything won't scale down, leading to the canvas being resized afterwards
+    if has_selection and (image.width() != width or image.height() != height):
+        print(f"Rescaling image to selection: {width}x{height}")
+        image = image.scaled(width, height, transformMode=Qt.SmoothTransformation)
+
+    # mask doesn't apply if image isn't the selection (e.g. outpainting resized it)
+    if alpha is not None and image.width() == width and image.height() == height:
+        image = apply_alpha(image, alpha)
+
+    return img_to_ba(image), image.width(), image.height()
+
+
+def apply_alpha(image: QImage, alpha: QByteArray):
+    """Multiply mask into the alpha of image.
+
+    Painting does this in one (SIMD) pass, which is much faster than masking the
+    layer afterwards through Krita's actions.
+
+    Args:
+        image (QImage): Image.
+        alpha (QByteArray): Mask with 1 byte per pixel, same size as image.
+
+    Returns:
+        QImage: Masked image in Format_ARGB32.
+    """
+    width, height = image.width(), image.height()
+    data = alpha.data()  # keep reference alive while QImage uses it
+    mask = QImage(data, width, height, width, QImage.Format_Alpha8)
+    image = image.convertToFormat(QImage.Format_ARGB32)
+    painter = QPainter(image)
+    painter.setCompositionMode(QPainter.CompositionMode_DestinationIn)
+    painter.drawImage(0, 0, mask)
+    painter.end()
+    return image
+
+
+def decode_thumbnails(response):
+    """Decode candidates of explore mode in the worker thread."""
+    response["outputs"] = [b64_to_img(enc) for enc in response["outputs"]]
+    return response
+
+
+class Exploration:
+    def __init__(self, name: str, candidates: list, pick: Callable[[int], Any]):
+        """Small candidates rendered in one batch, shown in the preview docker.
+
+        Only the candidates the artist picks are rendered in full, with the same
+        seed. The selection region & images are frozen from when exploring, but
+        the full renders are inserted into the document open when picking.
+
+        Args:
+            name (str): Mode explored, e.g. "txt2img".
+            candidates (List[Tuple[int, QImage]]): Seed & thumbnail of each candidate.
+            pick (Callable[[int], Any]): Starts the full render of a seed.
+        """
+        self.name = name
+        self.candidates = candidates
+        self.pick = pick
+
+
+class DraftRefine:
+    def __init__(self, seed: int):
+        """State of a draft-then-refine generation.
+
+        A fast draft & the full render are queued together with the same seed. The
+        draft is inserted as soon as it is done, then replaced by the full render.
+        A draft done after the full render (e.g. on a slower backend) is dropped.
+
+        Args:
+            seed (int): Seed of both stages.
+        """
+        self.seed = seed
+        self.job = None
+        """Job of the full render, cancelled if the artist moves on."""
+        self.refined = False
+        self.draft_nodes = []
+        """Group or layers inserted by the draft."""
+
+    def wants(self, stage: str):
+        """Whether the output of a stage should still be inserted."""
+        return stage != "draft" or not self.refined
+
+    def inserted(self, stage: str, nodes: list):
+        if stage == "draft":
+            self.draft_nodes = nodes
+            return
+        self.refined = True
+        for node in self.draft_nodes:
+            node.remove()
+        self.draft_nodes = []
+
+
 # Does it actually have to be a QObject?
 # The only possible use I see is for event emitting
 class Script(QObject):
@@ -63,6 +185,8 @@ class Script(QObject):
     status_changed = pyqtSignal(str)
     config_updated = pyqtSignal()
     progress_update = pyqtSignal(object)
+    explore_update = pyqtSignal(object)
+    preview_update = pyqtSignal(QImage)
 
     def __init__(self):
         super(Script, self).__init__()
@@ -77,17 +201,37 @@ class Script(QObject):
         self.eta_timer.setInterval(ETA_REFRESH_INTERVAL)
         self.eta_timer.timeout.connect(lambda: self.action_update_eta())
         self.progress_update.connect(lambda p: self.update_status_bar_eta(p))
+        # progress & preview are pushed over the event stream when the backend supports it
+        self.preview_enabled = False
+        self.last_preview_id = None
+        self.last_progress = None
+        self.draft = None
+        """Latest draft-then-refine generation, see `DraftRefine`."""
+        self.exploration = None
+        """Latest candidates of explore mode, see `Exploration`."""
+        self.client.event_received.connect(lambda e, o: self.handle_event(e, o))
+        self.client.config_updated.connect(
+            lambda: self.client.open_events(self.preview_enabled)
+        )
+        QApplication.instance().aboutToQuit.connect(lambda: self.on_quit())
         # keep track of inserted layers to prevent accidental usage as inpaint mask
         self._inserted_layers = []
 
     def restore_defaults(self, if_empty=False):
         """Restore to default config."""
         self.cfg.restore_defaults(not if_empty)
-        self.ext_cfg.config.remove("")
+        self.ext_cfg.clear()
 
         if not if_empty:
             self.status_changed.emit(STATE_RESET_DEFAULT)
 
+    def on_quit(self):
+        # config writes are debounced, save any pending ones before exiting
+        self.cfg.flush()
+        self.ext_cfg.flush()
+        # abort pending requests so Krita doesn't wait on them while quitting
+        self.client.shutdown()
+
     def update_status_bar_eta(self, progress):
         # print(progress)
         # NOTE: progress & eta_relative is bugged upstream when there is multiple jobs
@@ -98,7 +242,52 @@ class Script(QObject):
         # doesnt take into account batch count
         num_jobs = len(self.client.long_reqs) - 1
 
-        self.status_changed.emit(f"Step {cur_step}/{total_steps} ({num_jobs} in queue)")
+        status = f"Step {cur_step}/{total_steps}"
+        # e.g. tiles of tiled img2img
+        if state.get("job_count", 0) > 1:
+            status += f" of part {state['job_no'] + 1}/{state['job_count']}"
+
+        # backend's predicted schedule (older backends have none), counted down
+        # from when it was received as it is only pushed when jobs change
+        age = time.monotonic() - progress.get("received", time.monotonic())
+        refs = self.client.job_refs()
+        mine = [j for j in state.get("jobs", []) if j["ref"] in refs]
+        if len(mine) > 0 and all(j["state"] == "queued" for j in mine):
+            # the steps are of someone else's job
+            start = min(j["start_in"] for j in mine) - age
+            status = f"Queued, starts in ~{format_duration(start)}"
+        ends = [j["end_in"] for j in mine]
+        if len(ends) > 0 and None not in ends:
+            status += f", done in ~{format_duration(max(ends) - age)}"
+        queue = f"{num_jobs} in queue"
+        if state.get("queue_eta", 0) - age > 0:
+            queue += f", clears in ~{format_duration(state['queue_eta'] - age)}"
+        self.status_changed.emit(f"{status} ({queue})")
+
+    def handle_event(self, event, obj):
+        """Handle event pushed by the backend."""
+        if event == "progress":
+            # only relevant while our own requests are pending
+            if self.eta_timer.isActive():
+                progress = {
+                    "state": obj,
+                    "eta_relative": obj["eta_relative"],
+                    "received": time.monotonic(),
+                }
+                self.last_progress = progress
+                self.progress_update.emit(progress)
+        elif event == "preview":
+            self.handle_preview(obj)
+
+    def handle_preview(self, preview):
+        self.last_preview_id = preview["id"]
+        image = b64_to_img(preview["image"], preview["format"].upper())
+        self.preview_update.emit(image)
+
+    def set_preview_enabled(self, enabled: bool):
+        """Whether live preview is shown & hence needs to be received."""
+        self.preview_enabled = enabled
+        self.client.post_event_control("preview", enabled=enabled)
 
     def update_selection(self):
         """Update references to key Krita objects as well as selection information."""
@@ -156,33 +345,84 @@ class Script(QObject):
             self.width = width
             self.height = height
 
-    def get_selection_image(self) -> QImage:
-        """QImage of selection"""
-        return QImage(
-            self.doc.pixelData(self.x, self.y, self.width, self.height),
-            self.width,
-            self.height,
-            QImage.Format_RGBA8888,
-        ).rgbSwapped()
-
-    def get_mask_image(self) -> Union[QImage, None]:
-        """QImage of mask layer for inpainting"""
+    def get_selection_image(self, save_path: str = None) -> Deferred:
+        """QImage of selection, converted when called (i.e. in a worker thread).
+
+        Only reading the pixel data has to be done in the main thread.
+
+        Args:
+            save_path (str, optional): Where to save the image for debugging. Defaults to None.
+        """
+        ba = self.doc.pixelData(self.x, self.y, self.width, self.height)
+        return self._deferred_img(ba, save_path)
+
+    def get_mask_image(self, save_path: str = None) -> Deferred:
+        """QImage of mask layer for inpainting, see `get_selection_image()`."""
         if self.node.type() not in {"paintlayer", "filelayer"}:
             assert False, "Please select a valid layer to use as inpaint mask!"
         elif self.node in self._inserted_layers:
             assert False, "Selected layer was generated. Copy the layer if sure you want to use it as inpaint mask."
 
-        return QImage(
-            self.node.pixelData(self.x, self.y, self.width, self.height),
-            self.width,
-            self.height,
-            QImage.Format_RGBA8888,
-        ).rgbSwapped()
+        ba = self.node.pixelData(self.x, self.y, self.width, self.height)
+        return self._deferred_img(ba, save_path)
+
+    def _deferred_img(self, ba, save_path):
+        width, height = self.width, self.height
+
+        def convert():
+            image = ba_to_img(ba, width, height)
+            if save_path:
+                save_img(image, save_path)
+            return image
+
+        return Deferred(convert)
+
+    def img_decoder(self, width, height, alpha=None, has_selection=None):
+        """Return frozen function that decodes images of a response for `img_inserter()`.
+
+        It is meant to be run in the request's worker thread so that decoding,
+        rescaling & masking many large images doesn't freeze Krita.
+
+        Args:
+            width (int): Width of selection.
+            height (int): Height of selection.
+            alpha (QByteArray, optional): See `get_selection_alpha()`. Defaults to None.
+            has_selection (bool, optional): Whether there was a selection. Defaults to whether there is one now.
+        """
+        if has_selection is None:
+            has_selection = self.selection is not None
+
+        def postprocess(response):
+            if "outputs" in response:
+                response["outputs"] = [
+                    decode_img(enc, width, height, has_selection, alpha)
+                    for enc in response["outputs"]
+                ]
+            if "output" in response:
+                response["output"] = decode_img(
+                    response["output"], width, height, has_selection, alpha
+                )
+            return response
+
+        return postprocess
 
-    def img_inserter(self, x, y, width, height, group=False):
+    def get_selection_alpha(self):
+        """Mask out extra regions due to adjust_selection() by masking pixels directly.
+
+        Returns:
+            QByteArray: Original selection over the adjusted region (1 byte per pixel), or None if not needed.
+        """
+        if self.selection is None or self.cfg("create_mask_layer", bool):
+            return None
+        return self.selection.pixelData(self.x, self.y, self.width, self.height)
+
+    def img_inserter(
+        self, x, y, width, height, group=False, alpha=None, has_selection=None
+    ):
         """Return frozen image inserter to insert images as new layer."""
         # Selection may change before callback, so freeze selection region
-        has_selection = self.selection is not None
+        if has_selection is None:
+            has_selection = self.selection is not None
         glayer = self.doc.createGroupLayer("Unnamed Group") if group else None
 
         def create_layer(name: str):
@@ -196,51 +436,34 @@ class Script(QObject):
                 parent.addChildNode(layer, None)
             return layer
 
-        def insert(layer_name, enc):
+        def insert(layer_name, output):
             nonlocal x, y, width, height, has_selection
             print(f"inserting layer {layer_name}")
-            print(f"data size: {len(enc)}")
-
-            # QImage.Format_RGB32 (4) is default format after decoding image
-            # QImage.Format_RGBA8888 (17) is format used in Krita tutorial
-            # both are compatible, & converting from 4 to 17 required a RGB swap
-            # Likewise for 5 & 18 (their RGBA counterparts)
-            image = b64_to_img(enc)
-            print(
-                f"image created: {image}, {image.width()}x{image.height()}, depth: {image.depth()}, format: {image.format()}"
-            )
-
-            # NOTE: Scaling is usually done by backend (although I am reconsidering this)
-            # The scaling here is for SD Upscale or Upscale on a selection region rather than whole image
-            # Image won't be scaled down ONLY if there is no selection; i.e. selecting whole image will scale down,
-            # not selecting anything won't scale down, leading to the canvas being resized afterwards
-            if has_selection and (image.width() != width or image.height() != height):
-                print(f"Rescaling image to selection: {width}x{height}")
-                image = image.scaled(
-                    width, height, transformMode=Qt.SmoothTransformation
-                )
+            if isinstance(output, str):
+                output = decode_img(output, width, height, has_selection, alpha)
+            ba, img_width, img_height = output
 
             # Resize (not scale!) canvas if image is larger (i.e. outpainting or Upscale was used)
-            if image.width() > self.doc.width() or image.height() > self.doc.height():
+            if img_width > self.doc.width() or img_height > self.doc.height():
                 # NOTE:
                 # - user's selection will be partially ignored if image is larger than canvas
                 # - it is complex to scale/resize the image such that image fits in the newly scaled selection
                 # - the canvas will still be resized even if the image fits after transparency masking
                 print("Image is larger than canvas! Resizing...")
                 new_width, new_height = self.doc.width(), self.doc.height()
-                if image.width() > self.doc.width():
-                    x, width, new_width = 0, image.width(), image.width()
-                if image.height() > self.doc.height():
-                    y, height, new_height = 0, image.height(), image.height()
+                if img_width > self.doc.width():
+                    x, width, new_width = 0, img_width, img_width
+                if img_height > self.doc.height():
+                    y, height, new_height = 0, img_height, img_height
                 self.doc.resizeImage(0, 0, new_width, new_height)
 
-            ba = img_to_ba(image)
             layer = create_layer(layer_name)
             # layer.setColorSpace() doesn't pernamently convert layer depth etc...
 
             # Don't fail silently for setPixelData(); fails if bit depth or number of channels mismatch
+            # document is checked to be 8-bit RGBA in update_selection()
             size = ba.size()
-            expected = layer.pixelData(x, y, width, height).size()
+            expected = width * height * 4
             assert expected == size, f"Raw data size: {size}, Expected size: {expected}"
 
             print(f"inserting at x: {x}, y: {y}, w: {width}, h: {height}")
@@ -250,112 +473,248 @@ class Script(QObject):
 
         return insert, glayer
 
-    def apply_txt2img(self):
-        # freeze selection region
-        insert, glayer = self.img_inserter(
-            self.x, self.y, self.width, self.height, not self.cfg("no_groups", bool)
-        )
-        mask_trigger = self.transparency_mask_inserter()
+    def pick_seed(self, cfg_prefix):
+        """Seed set on the page, else a random one, for stages that must share it."""
+        seed = self.cfg(f"{cfg_prefix}_seed", str).strip()
+        return int(seed) if seed != "" else random.randrange(4294967294)
+
+    def start_draft(self, cfg_prefix):
+        """Begin draft-then-refine generation if enabled for the page.
+
+        Args:
+            cfg_prefix (str): Config prefix of the page, e.g. "txt2img".
+
+        Returns:
+            DraftRefine: State of the generation, or None if drafts are disabled.
+        """
+        if not self.cfg(f"{cfg_prefix}_draft", bool):
+            return None
+        # the artist moved on, so the previous draft's refine is no longer wanted
+        prev = self.draft
+        if prev is not None and prev.job is not None and not prev.refined:
+            self.client.cancel_job(prev.job)
+        self.draft = DraftRefine(self.pick_seed(cfg_prefix))
+        return self.draft
+
+    def start_explore(self, cfg_prefix, post, start):
+        """Render small candidates in one batch to pick from, see `Exploration`.
+
+        Args:
+            cfg_prefix (str): Config prefix of the page, e.g. "txt2img".
+            post (Callable): Posts the request, given callback, postprocess, stage & seed.
+            start (Callable): Starts the full render of a stage & seed.
+        """
+        seed = self.pick_seed(cfg_prefix)
 
         def cb(response):
             if len(self.client.long_reqs) == 1:  # last request
                 self.eta_timer.stop()
             assert response is not None, "Backend Error, check terminal"
             outputs = response["outputs"]
-            glayer_name, layer_names = get_desc_from_resp(response, "txt2img")
-            layers = [
-                insert(name if name else f"txt2img {i + 1}", output)
-                for output, name, i in zip(outputs, layer_names, itertools.count())
-            ]
-            if self.cfg("hide_layers", bool):
-                for layer in layers[:-1]:
-                    layer.setVisible(False)
-            if glayer:
-                glayer.setName(glayer_name)
-            self.doc.refreshProjection()
-            mask_trigger(layers)
+            try:
+                seeds = json.loads(response["info"])["all_seeds"]
+            except:
+                # seeds are incremented by 1 for each image rendered
+                seeds = range(seed, seed + len(outputs))
+            self.exploration = Exploration(
+                cfg_prefix, list(zip(seeds, outputs)), lambda s: start("pick", s)
+            )
+            self.explore_update.emit(self.exploration)
+
+        return post(cb, decode_thumbnails, "explore", seed)
+
+    def apply_txt2img(self, explore=False):
+        # freeze selection region
+        x, y, width, height = self.x, self.y, self.width, self.height
+        has_selection = self.selection is not None
+        alpha = self.get_selection_alpha()
+        draft = None if explore else self.start_draft("txt2img")
+
+        def post(cb, postprocess, stage=None, seed=None):
+            return self.client.post_txt2img(
+                cb, width, height, has_selection, postprocess, stage, seed
+            )
+
+        def start(stage=None, seed=None):
+            group = not self.cfg("no_groups", bool)
+            insert, glayer = self.img_inserter(
+                x, y, width, height, group, alpha, has_selection
+            )
+            mask_trigger = self.transparency_mask_inserter(glayer)
+            name_prefix = "txt2img draft" if stage == "draft" else "txt2img"
+
+            def cb(response):
+                if len(self.client.long_reqs) == 1:  # last request
+                    self.eta_timer.stop()
+                assert response is not None, "Backend Error, check terminal"
+                if draft is not None and not draft.wants(stage):
+                    return
+                outputs = response["outputs"]
+                glayer_name, layer_names = get_desc_from_resp(response, name_prefix)
+                layers = [
+                    insert(name if name else f"{name_prefix} {i + 1}", output)
+                    for output, name, i in zip(outputs, layer_names, itertools.count())
+                ]
+                if self.cfg("hide_layers", bool):
+                    for layer in layers[:-1]:
+                        layer.setVisible(False)
+                if glayer:
+                    glayer.setName(glayer_name)
+                if draft is not None:
+                    draft.inserted(stage, [glayer] if glayer else layers)
+                self.doc.refreshProjection()
+                mask_trigger(layers)
+
+            postprocess = self.img_decoder(width, height, alpha, has_selection)
+            return post(cb, postprocess, stage, seed)
 
         self.eta_timer.start(ETA_REFRESH_INTERVAL)
-        self.client.post_txt2img(
-            cb, self.width, self.height, self.selection is not None
-        )
+        if explore:
+            self.start_explore("txt2img", post, start)
+        elif draft is None:
+            start()
+        else:
+            start("draft", draft.seed)
+            draft.job = start("refine", draft.seed)
 
-    def apply_img2img(self, is_inpaint):
-        insert, glayer = self.img_inserter(
-            self.x, self.y, self.width, self.height, not self.cfg("no_groups", bool)
-        )
-        mask_trigger = self.transparency_mask_inserter()
-        mask_image = self.get_mask_image()
+    def apply_img2img(self, is_inpaint, explore=False):
+        # freeze selection region
+        x, y, width, height = self.x, self.y, self.width, self.height
+        has_selection = self.selection is not None
+        # dont need transparency mask for inpaint mode
+        alpha = None if is_inpaint else self.get_selection_alpha()
+        draft = None if is_inpaint or explore else self.start_draft("img2img")
+
+        path, mask_path = None, None
+        if self.cfg("save_temp_images", bool):
+            path = os.path.join(self.cfg("sample_path", str), f"{int(time.time())}.png")
+            mask_path = os.path.join(
+                self.cfg("sample_path", str), f"{int(time.time())}_mask.png"
+            )
+        mask_image = self.get_mask_image(mask_path if is_inpaint else None)
 
-        path = os.path.join(self.cfg("sample_path", str), f"{int(time.time())}.png")
-        mask_path = os.path.join(
-            self.cfg("sample_path", str), f"{int(time.time())}_mask.png"
-        )
         if is_inpaint and mask_image is not None:
-            if self.cfg("save_temp_images", bool):
-                save_img(mask_image, mask_path)
             # auto-hide mask layer before getting selection image
             self.node.setVisible(False)
             self.doc.refreshProjection()
 
-        sel_image = self.get_selection_image()
-        if self.cfg("save_temp_images", bool):
-            save_img(sel_image, path)
+        sel_image = self.get_selection_image(path)
 
-        def cb(response):
-            if len(self.client.long_reqs) == 1:  # last request
-                self.eta_timer.stop()
-            assert response is not None, "Backend Error, check terminal"
+        def post(cb, postprocess, stage=None, seed=None):
+            if is_inpaint:
+                return self.client.post_inpaint(
+                    cb, sel_image, mask_image, has_selection, postprocess
+                )
+            return self.client.post_img2img(
+                cb,
+                sel_image,
+                mask_image,  # is unused by backend in img2img mode
+                has_selection,
+                postprocess,
+                stage,
+                seed,
+            )
 
-            outputs = response["outputs"]
-            layer_name_prefix = "inpaint" if is_inpaint else "img2img"
-            glayer_name, layer_names = get_desc_from_resp(response, layer_name_prefix)
-            layers = [
-                insert(name if name else f"{layer_name_prefix} {i + 1}", output)
-                for output, name, i in zip(outputs, layer_names, itertools.count())
-            ]
-            if self.cfg("hide_layers", bool):
-                for layer in layers[:-1]:
-                    layer.setVisible(False)
-            if glayer:
-                glayer.setName(glayer_name)
-            self.doc.refreshProjection()
-            # dont need transparency mask for inpaint mode
-            if not is_inpaint:
-                mask_trigger(layers)
+        def start(stage=None, seed=None):
+            group = not self.cfg("no_groups", bool)
+            insert, glayer = self.img_inserter(
+                x, y, width, height, group, alpha, has_selection
+            )
+            mask_trigger = self.transparency_mask_inserter(glayer)
+            name_prefix = "inpaint" if is_inpaint else "img2img"
+            if stage == "draft":
+                name_prefix += " draft"
+
+            def cb(response):
+                if len(self.client.long_reqs) == 1:  # last request
+                    self.eta_timer.stop()
+                assert response is not None, "Backend Error, check terminal"
+                if draft is not None and not draft.wants(stage):
+                    return
+
+                outputs = response["outputs"]
+                glayer_name, layer_names = get_desc_from_resp(response, name_prefix)
+                layers = [
+                    insert(name if name else f"{name_prefix} {i + 1}", output)
+                    for output, name, i in zip(outputs, layer_names, itertools.count())
+                ]
+                if self.cfg("hide_layers", bool):
+                    for layer in layers[:-1]:
+                        layer.setVisible(False)
+                if glayer:
+                    glayer.setName(glayer_name)
+                if draft is not None:
+                    draft.inserted(stage, [glayer] if glayer else layers)
+                self.doc.refreshProjection()
+                # dont need transparency mask for inpaint mode
+                if not is_inpaint:
+                    mask_trigger(layers)
+
+            postprocess = self.img_decoder(width, height, alpha, has_selection)
+            return post(cb, postprocess, stage, seed)
 
-        method = self.client.post_inpaint if is_inpaint else self.client.post_img2img
         self.eta_timer.start()
-        method(
-            cb,
-            sel_image,
-            mask_image,  # is unused by backend in img2img mode
-            self.selection is not None,
-        )
+        if explore:
+            self.start_explore("img2img", post, start)
+        elif draft is None:
+            start()
+        else:
+            start("draft", draft.seed)
+            draft.job = start("refine", draft.seed)
 
     def apply_simple_upscale(self):
         insert, _ = self.img_inserter(self.x, self.y, self.width, self.height)
-        sel_image = self.get_selection_image()
 
-        path = os.path.join(self.cfg("sample_path", str), f"{int(time.time())}.png")
+        path = None
         if self.cfg("save_temp_images", bool):
-            save_img(sel_image, path)
+            path = os.path.join(self.cfg("sample_path", str), f"{int(time.time())}.png")
+        sel_image = self.get_selection_image(path)
 
         def cb(response):
             assert response is not None, "Backend Error, check terminal"
             output = response["output"]
+            # None if cancelled
+            if output is None:
+                return
             insert(f"upscale", output)
             self.doc.refreshProjection()
 
-        self.client.post_upscale(cb, sel_image)
+        self.client.post_upscale(
+            cb, sel_image, self.img_decoder(self.width, self.height)
+        )
 
-    def transparency_mask_inserter(self):
-        """Mask out extra regions due to adjust_selection()."""
-        orig_selection = self.selection.duplicate() if self.selection else None
-        create_mask = self.cfg("create_mask_layer", bool)
+    def transparency_mask_inserter(self, glayer=None):
+        """Mask out extra regions due to adjust_selection() using a transparency mask.
+
+        Only used if `create_mask_layer` is enabled, else pixels are masked directly
+        (see `get_selection_alpha()`). The mask is added once to the group if there
+        is one, else to each layer.
+        """
+        if not self.cfg("create_mask_layer", bool):
+            return lambda layers: None
+        if not hasattr(self.doc, "createTransparencyMask"):
+            return self._transparency_mask_action_inserter()
+
+        doc = self.doc
+        selection = self.selection.duplicate() if self.selection else None
+        if selection is None:
+            selection = Selection()
+            selection.select(0, 0, doc.width(), doc.height(), 255)
+
+        def add_masks(layers: list):
+            for parent in [glayer] if glayer else layers:
+                mask = doc.createTransparencyMask("Transparency Mask")
+                mask.setSelection(selection)
+                parent.addChildNode(mask, None)
+                # collapse transparency mask by default
+                parent.setCollapsed(True)
 
+        return add_masks
+
+    def _transparency_mask_action_inserter(self):
+        """Add transparency masks through Krita's actions (Krita < 5.0)."""
+        orig_selection = self.selection.duplicate() if self.selection else None
         add_mask_action = self.app.action("add_new_transparency_mask")
-        merge_mask_action = self.app.action("flatten_layer")
 
         # This function is recursive to workaround race conditions when calling Krita's actions
         def add_mask(layers: list, cur_selection):
@@ -365,32 +724,15 @@ class Script(QObject):
             layer = layers.pop()
 
             orig_visible = layer.visible()
-            orig_name = layer.name()
-
-            def restore():
-                # assume newly flattened layer is active
-                result = self.doc.activeNode()
-                result.setVisible(orig_visible)
-                result.setName(orig_name)
-
-                add_mask(layers, cur_selection)
-
             layer.setVisible(True)
             self.doc.setActiveNode(layer)
             self.doc.setSelection(orig_selection)
             add_mask_action.trigger()
 
-            if create_mask:
-                # collapse transparency mask by default
-                layer.setCollapsed(True)
-                layer.setVisible(orig_visible)
-                QTimer.singleShot(
-                    ADD_MASK_TIMEOUT, lambda: add_mask(layers, cur_selection)
-                )
-            else:
-                # flatten transparency mask into layer
-                merge_mask_action.trigger()
-                QTimer.singleShot(ADD_MASK_TIMEOUT, lambda: restore())
+            # collapse transparency mask by default
+            layer.setCollapsed(True)
+            layer.setVisible(orig_visible)
+            QTimer.singleShot(ADD_MASK_TIMEOUT, lambda: add_mask(layers, cur_selection))
 
         def trigger_mask_adding(layers: list):
             layers = layers[::-1]  # causes final active layer to be the top one
@@ -404,21 +746,33 @@ class Script(QObject):
         return trigger_mask_adding
 
     # Actions
-    def action_txt2img(self):
+    def action_txt2img(self, explore=False):
         self.status_changed.emit(STATE_WAIT)
         self.update_selection()
         if not self.doc:
             return
         self.adjust_selection()
-        self.apply_txt2img()
+        self.apply_txt2img(explore)
 
-    def action_img2img(self):
+    def action_img2img(self, explore=False):
         self.status_changed.emit(STATE_WAIT)
         self.update_selection()
         if not self.doc:
             return
         self.adjust_selection()
-        self.apply_img2img(False)
+        self.apply_img2img(False, explore)
+
+    def action_refine(self, seeds: list):
+        """Render the picked candidates of the latest exploration in full."""
+        if self.exploration is None or len(seeds) < 1:
+            return
+        self.status_changed.emit(STATE_WAIT)
+        self.update_selection()
+        if not self.doc:
+            return
+        for seed in seeds:
+            self.exploration.pick(seed)
+        self.eta_timer.start(ETA_REFRESH_INTERVAL)
 
     def action_sd_upscale(self):
         assert False, "disabled"
@@ -444,15 +798,33 @@ class Script(QObject):
     def action_update_config(self):
         """Update certain config/state from the backend."""
         self.client.get_config()
+        self.client.probe_backends()
 
     def action_interrupt(self):
-        def cb(resp=None):
+        """Cancel this plugin's jobs only, so other users of the backend aren't affected."""
+        if self.client.cancel_jobs() > 0:
+            self.eta_timer.stop()
             self.status_changed.emit(STATE_INTERRUPT)
 
-        self.client.post_interrupt(cb)
-
     def action_update_eta(self):
-        self.client.get_progress(self.progress_update.emit)
+        # fallback to polling if the event stream isn't available
+        if self.client.events_connected:
+            # count down ETAs between events
+            if self.last_progress is not None:
+                self.progress_update.emit(self.last_progress)
+            return
+
+        def cb(obj):
+            progress = {
+                "state": obj,
+                "eta_relative": obj["eta_relative"],
+                "received": time.monotonic(),
+            }
+            self.progress_update.emit(progress)
+            if obj["preview"] is not None:
+                self.handle_preview(obj["preview"])
+
+        self.client.get_progress(cb, self.preview_enabled, self.last_preview_id)
 
 
 script = Script()
@@ -0,0 +1,106 @@
+import hashlib
+import threading
+import uuid
+from typing import Optional
+
+from krita import QImage
+
+from .utils import Deferred, img_to_b64
+
+
+def hash_tiles(img: QImage, tile_size: int):
+    """Split image into tiles row by row & hash the pixels of each.
+
+    Rows of each tile are hashed in place, so only changed tiles need to be copied
+    & encoded afterwards.
+
+    Args:
+        img (QImage): Image.
+        tile_size (int): Width & height of tiles, except those at the right & bottom edges.
+
+    Returns:
+        List[Tuple[str, Tuple[int, int, int, int]]]: Hash & x, y, width, height of each tile.
+    """
+    fmt = img.format()
+    if img.depth() != 32:
+        img = img.convertToFormat(QImage.Format_ARGB32)
+    ptr = img.constBits()
+    ptr.setsize(img.byteCount())
+    buf = memoryview(ptr)
+    stride = img.bytesPerLine()
+    width, height = img.width(), img.height()
+
+    tiles = []
+    for y in range(0, height, tile_size):
+        for x in range(0, width, tile_size):
+            w, h = min(tile_size, width - x), min(tile_size, height - y)
+            hasher = hashlib.blake2b(digest_size=16)
+            # tiles of the same pixels but different size or format decode differently
+            hasher.update(f"{w}x{h}:{int(fmt)}".encode("utf-8"))
+            for row in range(y, y + h):
+                start = row * stride + x * 4
+                hasher.update(buf[start : start + w * 4])
+            tiles.append((hasher.hexdigest(), (x, y, w, h)))
+    return tiles
+
+
+class TileSession:
+    def __init__(self):
+        """Tiles a backend should have stored for this plugin instance.
+
+        See `backend/tile_store.py`. Tiles are assumed stored once sent. If the
+        backend evicted any (or restarted), it rejects the request & `reset()`
+        makes the next request upload every tile.
+        """
+        self.id = uuid.uuid4().hex
+        self.lock = threading.Lock()
+        self.known = set()
+
+    def reset(self):
+        with self.lock:
+            self.known.clear()
+
+    def encode(self, img: QImage, tile_size: int, compression: int = 9):
+        """Encode image as tiles, with data only for tiles the backend lacks.
+
+        Returns:
+            dict: `TiledImage` on the backend.
+        """
+        tiles = []
+        for digest, (x, y, w, h) in hash_tiles(img, tile_size):
+            with self.lock:
+                send = digest not in self.known
+                self.known.add(digest)
+            data = img_to_b64(img.copy(x, y, w, h), compression) if send else None
+            tiles.append((digest, data))
+        return dict(
+            session=self.id,
+            width=img.width(),
+            height=img.height(),
+            tile_size=tile_size,
+            tiles=tiles,
+        )
+
+
+class ImageUpload:
+    def __init__(self, img: Deferred, compression: int, tile_size: int):
+        """Image to upload, encoded per backend as it may have a tile session.
+
+        Args:
+            img (Deferred): QImage, computed in the request's worker thread.
+            compression (int): PNG compression level.
+            tile_size (int): Tile size if sent as tiles.
+        """
+        self.img = img
+        self.tile_size = tile_size
+        self.compression = compression
+        # shared by backends without tile sessions, so it is only encoded once
+        self.b64 = Deferred(lambda: img_to_b64(img(), compression))
+
+    def to(self, session: Optional[TileSession]):
+        """Deferred payload for a backend, see `TileSession.encode()`."""
+        if session is None:
+            return self.b64
+        return Deferred(
+            lambda: session.encode(self.img(), self.tile_size, self.compression)
+        )
@@ -1,11 +1,14 @@
 import json
 import re
+import sys
+import threading
 from itertools import cycle
 from math import ceil
+from typing import Union
 
 from krita import Krita, QBuffer, QByteArray, QImage, QIODevice, Qt
 
-from .config import Config
+from .config import Config, ConfigSnapshot
 from .defaults import (
     TAB_CONFIG,
     TAB_IMG2IMG,
@@ -33,7 +36,9 @@ def get_ext_key(ext_type: str, ext_name: str, index: int = None):
     )
 
 
-def get_ext_args(ext_cfg: Config, ext_type: str, ext_name: str):
+def get_ext_args(
+    ext_cfg: Union[Config, ConfigSnapshot], ext_type: str, ext_name: str
+):
     """Get args for script in positional list form."""
     raw = ext_cfg(get_ext_key(ext_type, ext_name))
     meta = []
@@ -96,10 +101,13 @@ def find_optimal_selection_region(
     After grasping what @sddebz intended to do, I fixed some logical errors &
     made it clearer.
 
-    Iterating the padding is naive, but easier to understand & verify then figuring
-    out how to grow the rectangle using the fixed aspect ratio alone while accounting
-    for the canvas boundary. Also, it only grows the selection, not shrink, to
-    prevent clipping what the user selected.
+    Conceptually, every combination of x & y padding (up to a limit) is tried & the
+    first one in x-major order closest to the fixed aspect ratio wins. Rather than
+    iterating all combinations, this uses that the padded height never shrinks
+    as y padding grows (even with canvas clamping), so for each width the ratio
+    w/h only decreases with y padding & the best height can be bisected for. The
+    result is identical to trying every combination. It only grows the selection,
+    not shrink, to prevent clipping what the user selected.
 
     Args:
         base_size (int): Native/base input size of the model.
@@ -122,34 +130,68 @@ def find_optimal_selection_region(
     # w * (h/w - h/w) = h
     ypad_limit = ceil(abs(1 / fix_ratio - 1 / orig_ratio) * orig_width) * 2
 
+    def pad_y(y):
+        # account for boundary of canvas
+        # padding is on both sides i.e the selection grows while center anchored
+        y1 = max(0, orig_y - y // 2)
+        y2 = min(canvas_height, y1 + orig_height + y)
+        return y1, y2 - y1
+
+    def best_for_width(width):
+        """Closest (delta, y, height) for width; on ties, the smaller y padding."""
+        # first y padding where the ratio drops to or below fix_ratio
+        lo, hi = 1, ypad_limit + 1
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if width / pad_y(mid)[1] <= fix_ratio:
+                hi = mid
+            else:
+                lo = mid + 1
+        # delta decreases until the crossing & increases after, so the best is on
+        # either side of it; the side before it has the smaller y padding
+        candidates = [y for y in (lo - 1, lo) if 1 <= y <= ypad_limit]
+        best = None
+        for y in candidates:
+            y1, height = pad_y(y)
+            delta = abs(fix_ratio - width / height)
+            if best is None or delta < best[0]:
+                best = (delta, y1, height)
+        return best
+
     best_x = orig_x
     best_y = orig_y
     best_width = orig_width
     best_height = orig_height
     best_delta = abs(fix_ratio - orig_ratio)
-    for x in range(1, xpad_limit + 1):
-        for y in range(1, ypad_limit + 1):
-            # account for boundary of canvas
-            # padding is on both sides i.e the selection grows while center anchored
-            x1 = max(0, orig_x - x // 2)
-            x2 = min(canvas_width, x1 + orig_width + x)
-            y1 = max(0, orig_y - y // 2)
-            y2 = min(canvas_height, y1 + orig_height + y)
-
-            new_width = x2 - x1
-            new_height = y2 - y1
-            new_ratio = new_width / new_height
-            new_delta = abs(fix_ratio - new_ratio)
-            if new_delta < best_delta:
-                best_delta = new_delta
-                best_x = x1
-                best_y = y1
-                best_width = new_width
-                best_height = new_height
+    prev_width = None
+    for x in range(1, xpad_limit + 1 if ypad_limit > 0 else 1):
+        x1 = max(0, orig_x - x // 2)
+        x2 = min(canvas_width, x1 + orig_width + x)
+        new_width = x2 - x1
+        # width only grows with x; same width means same best height
+        if new_width == prev_width:
+            continue
+        prev_width = new_width
+
+        new_delta, y1, new_height = best_for_width(new_width)
+        if new_delta < best_delta:
+            best_delta = new_delta
+            best_x = x1
+            best_y = y1
+            best_width = new_width
+            best_height = new_height
 
     return best_x, best_y, best_width, best_height
 
 
+def format_duration(seconds: float):
+    """Format seconds like "45s" or "3m 05s"."""
+    seconds = max(0, round(seconds))
+    if seconds < 60:
+        return f"{seconds}s"
+    return f"{seconds // 60}m {seconds % 60:02d}s"
+
+
 def save_img(img: QImage, path: str):
     """Expects QImage"""
     # png is lossless; setting compression to max (0) won't affect quality
@@ -160,26 +202,84 @@ def save_img(img: QImage, path: str):
         pass
 
 
+# Krita stores 8-bit RGBA layers as BGRA bytes, which is how QImage stores
+# Format_ARGB32 on little-endian machines, so no channel swapping is needed.
+# PNG on the wire is independent of channel order, so the backend is unaffected.
+NATIVE_BGRA = sys.byteorder == "little"
+
+
 def img_to_ba(img: QImage):
-    """Converts QImage to QByteArray"""
-    ptr = img.bits()
+    """Converts QImage to QByteArray of Krita's pixel data (BGRA)."""
+    if not NATIVE_BGRA:
+        img = img.convertToFormat(QImage.Format_RGBA8888).rgbSwapped()
+    elif img.format() not in {QImage.Format_ARGB32, QImage.Format_RGB32}:
+        # e.g. grayscale/palette PNGs, or premultiplied alpha
+        img = img.convertToFormat(QImage.Format_ARGB32)
+    # constBits() won't deep copy (detach) the image unlike bits()
+    ptr = img.constBits()
     ptr.setsize(img.byteCount())
-    return QByteArray(ptr.asstring())
+    # done in a worker thread; the QByteArray is then passed to Krita as-is
+    ba = QByteArray()
+    ba.resize(img.byteCount())
+    try:
+        # copy once, straight into the QByteArray's buffer
+        memoryview(ba)[:] = memoryview(ptr)
+    except (TypeError, ValueError):
+        # PyQt5 builds where QByteArray isn't a writable buffer; copies twice
+        ba = QByteArray(ptr.asstring())
+    return ba
+
 
+def png_quality(level: int):
+    """Qt's PNG "quality" that it maps back to zlib compression `level` (0-9)."""
+    return 100 - ceil(level * 91 / 9)
 
-def img_to_b64(img: QImage):
+
+def img_to_b64(img: QImage, compression: int = 9):
     """Converts QImage to base64-encoded string"""
     ba = QByteArray()
     buffer = QBuffer(ba)
     buffer.open(QIODevice.WriteOnly)
-    img.save(buffer, "PNG", 0)
+    img.save(buffer, "PNG", png_quality(compression))
     return ba.toBase64().data().decode("utf-8")
 
 
-def b64_to_img(enc: str):
+def ba_to_img(ba: QByteArray, width: int, height: int):
+    """Converts Krita's pixel data (BGRA) to QImage.
+
+    On little-endian machines, the QImage uses `ba` without copying it.
+    """
+    if not NATIVE_BGRA:
+        return QImage(ba, width, height, QImage.Format_RGBA8888).rgbSwapped()
+    return QImage(ba, width, height, QImage.Format_ARGB32)
+
+
+class Deferred:
+    def __init__(self, func):
+        """Value computed on first call, e.g. in a worker thread. Thread-safe.
+
+        Args:
+            func (Callable[[], Any]): Computes the value.
+        """
+        self.func = func
+        self.lock = threading.Lock()
+        self.done = False
+        self.value = None
+
+    def __call__(self):
+        with self.lock:
+            if not self.done:
+                self.value = self.func()
+                self.done = True
+                # release references held by func (e.g. pixel data)
+                self.func = None
+        return self.value
+
+
+def b64_to_img(enc: str, fmt: str = "PNG"):
     """Converts base64-encoded string to QImage"""
     ba = QByteArray.fromBase64(enc.encode("utf-8"))
-    return QImage.fromData(ba, "PNG")
+    return QImage.fromData(ba, fmt)
 
 
 def bytewise_xor(msg: bytes, key: bytes):
@@ -26,6 +26,7 @@ class QCheckBox(_QCheckBox):
         self.setChecked(self.cfg(self.field_cfg, bool))
 
     def cfg_connect(self):
+        self.cfg.subscribe([self.field_cfg], self.cfg_init, self)
         self.toggled.connect(partial(self.cfg.set, self.field_cfg))
 
 
@@ -73,6 +74,8 @@ class QMultiCheckBoxLayout(QVBoxLayout):
             box.setChecked(box.text() in val)
 
     def cfg_connect(self):
+        self.cfg.subscribe([self.selected_cfg], self.cfg_init, self.qlabel)
+
         def update(_):
             selected = [b.text() for b in self.qcheckboxes if b.isChecked()]
             self.cfg.set(self.selected_cfg, selected)
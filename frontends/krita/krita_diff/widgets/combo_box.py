@@ -93,6 +93,10 @@ class QComboBoxLayout(QHBoxLayout):
             self.qcombo.setEditText(self.cfg(self.selected_cfg))
 
     def cfg_connect(self):
+        keys = [self.selected_cfg]
+        if isinstance(self.options_cfg, str):
+            keys.append(self.options_cfg)
+        self.cfg.subscribe(keys, self.cfg_init, self.qcombo)
         # Possible to get invalid by backspacing after selecting option
         # but no one would do that deliberately
         self.qcombo.editTextChanged.connect(partial(self.cfg.set, self.selected_cfg))
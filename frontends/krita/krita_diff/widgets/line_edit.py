@@ -41,4 +41,5 @@ class QLineEditLayout(QHBoxLayout):
             self.qedit.setText(val)
 
     def cfg_connect(self):
+        self.cfg.subscribe([self.field_cfg], self.cfg_init, self.qedit)
         self.qedit.textChanged.connect(partial(self.cfg.set, self.field_cfg))
@@ -48,6 +48,9 @@ class QPromptLayout(QVBoxLayout):
             self.qedit_neg_prompt.setPlainText(neg_prompt)
 
     def cfg_connect(self):
+        self.cfg.subscribe(
+            [self.prompt_cfg, self.neg_prompt_cfg], self.cfg_init, self.qedit_prompt
+        )
         self.qedit_prompt.textChanged.connect(
             lambda: self.cfg.set(self.prompt_cfg, self.qedit_prompt.toPlainText())
         )
@@ -61,4 +61,5 @@ class QSpinBoxLayout(QHBoxLayout):
             self.qspin.setValue(self.cfg(self.field_cfg, self.cast))
 
     def cfg_connect(self):
+        self.cfg.subscribe([self.field_cfg], self.cfg_init, self.qspin)
         self.qspin.valueChanged.connect(partial(self.cfg.set, self.field_cfg))
@@ -0,0 +1,40 @@
+"""
+Model-affinity gateway in front of several backend instances.
+
+Usage:
+    python -m gateway --backend http://gpu1:7860 --backend http://gpu2:7860 --port 7870
+
+Point the Krita plugin's backend URL at the gateway; no plugin changes are needed.
+"""
+
+import argparse
+import logging
+
+import uvicorn
+
+from .app import LOGGER_NAME, PROBE_INTERVAL, create_app
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0].strip())
+    parser.add_argument(
+        "--backend", action="append", required=True, help="Backend URL, repeatable."
+    )
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=7870)
+    parser.add_argument(
+        "--key-file",
+        default=None,
+        help="Backend's xor_pass.txt, needed to route encrypted requests by model.",
+    )
+    parser.add_argument("--affinity-slack", type=int, default=1)
+    parser.add_argument("--probe-interval", type=float, default=PROBE_INTERVAL)
+    args = parser.parse_args()
+
+    logging.getLogger(LOGGER_NAME).setLevel(logging.INFO)
+    key = None
+    if args.key_file:
+        with open(args.key_file) as f:
+            key = f.read().strip().encode("utf-8")
+
+    app = create_app(args.backend, key, args.affinity_slack, args.probe_interval)
+    uvicorn.run(app, host=args.host, port=args.port)
@@ -0,0 +1,313 @@
+from __future__ import annotations
+
+import asyncio
+import gzip
+import json
+import logging
+import socket
+from collections import OrderedDict
+from itertools import cycle
+from typing import Dict, List, Optional
+from urllib.error import HTTPError, URLError
+from urllib.parse import urljoin
+from urllib.request import Request as URLRequest
+from urllib.request import urlopen
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, Response
+from starlette.concurrency import run_in_threadpool
+
+LOGGER_NAME = "auto-sd-paint-ext-gateway"
+ROUTE_PREFIX = "/sdapi/interpause"
+OFFICIAL_ROUTE_PREFIX = "/sdapi/v1"
+GENERATION_ROUTES = {"txt2img", "img2img", "upscale"}
+# routes that hold the connection open; not proxied so the plugin falls back to polling
+STREAMING_ROUTES = {"events"}
+
+SHORT_TIMEOUT = 10
+LONG_TIMEOUT = None  # generation may take "forever", same as the plugin
+MAX_CLIENTS = 1024  # clients whose last instance is remembered, least recent dropped
+PROBE_INTERVAL = 10
+
+# headers that shouldn't be passed through as-is
+HOP_HEADERS = {"host", "content-length", "connection", "keep-alive", "transfer-encoding"}
+
+log = logging.getLogger(LOGGER_NAME)
+
+
+def bytewise_xor(msg: bytes, key: bytes):
+    """Used for decrypting/encrypting request/response bodies."""
+    return bytes(v ^ k for v, k in zip(msg, cycle(key)))
+
+
+class Instance:
+    def __init__(self, url: str):
+        """State of a backend instance behind the gateway.
+
+        Args:
+            url (str): Base URL of the instance.
+        """
+        self.url = url
+        self.healthy = True
+        self.sd_model: Optional[str] = None
+        """Checkpoint the instance will have loaded once its queue drains."""
+        self.sd_vae: Optional[str] = None
+        """VAE the instance will have loaded once its queue drains."""
+        self.queued = 0
+        """Requests the gateway has in flight to the instance."""
+        self.served = 0
+
+    def affinity(self, sd_model: Optional[str], sd_vae: Optional[str]):
+        """How much of the requested model state is already loaded."""
+        score = 0
+        if sd_model is not None and sd_model == self.sd_model:
+            score += 2
+        if sd_vae is not None and sd_vae == self.sd_vae:
+            score += 1
+        return score
+
+    def status(self):
+        return {
+            "url": self.url,
+            "healthy": self.healthy,
+            "sd_model": self.sd_model,
+            "sd_vae": self.sd_vae,
+            "queued": self.queued,
+            "served": self.served,
+        }
+
+
+class Gateway:
+    def __init__(self, urls: List[str], key: bytes = None, affinity_slack: int = 1):
+        """Routes requests to the instance that already has the requested model loaded.
+
+        Args:
+            urls (List[str]): Base URLs of backend instances.
+            key (bytes, optional): Encryption key, needed to read encrypted requests. Defaults to None.
+            affinity_slack (int, optional): How many more queued requests an instance with
+                the requested model can have than the least queued one & still be preferred.
+                Defaults to 1.
+        """
+        assert len(urls) > 0, "Gateway needs at least one backend."
+        self.instances = [Instance(u) for u in urls]
+        self.key = key
+        self.affinity_slack = affinity_slack
+        # plugin's progress & interrupt requests go to where its last job went,
+        # keyed by its session id, or its address for clients that don't send one
+        self.client_instance: OrderedDict = OrderedDict()
+        # cancels go to where the job is, which may not be the plugin's last job;
+        # entries only live while the job is being forwarded
+        self.job_instance: Dict[str, Instance] = {}
+        self.hits = 0
+        self.misses = 0
+
+    def pick(self, sd_model=None, sd_vae=None, exclude=()):
+        """Pick instance with matching model if not too busy, else the least queued one.
+
+        Args:
+            sd_model (str, optional): Requested checkpoint. Defaults to None.
+            sd_vae (str, optional): Requested VAE. Defaults to None.
+            exclude (tuple, optional): Instances to skip. Defaults to ().
+
+        Returns:
+            Union[Instance, None]: Selected instance.
+        """
+        cands = [i for i in self.instances if i.healthy and i not in exclude]
+        if len(cands) == 0:
+            # nothing is known to be healthy; try anything not yet tried
+            cands = [i for i in self.instances if i not in exclude]
+        if len(cands) == 0:
+            return None
+        min_queued = min(i.queued for i in cands)
+        # max() keeps the first of equals, so ties go to config order
+        return max(
+            cands,
+            key=lambda i: (
+                i.affinity(sd_model, sd_vae)
+                if i.queued <= min_queued + self.affinity_slack
+                else 0,
+                -i.queued,
+            ),
+        )
+
+    def read_model(self, headers, body: bytes):
+        """Get requested checkpoint & VAE from request body if possible."""
+        try:
+            if "X-Encrypted-Body" in headers:
+                if self.key is None:
+                    return None, None
+                body = bytewise_xor(body, self.key)
+            if headers.get("Content-Encoding", None) == "gzip":
+                body = gzip.decompress(body)
+            obj = json.loads(body)
+            return obj.get("sd_model", None), obj.get("sd_vae", None)
+        except Exception:
+            return None, None
+
+    def forward(
+        self, inst: Instance, method: str, path: str, headers, body, timeout=None
+    ):
+        """Blocking request to instance. Returns status, headers & body."""
+        headers = {k: v for k, v in headers.items() if k.lower() not in HOP_HEADERS}
+        req = URLRequest(
+            urljoin(inst.url, path),
+            data=body if body else None,
+            headers=headers,
+            method=method,
+        )
+        try:
+            with urlopen(req, timeout=timeout) as res:
+                return res.status, dict(res.getheaders()), res.read()
+        except HTTPError as e:
+            return e.code, dict(e.headers.items()), e.read()
+
+    async def route(self, req: Request, path: str):
+        body = await req.body()
+        client = req.headers.get("X-Session-Id", None)
+        if client is None:
+            client = req.client.host if req.client else None
+        name = path.rsplit("/", 1)[-1]
+        is_generation = path.startswith(ROUTE_PREFIX) and name in GENERATION_ROUTES
+        is_cancel = path.startswith(f"{ROUTE_PREFIX}/cancel/")
+        job_id = name if is_cancel else req.headers.get("X-Job-Id", None)
+        if path.startswith(ROUTE_PREFIX) and name.split("?")[0] in STREAMING_ROUTES:
+            return JSONResponse({"detail": "Not supported by gateway."}, 404)
+        sd_model, sd_vae = (None, None)
+        if is_generation:
+            sd_model, sd_vae = self.read_model(req.headers, body)
+
+        tried = []
+        while True:
+            if is_generation:
+                inst = self.pick(sd_model, sd_vae, tried)
+            elif is_cancel:
+                inst = self.job_instance.get(job_id, None)
+                # finished or never went through the gateway
+                if inst is None or inst in tried:
+                    return JSONResponse({"state": "unknown"})
+            else:
+                # progress/interrupt/etc go to where the plugin's last job went
+                inst = self.client_instance.get(client, None)
+                if inst is None or inst in tried or not inst.healthy:
+                    inst = self.pick(exclude=tried)
+            if inst is None:
+                return JSONResponse({"detail": "No backend available."}, 503)
+            tried.append(inst)
+
+            if is_generation:
+                if sd_model is not None:
+                    if inst.sd_model == sd_model:
+                        self.hits += 1
+                    else:
+                        self.misses += 1
+                    inst.sd_model = sd_model
+                if sd_vae is not None:
+                    inst.sd_vae = sd_vae
+                self.client_instance[client] = inst
+                self.client_instance.move_to_end(client)
+                while len(self.client_instance) > MAX_CLIENTS:
+                    self.client_instance.popitem(last=False)
+                if job_id is not None:
+                    self.job_instance[job_id] = inst
+                inst.queued += 1
+            try:
+                status, headers, content = await run_in_threadpool(
+                    self.forward,
+                    inst,
+                    req.method,
+                    path,
+                    req.headers,
+                    body,
+                    LONG_TIMEOUT if is_generation else SHORT_TIMEOUT,
+                )
+            except (URLError, ConnectionError, TimeoutError, socket.timeout) as e:
+                log.warning(f"{inst.url} unreachable: {e}")
+                inst.healthy = False
+                continue
+            finally:
+                if is_generation:
+                    inst.queued -= 1
+                    if job_id is not None:
+                        self.job_instance.pop(job_id, None)
+
+            inst.healthy = True
+            if is_generation:
+                inst.served += 1
+            headers = {k: v for k, v in headers.items() if k.lower() not in HOP_HEADERS}
+            return Response(content, status, headers)
+
+    def probe(self, inst: Instance):
+        """Blocking check of instance health & currently loaded model."""
+        try:
+            with urlopen(
+                urljoin(inst.url, f"{OFFICIAL_ROUTE_PREFIX}/options"),
+                timeout=SHORT_TIMEOUT,
+            ) as res:
+                opts = json.loads(res.read())
+            inst.healthy = True
+            # only trust the instance's own state when the gateway isn't queueing to it
+            if inst.queued == 0:
+                inst.sd_model = opts.get("sd_model_checkpoint", inst.sd_model)
+                inst.sd_vae = opts.get("sd_vae", inst.sd_vae)
+        except Exception:
+            inst.healthy = False
+
+    def status(self):
+        total = self.hits + self.misses
+        return {
+            "instances": [i.status() for i in self.instances],
+            "affinity_hits": self.hits,
+            "affinity_misses": self.misses,
+            "affinity_hit_rate": self.hits / total if total else None,
+        }
+
+
+def create_app(
+    urls: List[str],
+    key: bytes = None,
+    affinity_slack: int = 1,
+    probe_interval: float = PROBE_INTERVAL,
+):
+    """Create gateway app. It speaks the same API as a single backend.
+
+    Can be run standalone (see `python -m gateway --help`) or mounted into
+    another FastAPI app.
+
+    Args:
+        urls (List[str]): Base URLs of backend instances.
+        key (bytes, optional): Encryption key, needed to read encrypted requests. Defaults to None.
+        affinity_slack (int, optional): See `Gateway`. Defaults to 1.
+        probe_interval (float, optional): Seconds between health/model probes, 0 disables. Defaults to PROBE_INTERVAL.
+
+    Returns:
+        FastAPI: App.
+    """
+    app = FastAPI(title="auto-sd-paint-ext gateway")
+    gateway = Gateway(urls, key, affinity_slack)
+    app.state.gateway = gateway
+
+    async def probe_loop():
+        while True:
+            await asyncio.gather(
+                *(run_in_threadpool(gateway.probe, i) for i in gateway.instances)
+            )
+            await asyncio.sleep(probe_interval)
+
+    @app.on_event("startup")
+    async def start_probing():
+        if probe_interval > 0:
+            app.state.probe_task = asyncio.create_task(probe_loop())
+
+    @app.get("/gateway/status")
+    async def get_status():
+        """Instances, what they have loaded and model affinity hit rate."""
+        return gateway.status()
+
+    @app.api_route("/{path:path}", methods=["GET", "POST"])
+    async def proxy(req: Request, path: str):
+        path = "/" + path
+        if req.url.query:
+            path += "?" + req.url.query
+        return await gateway.route(req, path)
+
+    return app
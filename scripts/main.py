@@ -3,9 +3,10 @@ from pathlib import Path
 
 import backend
 import gradio as gr
-from backend.app import app_encryption_middleware
+from backend import cond_cache, tile_store, warm_pool
+from backend.app import app_decompression_middleware, app_encryption_middleware
 from backend.config import LOGGER_NAME, ROUTE_PREFIX, SCRIPT_ID, SCRIPT_NAME
-from backend.utils import get_encrypt_key
+from backend.utils import get_encrypt_key, load_config
 from fastapi import FastAPI
 from modules import script_callbacks, scripts, shared
 
@@ -40,9 +41,15 @@ def on_app_started(demo: gr.Blocks, app: FastAPI):
 
     if shared.cmd_opts.api:
         app.include_router(backend.router, prefix=ROUTE_PREFIX, tags=[SCRIPT_NAME])
+        # middleware added last runs first; requests are decrypted then decompressed
+        app.middleware("http")(app_decompression_middleware)
         app.middleware("http")(app_encryption_middleware)
         # on first run, this creates a key file
         get_encrypt_key()
+        cfg = load_config()
+        warm_pool.start(cfg.warm_pool)
+        cond_cache.start(cfg.cond_cache)
+        tile_store.configure(cfg.tile_sync)
         if not shared.cmd_opts.listen:
             logger.info(
                 "Add --listen to COMMANDLINE_ARGS to enable usage as a remote backend."
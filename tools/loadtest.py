@@ -0,0 +1,355 @@
+"""
+Load generator that simulates a studio of Krita users sharing one backend.
+
+Each simulated artist replays the plugin's traffic pattern:
+- `/config` poll every `REFRESH_INTERVAL` (3 s)
+- `/sdapi/v1/progress` poll every `ETA_REFRESH_INTERVAL` (250 ms) while a job is pending
+- a mix of txt2img/img2img/inpaint/upscale posts with realistic payload sizes,
+  separated by exponentially distributed "think time"
+
+Requests are made the same way the plugin makes them (a new `urlopen` per request,
+optional XOR encryption). At the end, throughput, tail latency, error rate and the
+share of server time spent on polling versus generation are reported.
+
+Usage:
+    python tools/loadtest.py --stub --clients 20 --duration 60
+    python tools/loadtest.py --url http://127.0.0.1:7860 --clients 10 --key "$(cat xor_pass.txt)"
+"""
+
+import argparse
+import json
+import random
+import sys
+import threading
+import time
+import uuid
+from itertools import cycle
+from pathlib import Path
+from urllib.error import HTTPError
+from urllib.parse import urljoin
+from urllib.request import Request, urlopen
+
+sys.path.insert(0, str(Path(__file__).parent))
+from stub_webui import (  # noqa: E402
+    CATEGORY_GENERATE,
+    CATEGORY_POLL,
+    fake_mask_b64,
+    fake_png_b64,
+)
+from stub_webui import serve as serve_stub  # noqa: E402
+
+ROUTE_PREFIX = "/sdapi/interpause/"
+OFFICIAL_ROUTE_PREFIX = "/sdapi/v1/"
+
+# same as the plugin's defaults.py
+REFRESH_INTERVAL = 3.0
+ETA_REFRESH_INTERVAL = 0.25
+SHORT_TIMEOUT = 10
+
+# relative frequency of each job type
+DEFAULT_MIX = {"txt2img": 4, "img2img": 3, "inpaint": 2, "upscale": 1}
+# typical selection sizes
+SELECTION_SIZES = [(512, 512), (768, 512), (768, 768), (1024, 1024), (1536, 1024)]
+
+
+def bytewise_xor(msg: bytes, key: bytes):
+    """Used for decrypting/encrypting request/response bodies."""
+    return bytes(v ^ k for v, k in zip(msg, cycle(key)))
+
+
+def percentile(vals: list, p: float):
+    """Nearest-rank percentile of a list of numbers."""
+    if not vals:
+        return float("nan")
+    vals = sorted(vals)
+    ind = min(len(vals) - 1, max(0, int(round(p / 100 * len(vals) + 0.5)) - 1))
+    return vals[ind]
+
+
+def make_payload(kind: str, rng: random.Random, steps: int):
+    """Build a request body similar to what `Client.post_*` sends.
+
+    Args:
+        kind (str): One of "txt2img", "img2img", "inpaint" or "upscale".
+        rng (Random): Random generator.
+        steps (int): Number of sampling steps.
+
+    Returns:
+        Tuple[str, dict]: Route and body.
+    """
+    width, height = rng.choice(SELECTION_SIZES)
+    common = dict(
+        prompt="a painting of a dog, highly detailed, trending on artstation",
+        negative_prompt="blurry, lowres",
+        sampler_name="Euler a",
+        steps=steps,
+        cfg_scale=7.0,
+        seed=-1,
+        batch_count=1,
+        batch_size=rng.choice([1, 1, 1, 2, 4]),
+        base_size=512,
+        max_size=768,
+        orig_width=width,
+        orig_height=height,
+    )
+    if kind == "txt2img":
+        return "txt2img", common
+    if kind == "img2img":
+        return "img2img", dict(
+            common, is_inpaint=False, src_img=fake_png_b64(width, height, 4)
+        )
+    if kind == "inpaint":
+        # selection is RGBA, masks are mostly flat so they compress well
+        return "img2img", dict(
+            common,
+            is_inpaint=True,
+            src_img=fake_png_b64(width, height, 4),
+            mask_img=fake_mask_b64(width, height),
+        )
+    return "upscale", dict(
+        src_img=fake_png_b64(width, height, 4),
+        upscaler_name="Lanczos",
+        orig_width=width,
+        orig_height=height,
+    )
+
+
+class Recorder:
+    def __init__(self):
+        """Thread-safe collection of request measurements."""
+        self.lock = threading.Lock()
+        self.samples = []
+
+    def add(self, **sample):
+        with self.lock:
+            self.samples.append(sample)
+
+
+class Artist(threading.Thread):
+    def __init__(
+        self,
+        ind: int,
+        base_url: str,
+        recorder: Recorder,
+        deadline: float,
+        mix: dict,
+        think_time: float,
+        steps: int,
+        key: bytes = None,
+    ):
+        """Simulated plugin instance.
+
+        Args:
+            ind (int): Artist number, used to seed its random generator.
+            base_url (str): Backend URL.
+            recorder (Recorder): Where to record measurements.
+            deadline (float): `time.time()` at which to stop starting jobs.
+            mix (dict): Relative frequency of each job type.
+            think_time (float): Mean seconds between a job finishing and the next.
+            steps (int): Sampling steps per job.
+            key (bytes, optional): XOR encryption key. Defaults to None.
+        """
+        super(Artist, self).__init__(daemon=True)
+        self.base_url = base_url
+        self.recorder = recorder
+        self.deadline = deadline
+        self.kinds = list(mix.keys())
+        self.weights = list(mix.values())
+        self.think_time = think_time
+        self.steps = steps
+        self.key = key
+        self.rng = random.Random(ind)
+        self.job_pending = threading.Event()
+        # like the plugin, so a gateway tells artists on this machine apart
+        self.session_id = uuid.uuid4().hex
+
+    def request(self, url: str, route: str, category: str, data: dict = None, timeout=None):
+        body = None if data is None else json.dumps(data).encode("utf-8")
+        headers = {"X-Session-Id": self.session_id}
+        if body is not None:
+            headers["Content-Type"] = "application/json"
+        if self.key is not None:
+            headers["X-Encrypted-Body"] = "XOR"
+            if body is not None:
+                body = bytewise_xor(body, self.key)
+
+        req = Request(urljoin(url, route), body, headers)
+        start = time.perf_counter()
+        ok, down, err = True, 0, None
+        try:
+            with urlopen(req, timeout=timeout) as res:
+                raw = res.read()
+                down = len(raw)
+                if res.getheader("X-Encrypted-Body", None) == "XOR":
+                    raw = bytewise_xor(raw, self.key)
+                json.loads(raw)
+        except HTTPError as e:
+            ok, err = False, f"HTTP {e.code}"
+        except Exception as e:
+            ok, err = False, type(e).__name__
+        self.recorder.add(
+            route=route,
+            category=category,
+            start=start,
+            latency=time.perf_counter() - start,
+            ok=ok,
+            error=err,
+            up=0 if body is None else len(body),
+            down=down,
+        )
+        return ok
+
+    def poll_config(self):
+        url = urljoin(self.base_url, ROUTE_PREFIX)
+        # plugin instances aren't started in lockstep
+        time.sleep(self.rng.uniform(0, REFRESH_INTERVAL))
+        while time.time() < self.deadline:
+            start = time.time()
+            self.request(url, "config", CATEGORY_POLL, timeout=SHORT_TIMEOUT)
+            self.sleep(REFRESH_INTERVAL - (time.time() - start))
+
+    def sleep(self, secs: float):
+        """Sleep, but not past the deadline, so the run ends on time."""
+        time.sleep(max(0, min(secs, self.deadline - time.time())))
+
+    def poll_progress(self):
+        url = urljoin(self.base_url, OFFICIAL_ROUTE_PREFIX)
+        while self.job_pending.is_set():
+            start = time.time()
+            self.request(url, "progress", CATEGORY_POLL, timeout=SHORT_TIMEOUT)
+            time.sleep(max(0, ETA_REFRESH_INTERVAL - (time.time() - start)))
+
+    def run(self):
+        threading.Thread(target=self.poll_config, daemon=True).start()
+        url = urljoin(self.base_url, ROUTE_PREFIX)
+        while True:
+            self.sleep(self.rng.expovariate(1 / self.think_time))
+            if time.time() >= self.deadline:
+                break
+            kind = self.rng.choices(self.kinds, self.weights)[0]
+            route, payload = make_payload(kind, self.rng, self.steps)
+
+            self.job_pending.set()
+            poller = threading.Thread(target=self.poll_progress, daemon=True)
+            poller.start()
+            try:
+                self.request(url, route, CATEGORY_GENERATE, payload)
+            finally:
+                self.job_pending.clear()
+                poller.join()
+
+
+def get_stub_stats(base_url: str):
+    """Get server-side busy time if the backend is the stub WebUI."""
+    try:
+        with urlopen(urljoin(base_url, "/stub/stats"), timeout=SHORT_TIMEOUT) as res:
+            return json.loads(res.read())
+    except Exception:
+        return None
+
+
+def report(samples: list, elapsed: float, duration: float, before: dict, after: dict):
+    """Print summary of the load test.
+
+    Rates are over `elapsed`, which includes finishing jobs still in flight at the
+    end of `duration`, as the requests counted were served during all of it.
+    """
+    print(
+        f"\nDuration: {elapsed:.1f}s ({duration:.1f}s starting jobs, "
+        f"{max(0, elapsed - duration):.1f}s finishing them), requests: {len(samples)}"
+    )
+    header = f"{'route':<10}{'count':>7}{'req/s':>8}{'err%':>7}{'p50':>8}{'p95':>8}{'p99':>8}{'max':>8}{'MB up':>8}{'MB down':>9}"
+    print(header)
+    print("-" * len(header))
+    for route in sorted({s["route"] for s in samples}):
+        group = [s for s in samples if s["route"] == route]
+        lat = [s["latency"] for s in group if s["ok"]]
+        errors = sum(not s["ok"] for s in group)
+        print(
+            f"{route:<10}{len(group):>7}{len(group) / elapsed:>8.2f}"
+            f"{100 * errors / len(group):>7.1f}"
+            f"{percentile(lat, 50):>8.3f}{percentile(lat, 95):>8.3f}"
+            f"{percentile(lat, 99):>8.3f}{max(lat, default=float('nan')):>8.3f}"
+            f"{sum(s['up'] for s in group) / 1e6:>8.2f}"
+            f"{sum(s['down'] for s in group) / 1e6:>9.2f}"
+        )
+
+    errors = {}
+    for s in samples:
+        if not s["ok"]:
+            errors[s["error"]] = errors.get(s["error"], 0) + 1
+    if errors:
+        print(f"\nErrors: {errors}")
+
+    jobs = [s for s in samples if s["category"] == CATEGORY_GENERATE and s["ok"]]
+    print(f"\nCompleted jobs: {len(jobs)} ({60 * len(jobs) / elapsed:.1f}/min)")
+
+    # client-observed time is an upper bound on server time (includes queueing/network)
+    print("\nShare of client-observed request time:")
+    total = sum(s["latency"] for s in samples) or 1
+    for cat in (CATEGORY_POLL, CATEGORY_GENERATE):
+        t = sum(s["latency"] for s in samples if s["category"] == cat)
+        print(f"  {cat:<10}{100 * t / total:>6.1f}%")
+
+    if before is not None and after is not None:
+        print("\nShare of server handler time (stub WebUI):")
+        busy = {
+            k: v - before["busy_time"].get(k, 0.0)
+            for k, v in after["busy_time"].items()
+        }
+        total = sum(busy.values()) or 1
+        for cat, t in sorted(busy.items()):
+            print(f"  {cat:<10}{100 * t / total:>6.1f}%  ({t:.1f}s)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    target = parser.add_mutually_exclusive_group(required=True)
+    target.add_argument("--url", help="Base URL of a live backend.")
+    target.add_argument("--stub", action="store_true", help="Start a stub WebUI.")
+    parser.add_argument("--clients", type=int, default=10)
+    parser.add_argument("--duration", type=float, default=60.0)
+    parser.add_argument("--think-time", type=float, default=10.0)
+    parser.add_argument("--steps", type=int, default=20)
+    parser.add_argument(
+        "--mix",
+        default=",".join(f"{k}={v}" for k, v in DEFAULT_MIX.items()),
+        help="Relative job frequencies, e.g. txt2img=4,img2img=3,inpaint=2,upscale=1",
+    )
+    parser.add_argument("--key", default=None, help="Optional XOR encryption key.")
+    parser.add_argument(
+        "--stub-sec-per-step", type=float, default=0.02, help="Only with --stub."
+    )
+    args = parser.parse_args()
+
+    mix = {k: float(v) for k, v in (kv.split("=") for kv in args.mix.split(","))}
+    key = args.key.strip().encode("utf-8") if args.key else None
+
+    base_url = args.url
+    if args.stub:
+        server = serve_stub(port=0, sec_per_step=args.stub_sec_per_step, key=args.key)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        base_url = f"http://127.0.0.1:{server.server_port}"
+        print(f"Started stub WebUI at {base_url}")
+
+    print(f"Simulating {args.clients} artists for {args.duration}s against {base_url}")
+    recorder = Recorder()
+    before = get_stub_stats(base_url)
+    start = time.time()
+    deadline = start + args.duration
+    artists = [
+        Artist(i, base_url, recorder, deadline, mix, args.think_time, args.steps, key)
+        for i in range(args.clients)
+    ]
+    for a in artists:
+        a.start()
+    for a in artists:
+        a.join()
+    elapsed = time.time() - start
+    after = get_stub_stats(base_url)
+
+    report(recorder.samples, elapsed, args.duration, before, after)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,168 @@
+"""
+Equivalence check & benchmark of the plugin's `find_optimal_selection_region()`
+against the nested-loop implementation it replaced.
+
+The current implementation is loaded from `frontends/krita/krita_diff/utils.py`
+without importing the plugin (which needs Krita), so only the standard library
+is used. Random canvases, selections & model sizes are compared first, including
+small canvases where the padding is clamped heavily; any difference is printed &
+makes the script exit with status 1. Then both are timed on large selections.
+
+Usage:
+    python tools/selection_region_check.py --cases 3000 --seed 0
+"""
+
+import argparse
+import ast
+import random
+import sys
+import time
+from math import ceil
+from pathlib import Path
+
+UTILS_PATH = (
+    Path(__file__).parent.parent / "frontends" / "krita" / "krita_diff" / "utils.py"
+)
+FUNCTIONS = {"find_fixed_aspect_ratio", "find_optimal_selection_region"}
+
+# (base_size, max_size, x, y, width, height, canvas_width, canvas_height)
+BENCH_CASES = [
+    (512, 768, 1000, 1450, 4000, 100, 6000, 3000),
+    (512, 768, 0, 1400, 3000, 200, 3000, 3000),
+    (512, 768, 650, 850, 700, 300, 2000, 2000),
+]
+
+
+def load_current():
+    """Get current `find_optimal_selection_region()` without importing the plugin."""
+    tree = ast.parse(UTILS_PATH.read_text(encoding="utf-8"))
+    tree.body = [
+        n for n in tree.body if isinstance(n, ast.FunctionDef) and n.name in FUNCTIONS
+    ]
+    assert len(tree.body) == len(FUNCTIONS), "Functions not found in utils.py"
+    scope = {"ceil": ceil}
+    exec(compile(tree, str(UTILS_PATH), "exec"), scope)
+    return scope["find_optimal_selection_region"], scope["find_fixed_aspect_ratio"]
+
+
+def make_old(find_fixed_aspect_ratio):
+    """Nested-loop implementation, as it was before bisecting for the height."""
+
+    def find_optimal_selection_region(
+        base_size: int,
+        max_size: int,
+        orig_x: int,
+        orig_y: int,
+        orig_width: int,
+        orig_height: int,
+        canvas_width: int,
+        canvas_height: int,
+    ):
+        orig_ratio = orig_width / orig_height
+        fix_ratio = find_fixed_aspect_ratio(
+            base_size, max_size, orig_width, orig_height
+        )
+
+        # h * (w/h - w/h) = w
+        xpad_limit = ceil(abs(fix_ratio - orig_ratio) * orig_height) * 2
+        # w * (h/w - h/w) = h
+        ypad_limit = ceil(abs(1 / fix_ratio - 1 / orig_ratio) * orig_width) * 2
+
+        best_x = orig_x
+        best_y = orig_y
+        best_width = orig_width
+        best_height = orig_height
+        best_delta = abs(fix_ratio - orig_ratio)
+        for x in range(1, xpad_limit + 1):
+            for y in range(1, ypad_limit + 1):
+                # account for boundary of canvas
+                # padding is on both sides i.e the selection grows while center anchored
+                x1 = max(0, orig_x - x // 2)
+                x2 = min(canvas_width, x1 + orig_width + x)
+                y1 = max(0, orig_y - y // 2)
+                y2 = min(canvas_height, y1 + orig_height + y)
+
+                new_width = x2 - x1
+                new_height = y2 - y1
+                new_ratio = new_width / new_height
+                new_delta = abs(fix_ratio - new_ratio)
+                if new_delta < best_delta:
+                    best_delta = new_delta
+                    best_x = x1
+                    best_y = y1
+                    best_width = new_width
+                    best_height = new_height
+
+        return best_x, best_y, best_width, best_height
+
+    return find_optimal_selection_region
+
+
+def random_case(rng: random.Random, max_canvas: int):
+    base_size = rng.choice([256, 512, 768])
+    max_size = base_size + rng.choice([0, 64, 256, 512])
+    canvas_width = rng.randint(1, max_canvas)
+    canvas_height = rng.randint(1, max_canvas)
+    x = rng.randint(0, canvas_width - 1)
+    y = rng.randint(0, canvas_height - 1)
+    width = rng.randint(1, canvas_width - x)
+    height = rng.randint(1, canvas_height - y)
+    return (base_size, max_size, x, y, width, height, canvas_width, canvas_height)
+
+
+def check(old, new, cases: int, seed: int, max_canvas: int):
+    """Compare both on random cases. Returns number of differences."""
+    rng = random.Random(seed)
+    diffs = 0
+    for _ in range(cases):
+        case = random_case(rng, max_canvas)
+        expected, got = old(*case), new(*case)
+        if expected != got:
+            diffs += 1
+            print(f"  {case}: old {expected}, new {got}")
+    return diffs
+
+
+def bench(func, case: tuple, repeat: int):
+    """Best time of `repeat` runs in ms."""
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func(*case)
+        best = min(best, time.perf_counter() - start)
+    return best * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0].strip())
+    parser.add_argument("--cases", type=int, default=3000)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--repeat", type=int, default=3, help="Runs per benchmark.")
+    parser.add_argument("--no-bench", action="store_true")
+    args = parser.parse_args()
+
+    new, find_fixed_aspect_ratio = load_current()
+    old = make_old(find_fixed_aspect_ratio)
+
+    # small canvases clamp the padding, large ones mostly don't
+    small = args.cases // 2
+    print(f"Comparing on {args.cases} random cases...")
+    diffs = check(old, new, small, args.seed, 250)
+    diffs += check(old, new, args.cases - small, args.seed + 1, 600)
+    print(f"{diffs} differences")
+
+    if not args.no_bench:
+        print("\nBenchmark (best of {}, old -> new):".format(args.repeat))
+        for case in BENCH_CASES:
+            _, _, _, _, w, h, cw, ch = case
+            t_old, t_new = bench(old, case, args.repeat), bench(new, case, args.repeat)
+            print(
+                f"  {w}x{h} selection on {cw}x{ch}: "
+                f"{t_old:.1f} ms -> {t_new:.1f} ms ({t_old / t_new:.0f}x)"
+            )
+
+    sys.exit(1 if diffs > 0 else 0)
+
+
+if __name__ == "__main__":
+    main()
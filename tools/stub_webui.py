@@ -0,0 +1,482 @@
+"""
+Stub of the WebUI + `/sdapi/interpause` API for exercising the plugin's traffic
+pattern without a GPU.
+
+Generation is emulated by holding a single "GPU" lock for `steps * sec_per_step`
+seconds per image, which is close enough to how the real backend serializes jobs
+via `queue_lock`. Only the standard library is used so it can run anywhere.
+
+Usage:
+    python tools/stub_webui.py --port 7861 --sec-per-step 0.02
+"""
+
+import argparse
+import gzip
+import json
+import os
+import random
+import struct
+import threading
+import time
+import zlib
+from base64 import b64encode
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from itertools import cycle
+from urllib.parse import parse_qs, urlparse
+
+ROUTE_PREFIX = "/sdapi/interpause"
+OFFICIAL_ROUTE_PREFIX = "/sdapi/v1"
+
+# Used to classify handler time in `/stub/stats`
+CATEGORY_POLL = "poll"
+CATEGORY_GENERATE = "generate"
+CATEGORY_OTHER = "other"
+
+
+def bytewise_xor(msg: bytes, key: bytes):
+    """Used for decrypting/encrypting request/response bodies."""
+    return bytes(v ^ k for v, k in zip(msg, cycle(key)))
+
+
+def png_chunk(kind: bytes, data: bytes):
+    chunk = kind + data
+    return struct.pack(">I", len(data)) + chunk + struct.pack(">I", zlib.crc32(chunk))
+
+
+def encode_png(width: int, height: int, channels: int, rows):
+    """Encode raw 8-bit rows (without filter bytes) as PNG, using only zlib."""
+    color_type = {1: 0, 3: 2, 4: 6}[channels]
+    ihdr = struct.pack(">IIBBBBB", width, height, 8, color_type, 0, 0, 0)
+    raw = b"".join(b"\x00" + row for row in rows)
+    return (
+        b"\x89PNG\r\n\x1a\n"
+        + png_chunk(b"IHDR", ihdr)
+        + png_chunk(b"IDAT", zlib.compress(raw, 6))
+        + png_chunk(b"IEND", b"")
+    )
+
+
+def fake_png_b64(width: int, height: int, channels: int = 3, noise: int = 32):
+    """Get a real PNG of given resolution, cached per size.
+
+    Pixels are a vertical gradient plus random noise, so the PNG compresses
+    about as poorly as a painting does rather than being incompressible.
+
+    Args:
+        width (int): Image width.
+        height (int): Image height.
+        channels (int, optional): 3 for RGB, 4 for RGBA. Defaults to 3.
+        noise (int, optional): Amplitude of the noise (1-256); lower compresses better. Defaults to 32.
+
+    Returns:
+        str: Base64-encoded PNG.
+    """
+    key = ("img", width, height, channels, noise)
+    blob = _blob_cache.get(key)
+    if blob is None:
+        rng = random.Random(0)
+        row_len = width * channels
+        rows = []
+        for y in range(height):
+            base = y * 192 // height
+            table = bytes((base + i % noise) & 0xFF for i in range(256))
+            rows.append(rng.randbytes(row_len).translate(table))
+        png = encode_png(width, height, channels, rows)
+        blob = _blob_cache[key] = b64encode(png).decode("utf-8")
+    return blob
+
+
+def fake_mask_b64(width: int, height: int):
+    """Get a real grayscale PNG mask of given resolution, cached per size.
+
+    Like inpaint masks, it is flat: white over the middle half, else black.
+    """
+    key = ("mask", width, height)
+    blob = _blob_cache.get(key)
+    if blob is None:
+        x1, x2 = width // 4, width - width // 4
+        inside = bytes(x1) + b"\xff" * (x2 - x1) + bytes(width - x2)
+        outside = bytes(width)
+        rows = [
+            inside if height // 4 <= y < height - height // 4 else outside
+            for y in range(height)
+        ]
+        png = encode_png(width, height, 1, rows)
+        blob = _blob_cache[key] = b64encode(png).decode("utf-8")
+    return blob
+
+
+_blob_cache = {}
+"""Maps kind & size to base64-encoded PNG."""
+
+
+class StubState:
+    def __init__(
+        self,
+        sec_per_step: float,
+        config_delay: float,
+        preview_size: int,
+        switch_time: float = 0.0,
+        sd_models: list = ("stub.ckpt [00000000]",),
+    ):
+        """Shared state of the stub server.
+
+        Args:
+            sec_per_step (float): Seconds per sampling step per image at 512x512.
+            config_delay (float): Seconds `/config` takes (YAML parsing, script inspection).
+            preview_size (int): Width & height of the live preview image.
+            switch_time (float, optional): Seconds to switch checkpoint. Defaults to 0.0.
+            sd_models (list, optional): Available checkpoints, first is loaded initially.
+        """
+        self.sec_per_step = sec_per_step
+        self.config_delay = config_delay
+        self.preview_size = preview_size
+        self.switch_time = switch_time
+        self.sd_models = list(sd_models)
+        self.sd_model = self.sd_models[0]
+        self.sd_vae = "Automatic"
+        self.switches = 0
+        self.gpu_lock = threading.Lock()
+        self.stats_lock = threading.Lock()
+        self.started = time.time()
+        self.interrupted = False
+        self.job_count = 0
+        self.sampling_step = 0
+        self.sampling_steps = 0
+        self.queued = 0
+        self.running = None
+        self.jobs = {}
+        """Maps job id to whether it was cancelled, emulating `/cancel/{job_id}`."""
+        self.tiles = set()
+        """(session, hash) of tiles uploaded, see `backend/tile_store.py`."""
+        self.busy_time = {}
+        self.counts = {}
+
+    def record(self, category: str, elapsed: float):
+        with self.stats_lock:
+            self.busy_time[category] = self.busy_time.get(category, 0.0) + elapsed
+            self.counts[category] = self.counts.get(category, 0) + 1
+
+    def generate(self, req: dict, is_upscale: bool = False, job_id: str = None):
+        """Emulate image generation by sleeping while holding the GPU lock."""
+        width = req.get("orig_width", 512)
+        height = req.get("orig_height", 512)
+        steps = req.get("steps", 20)
+        n = req.get("batch_count", 1) * req.get("batch_size", 1)
+        if is_upscale:
+            steps, n = 1, 1
+        # time scales with area relative to 512x512
+        per_step = self.sec_per_step * max(width * height / (512 * 512), 0.25)
+
+        job_id = job_id if job_id else f"stub-{time.monotonic()}"
+        with self.stats_lock:
+            self.queued += 1
+            self.jobs[job_id] = False
+        try:
+            with self.gpu_lock:
+                with self.stats_lock:
+                    self.queued -= 1
+                    # cancelled while queued
+                    if self.jobs[job_id]:
+                        return []
+                    self.running = job_id
+                self.interrupted = False
+                # emulate prepare_backend() reloading weights
+                if req.get("sd_model", self.sd_model) != self.sd_model:
+                    self.sd_model = req["sd_model"]
+                    self.switches += 1
+                    time.sleep(self.switch_time)
+                self.job_count = n
+                self.sampling_steps = steps
+                for _ in range(n):
+                    for step in range(steps):
+                        if self.interrupted:
+                            break
+                        self.sampling_step = step
+                        time.sleep(per_step)
+                self.sampling_step = self.sampling_steps = self.job_count = 0
+        finally:
+            with self.stats_lock:
+                self.jobs.pop(job_id, None)
+                if self.running == job_id:
+                    self.running = None
+        return [fake_png_b64(width, height) for _ in range(n)]
+
+    def cancel(self, job_id: str):
+        """Emulates `/sdapi/interpause/cancel/{job_id}`."""
+        with self.stats_lock:
+            if job_id not in self.jobs:
+                return {"state": "unknown"}
+            self.jobs[job_id] = True
+            if self.running != job_id:
+                return {"state": "queued"}
+            self.interrupted = True
+            return {"state": "running"}
+
+    def progress(self, skip_current_image: bool):
+        eta = self.sampling_steps * self.sec_per_step
+        return {
+            "progress": self.sampling_step / self.sampling_steps
+            if self.sampling_steps
+            else 0.0,
+            "eta_relative": eta,
+            "state": {
+                "skipped": False,
+                "interrupted": self.interrupted,
+                "job": "",
+                "job_count": self.job_count + self.queued,
+                "job_timestamp": "0",
+                "job_no": 0,
+                "sampling_step": self.sampling_step,
+                "sampling_steps": self.sampling_steps,
+            },
+            "current_image": None
+            if skip_current_image or not self.job_count
+            else fake_png_b64(self.preview_size, self.preview_size),
+            "textinfo": None,
+        }
+
+    def lite_progress(self, preview: bool, max_size: int):
+        """Emulates `/sdapi/interpause/progress`; a new preview every step."""
+        size = min(self.preview_size, max_size) if max_size > 0 else self.preview_size
+        return {
+            "sampling_step": self.sampling_step,
+            "sampling_steps": self.sampling_steps,
+            "job_no": 0,
+            "job_count": self.job_count,
+            "queue": self.queued,
+            "interrupted": self.interrupted,
+            "eta_relative": self.sampling_steps * self.sec_per_step,
+            # a smooth PNG is roughly the size of the JPEG previews the backend sends
+            "preview": {
+                "id": str(self.sampling_step),
+                "format": "png",
+                "image": fake_png_b64(size, size, noise=2),
+            }
+            if preview and self.job_count
+            else None,
+        }
+
+    def config(self):
+        time.sleep(self.config_delay)
+        return {
+            "sample_path": os.path.abspath("outputs/krita-in"),
+            "save_samples": False,
+            "upscalers": ["None", "Lanczos"],
+            "samplers": ["Euler a", "DDIM"],
+            "samplers_img2img": ["Euler a", "DDIM"],
+            "scripts_txt2img": {"None": []},
+            "scripts_img2img": {"None": []},
+            "face_restorers": ["CodeFormer"],
+            "sd_models": self.sd_models,
+            "sd_vaes": ["None", "Automatic"],
+            "encodings": ["gzip"],
+            "tile_sync": {"enabled": True},
+        }
+
+    def sync_tiles(self, req: dict):
+        """Store tiles of images sent as tiles; returns how many are missing."""
+        missing = 0
+        with self.stats_lock:
+            for key in ("src_img", "mask_img"):
+                img = req.get(key, None)
+                if not isinstance(img, dict):
+                    continue
+                for digest, data in img["tiles"]:
+                    if data is not None:
+                        self.tiles.add((img["session"], digest))
+                    elif (img["session"], digest) not in self.tiles:
+                        missing += 1
+        return missing
+
+    def health(self):
+        """Emulates `/sdapi/interpause/health`."""
+        return {
+            "version": 1,
+            "uptime": time.time() - self.started,
+            "queue": self.queued + (1 if self.job_count else 0),
+            "busy": self.job_count > 0,
+            "sd_model": self.sd_model,
+            "sd_vae": self.sd_vae,
+            "revision": f"{self.started:.0f}-{len(self.sd_models)}",
+        }
+
+    def stats(self):
+        with self.stats_lock:
+            return {
+                "uptime": time.time() - self.started,
+                "busy_time": dict(self.busy_time),
+                "counts": dict(self.counts),
+                "model_switches": self.switches,
+            }
+
+    def options(self):
+        return {"sd_model_checkpoint": self.sd_model, "sd_vae": self.sd_vae}
+
+
+def make_handler(state: StubState, key: bytes = None):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+        # headers & body are written separately; avoid delayed ACK stalls on keep-alive
+        disable_nagle_algorithm = True
+
+        def log_message(self, format, *args):
+            pass
+
+        def _read_body(self):
+            length = int(self.headers.get("Content-Length", 0))
+            body = self.rfile.read(length) if length else b""
+            if "X-Encrypted-Body" in self.headers:
+                assert key is not None, "Unable to decrypt request without key."
+                body = bytewise_xor(body, key)
+            if self.headers.get("Content-Encoding", None) == "gzip":
+                body = gzip.decompress(body)
+            return json.loads(body) if body else {}
+
+        def _send(self, obj, status=200, headers={}):
+            data = json.dumps(obj).encode("utf-8")
+            is_encrypted = "X-Encrypted-Body" in self.headers
+            if is_encrypted:
+                data = bytewise_xor(data, key)
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            if is_encrypted:
+                self.send_header("X-Encrypted-Body", "XOR")
+            for k, v in headers.items():
+                self.send_header(k, v)
+            self.end_headers()
+            self.wfile.write(data)
+
+        def _route(self):
+            url = urlparse(self.path)
+            query = parse_qs(url.query)
+            path = url.path.rstrip("/")
+            if path == f"{ROUTE_PREFIX}/config":
+                return CATEGORY_POLL, lambda: state.config()
+            if path == f"{ROUTE_PREFIX}/health":
+                return CATEGORY_POLL, lambda: state.health()
+            if path == f"{OFFICIAL_ROUTE_PREFIX}/progress":
+                skip = query.get("skip_current_image", ["false"])[0] == "true"
+                return CATEGORY_POLL, lambda: state.progress(skip)
+            if path == f"{ROUTE_PREFIX}/progress":
+                preview = query.get("preview", ["false"])[0] == "true"
+                max_size = int(query.get("max_size", ["0"])[0])
+                return CATEGORY_POLL, lambda: state.lite_progress(preview, max_size)
+            if path == f"{OFFICIAL_ROUTE_PREFIX}/interrupt":
+
+                def interrupt():
+                    state.interrupted = True
+                    return {}
+
+                return CATEGORY_OTHER, interrupt
+            if path.startswith(f"{ROUTE_PREFIX}/cancel/"):
+                job_id = path.rsplit("/", 1)[-1]
+                return CATEGORY_OTHER, lambda: state.cancel(job_id)
+            job_id = self.headers.get("X-Job-Id", None)
+            if path in {f"{ROUTE_PREFIX}/txt2img", f"{ROUTE_PREFIX}/img2img"}:
+                return CATEGORY_GENERATE, lambda: {
+                    "outputs": state.generate(self.body, job_id=job_id),
+                    "info": json.dumps({"all_seeds": []}),
+                }
+            if path == f"{ROUTE_PREFIX}/upscale":
+
+                def upscale():
+                    outputs = state.generate(self.body, True, job_id)
+                    return {"output": outputs[0] if outputs else None}
+
+                return CATEGORY_GENERATE, upscale
+            if path == f"{OFFICIAL_ROUTE_PREFIX}/options":
+                return CATEGORY_OTHER, lambda: state.options()
+            if path == "/stub/stats":
+                return CATEGORY_OTHER, lambda: state.stats()
+            return None, None
+
+        def _handle(self):
+            # always consume body so the connection can be kept alive
+            self.body = self._read_body()
+            category, func = self._route()
+            if func is None:
+                self._send({"detail": "Not Found"}, 404)
+                return
+            missing = state.sync_tiles(self.body)
+            if missing > 0:
+                headers = {"X-Missing-Tiles": str(missing)}
+                self._send({"detail": "Tiles missing"}, 409, headers)
+                return
+            start = time.perf_counter()
+            try:
+                self._send(func())
+            except Exception as e:
+                self._send({"detail": str(e)}, 500)
+            finally:
+                state.record(category, time.perf_counter() - start)
+
+        do_GET = _handle
+        do_POST = _handle
+
+    return Handler
+
+
+def serve(
+    host: str = "127.0.0.1",
+    port: int = 7861,
+    sec_per_step: float = 0.02,
+    config_delay: float = 0.005,
+    preview_size: int = 512,
+    key: str = None,
+    switch_time: float = 0.0,
+    sd_models: list = ("stub.ckpt [00000000]",),
+):
+    """Create stub server. Call `serve_forever()` on the result to start it.
+
+    Args:
+        host (str, optional): Host to bind to. Defaults to "127.0.0.1".
+        port (int, optional): Port to bind to, 0 picks a free port. Defaults to 7861.
+        sec_per_step (float, optional): Seconds per sampling step at 512x512. Defaults to 0.02.
+        config_delay (float, optional): Seconds `/config` takes. Defaults to 0.005.
+        preview_size (int, optional): Size of live preview image. Defaults to 512.
+        key (str, optional): Encryption key. Defaults to None.
+        switch_time (float, optional): Seconds to switch checkpoint. Defaults to 0.0.
+        sd_models (list, optional): Available checkpoints, first is loaded initially.
+
+    Returns:
+        ThreadingHTTPServer: Server.
+    """
+    state = StubState(sec_per_step, config_delay, preview_size, switch_time, sd_models)
+    key = key.strip().encode("utf-8") if key else None
+    server = ThreadingHTTPServer((host, port), make_handler(state, key))
+    server.daemon_threads = True
+    server.state = state
+    return server
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=7861)
+    parser.add_argument("--sec-per-step", type=float, default=0.02)
+    parser.add_argument("--config-delay", type=float, default=0.005)
+    parser.add_argument("--preview-size", type=int, default=512)
+    parser.add_argument("--key", default=None, help="Optional XOR encryption key.")
+    parser.add_argument("--switch-time", type=float, default=0.0)
+    parser.add_argument(
+        "--sd-model", action="append", default=None, help="Checkpoint, repeatable."
+    )
+    args = parser.parse_args()
+
+    server = serve(
+        args.host,
+        args.port,
+        args.sec_per_step,
+        args.config_delay,
+        args.preview_size,
+        args.key,
+        args.switch_time,
+        args.sd_model or ("stub.ckpt [00000000]",),
+    )
+    print(f"Stub WebUI listening on http://{args.host}:{server.server_port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass